@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('config.ini', '.')],
-    hiddenimports=['pystray', 'PIL', 'win32timezone', 'win32api', 'win32con'],
+    hiddenimports=['pystray', 'PIL', 'win32timezone', 'win32api', 'win32con', 'activity_common'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
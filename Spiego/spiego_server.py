@@ -3,13 +3,22 @@ spiego_server.py
 
 Spiego Activity Logger Server - System Tray Application
 Launches PHP Laravel server and provides system tray interface.
+
+`artisan serve` and `artisan schedule:work` run as supervised children:
+their output is drained into storage/logs/spiego_server.log (rotated), the
+web server counts as started once /up answers, and a child that exits is
+restarted with backoff.
 """
+import logging
 import os
 import sys
 import subprocess
 import threading
+import urllib.error
+import urllib.request
 import webbrowser
 import time
+from logging.handlers import RotatingFileHandler
 from pathlib import Path
 
 try:
@@ -19,11 +28,147 @@ except ImportError:
     print("Error: pystray and Pillow required. Install with: pip install pystray pillow")
     sys.exit(1)
 
+# Seconds to wait for the web server to answer /up
+READY_TIMEOUT = 30
+# Restart delay doubles per crash up to this; a child that ran STABLE_SECONDS starts over at 1s
+RESTART_BACKOFF_MAX = 60
+STABLE_SECONDS = 60
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 3
+
+
+def create_logger(log_dir):
+    """Rotating log for the children's output"""
+    logger = logging.getLogger('spiego_server')
+    if not logger.handlers:
+        log_dir.mkdir(parents=True, exist_ok=True)
+        handler = RotatingFileHandler(log_dir / 'spiego_server.log', maxBytes=LOG_MAX_BYTES,
+                                      backupCount=LOG_BACKUPS, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+    return logger
+
+
+class ManagedProcess:
+    """A child process kept running: output drained to the log, restarted with backoff when it exits"""
+
+    def __init__(self, name, cmd, cwd, logger, ready_url=None):
+        self.name = name
+        self.cmd = cmd
+        self.cwd = cwd
+        self.logger = logger
+        self.ready_url = ready_url
+        self.process = None
+        self.started_at = None
+        self.ready_seconds = None
+        self.restarts = 0
+        self.running = False
+        self.stopping = threading.Event()
+        self.monitor = None
+
+    def spawn(self):
+        flags = 0
+        if sys.platform == 'win32':
+            # New group so stop() can take down `artisan serve`'s php -S child with it
+            flags = subprocess.CREATE_NO_WINDOW | subprocess.CREATE_NEW_PROCESS_GROUP
+        self.process = subprocess.Popen(
+            self.cmd,
+            cwd=self.cwd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            creationflags=flags
+        )
+        self.started_at = time.monotonic()
+        self.logger.info('[%s] started pid %s: %s', self.name, self.process.pid, ' '.join(self.cmd))
+        threading.Thread(target=self.drain, args=(self.process,), name=f'{self.name}-log', daemon=True).start()
+
+    def drain(self, process):
+        """Read output as it comes so a chatty child never blocks on a full pipe"""
+        for line in iter(process.stdout.readline, b''):
+            self.logger.info('[%s] %s', self.name, line.decode('utf-8', 'replace').rstrip())
+        process.stdout.close()
+
+    def wait_ready(self, timeout=READY_TIMEOUT):
+        """Poll ready_url with backoff; seconds from spawn to first answer, or None"""
+        delay = 0.05
+        deadline = self.started_at + timeout
+        while time.monotonic() < deadline and not self.stopping.is_set():
+            if self.process.poll() is not None:
+                return None
+            try:
+                urllib.request.urlopen(self.ready_url, timeout=2).close()
+                return time.monotonic() - self.started_at
+            except urllib.error.HTTPError:
+                # Any HTTP status means requests are being served
+                return time.monotonic() - self.started_at
+            except (urllib.error.URLError, OSError):
+                pass
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+        return None
+
+    def start(self):
+        """Spawn and (with ready_url) wait until it serves; the child is then supervised"""
+        self.running = True
+        self.stopping.clear()
+        self.spawn()
+        if self.ready_url:
+            self.ready_seconds = self.wait_ready()
+            if self.ready_seconds is None:
+                self.stop()
+                return False
+            self.logger.info('[%s] ready in %.2fs', self.name, self.ready_seconds)
+        self.monitor = threading.Thread(target=self.supervise, name=f'{self.name}-supervisor', daemon=True)
+        self.monitor.start()
+        return True
+
+    def supervise(self):
+        backoff = 1
+        while self.running:
+            code = self.process.wait()
+            if not self.running:
+                return
+            if time.monotonic() - self.started_at >= STABLE_SECONDS:
+                backoff = 1
+            print(f"[{self.name}] exited with code {code}; restarting in {backoff}s", flush=True)
+            self.logger.warning('[%s] exited with code %s; restarting in %ss', self.name, code, backoff)
+            if self.stopping.wait(backoff):
+                return
+            backoff = min(backoff * 2, RESTART_BACKOFF_MAX)
+            self.restarts += 1
+            self.spawn()
+            if self.ready_url:
+                ready = self.wait_ready()
+                if ready is not None:
+                    self.logger.info('[%s] ready again in %.2fs', self.name, ready)
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self):
+        self.running = False
+        self.stopping.set()
+        process = self.process
+        if process is None or process.poll() is not None:
+            return
+        if sys.platform == 'win32':
+            subprocess.run(['taskkill', '/F', '/T', '/PID', str(process.pid)],
+                           capture_output=True, creationflags=subprocess.CREATE_NO_WINDOW)
+        else:
+            process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        self.logger.info('[%s] stopped', self.name)
+
+
 class SpiegoServer:
     def __init__(self):
-        self.php_process = None
-        self.scheduler_thread = None
-        self.scheduler_running = False
+        self.php_server = None
+        self.scheduler = None
         self.server_host = "0.0.0.0"
         self.server_port = 5000
         self.icon = None
@@ -37,6 +182,7 @@ class SpiegoServer:
         
         # Read config from .env file
         self.load_config()
+        self.logger = create_logger(self.base_path / 'storage' / 'logs')
     
     def load_config(self):
         """Load configuration from .env file"""
@@ -54,7 +200,7 @@ class SpiegoServer:
                                 pass
     
     def start_php_server(self):
-        """Start the PHP Laravel server"""
+        """Start the PHP Laravel server and wait until it answers requests"""
         try:
             # Find PHP executable
             php_exe = self.find_php()
@@ -65,7 +211,6 @@ class SpiegoServer:
             # Change to Laravel directory
             os.chdir(self.base_path)
             
-            # Start PHP server
             cmd = [
                 php_exe,
                 'artisan',
@@ -76,24 +221,14 @@ class SpiegoServer:
             
             print(f"Starting Spiego server on http://127.0.0.1:{self.server_port}")
             
-            # Start as background process
-            self.php_process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
-            )
-            
-            # Wait a moment for server to start
-            time.sleep(2)
-            
-            # Check if process is still running
-            if self.php_process.poll() is None:
-                print("✓ Spiego server started successfully")
+            self.php_server = ManagedProcess('php-server', cmd, self.base_path, self.logger,
+                                             ready_url=f'http://127.0.0.1:{self.server_port}/up')
+            if self.php_server.start():
+                print(f"✓ Spiego server ready in {self.php_server.ready_seconds:.2f}s")
                 self.running = True
                 return True
             else:
-                print("✗ Failed to start Spiego server")
+                print("✗ Failed to start Spiego server (see storage/logs/spiego_server.log)")
                 return False
                 
         except Exception as e:
@@ -113,72 +248,30 @@ class SpiegoServer:
         php = shutil.which('php')
         return php
     
-    def run_scheduler(self):
-        """Run Laravel scheduler every minute in background thread"""
+    def start_scheduler(self):
+        """Run Laravel's scheduler as one long-lived `schedule:work` process"""
         php_exe = self.find_php()
         if not php_exe:
             print("Warning: Cannot run scheduler - PHP not found", flush=True)
             return
-        
-        print("Starting Laravel scheduler thread...", flush=True)
-        
-        iteration = 0
-        while self.scheduler_running:
-            try:
-                iteration += 1
-                print(f"[Scheduler] Running iteration {iteration}...", flush=True)
-                
-                # Run artisan schedule:run
-                result = subprocess.run(
-                    [php_exe, 'artisan', 'schedule:run'],
-                    cwd=self.base_path,
-                    capture_output=True,
-                    text=True,
-                    timeout=50  # Should complete well within 60 seconds
-                )
-                
-                # Always print output for debugging
-                if result.stdout:
-                    print(f"[Scheduler] {result.stdout.strip()}", flush=True)
-                
-                if result.stderr:
-                    print(f"[Scheduler Error] {result.stderr.strip()}", flush=True)
-                    
-            except subprocess.TimeoutExpired:
-                print("[Scheduler] Warning: schedule:run timed out", flush=True)
-            except Exception as e:
-                print(f"[Scheduler] Error: {e}", flush=True)
-            
-            # Wait 60 seconds before next run
-            print(f"[Scheduler] Waiting 60 seconds until next run...", flush=True)
-            time.sleep(60)
-    
-    def start_scheduler(self):
-        """Start the scheduler thread"""
-        if not self.scheduler_running:
-            self.scheduler_running = True
-            self.scheduler_thread = threading.Thread(target=self.run_scheduler, daemon=True)
-            self.scheduler_thread.start()
-            print("✓ Scheduler thread started (checks every 60 seconds)")
+        if self.scheduler is None or not self.scheduler.running:
+            self.scheduler = ManagedProcess('scheduler', [php_exe, 'artisan', 'schedule:work'],
+                                            self.base_path, self.logger)
+            self.scheduler.start()
+            print("✓ Scheduler started (artisan schedule:work)")
     
     def stop_scheduler(self):
-        """Stop the scheduler thread"""
-        if self.scheduler_running:
-            print("Stopping scheduler thread...")
-            self.scheduler_running = False
-            if self.scheduler_thread:
-                self.scheduler_thread.join(timeout=2)
+        """Stop the scheduler process"""
+        if self.scheduler is not None and self.scheduler.running:
+            print("Stopping scheduler...")
+            self.scheduler.stop()
             print("✓ Scheduler stopped")
     
     def stop_server(self):
         """Stop the PHP server"""
-        if self.php_process:
+        if self.php_server:
             print("Stopping Spiego server...")
-            self.php_process.terminate()
-            try:
-                self.php_process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                self.php_process.kill()
+            self.php_server.stop()
             self.running = False
             print("✓ Server stopped")
         
@@ -195,8 +288,12 @@ class SpiegoServer:
         try:
             import win32api
             import win32con
-            status = "Running" if self.running else "Stopped"
+            status = "Running" if self.php_server and self.php_server.alive() else "Stopped"
             message = f"Spiego Activity Logger Server\n\nStatus: {status}\nPort: {self.server_port}"
+            if self.php_server and self.php_server.ready_seconds is not None:
+                message += f"\nStartup: {self.php_server.ready_seconds:.2f}s"
+            if self.php_server and self.php_server.restarts:
+                message += f"\nRestarts: {self.php_server.restarts}"
             win32api.MessageBox(0, message, "Spiego Server", win32con.MB_OK | win32con.MB_ICONINFORMATION)
         except ImportError:
             print(f"Status: {'Running' if self.running else 'Stopped'}")
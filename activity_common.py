@@ -0,0 +1,99 @@
+"""
+activity_common.py
+
+Event types and parsing helpers that the tray agent and the server share.
+
+The agent ships on its own (activity_logger_tray.spec / build_tray.ps1, where
+this module is listed as a hidden import), so it imports nothing else from
+the server side. domains.py and sessionizer.py take these names from here.
+"""
+from datetime import datetime, timezone
+
+# Seconds without any event from a host that ends its open session
+SESSION_TIMEOUT = 30 * 60
+
+AFK_START_TYPES = ('afk_start', 'mouse_idle')
+AFK_END_TYPES = ('afk_end', 'mouse_active')
+# Pre-aggregated record from the tray agent (see sessionizer.transitions())
+MINUTE_TYPE = 'activity_minute'
+
+
+def epoch(timestamp):
+    """ISO timestamp -> epoch seconds (naive values are taken as UTC); None if unparseable"""
+    try:
+        parsed = datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def normalize_domain(value, strip_www=True):
+    """URL or host -> lowercase host without scheme, credentials, path or port; None if empty
+
+    A leading `www.` is dropped unless strip_www is False (the block list
+    keeps hosts as entered).
+    """
+    if not value or not isinstance(value, str):
+        return None
+    host = value.strip().lower()
+    scheme = host.find('://')
+    if scheme >= 0:
+        host = host[scheme + 3:]
+    for separator in '/?#':
+        end = host.find(separator)
+        if end >= 0:
+            host = host[:end]
+    host = host.rpartition('@')[2]
+    if host.startswith('['):
+        # IPv6 literal: the port follows the closing bracket
+        return host[1:].partition(']')[0] or None
+    host = host.partition(':')[0].rstrip('.')
+    if strip_www and host.startswith('www.') and host.count('.') > 1:
+        host = host[4:]
+    return host or None
+
+
+# Schemes whose URLs name no web host
+NON_HOST_SCHEMES = frozenset({
+    'about', 'file', 'chrome', 'chrome-extension', 'chrome-search', 'chrome-untrusted', 'edge', 'brave',
+    'opera', 'vivaldi', 'devtools', 'view-source', 'data', 'blob', 'javascript', 'mailto', 'tel', 'ms-settings',
+})
+HOST_CHARACTERS = frozenset('abcdefghijklmnopqrstuvwxyz0123456789.-_:[]')
+
+
+def url_domain(url):
+    """Normalized host of a URL; None for values that name no host (about:blank, chrome://, file paths, ...)
+
+    The agent reads Chromium's address bar, which drops the scheme
+    (`facebook.com/reel/...`, `localhost:5000`), so a URL without one is
+    taken as http:// like the original dashboard did. Without a scheme a
+    dotless name only counts as a host with a port or as `localhost`: a
+    single word in the address bar is usually a search.
+    """
+    if not url or not isinstance(url, str):
+        return None
+    value = url.strip().lower()
+    if not value or value[0] in '/\\.~' or any(c.isspace() for c in value):
+        return None
+    scheme, separator, _ = value.partition('://')
+    port = False
+    if separator:
+        if scheme in NON_HOST_SCHEMES:
+            return None
+    else:
+        authority = value
+        for end in '/?#':
+            authority = authority.partition(end)[0]
+        # "about:blank", "mailto:...", "c:\\Users\\..." -- only a port may follow the colon
+        _, colon, after = authority.partition(':')
+        if colon and not after.isdigit():
+            return None
+        port = bool(colon)
+    host = normalize_domain(value)
+    if not host or not set(host) <= HOST_CHARACTERS:
+        return None
+    if not separator and '.' not in host and not port and host != 'localhost':
+        return None
+    return host
@@ -3,14 +3,19 @@ activity_logger.py
 
 Logs device metadata, foreground window (as domain/visit event), mouse moved/idle, and keypress counts.
 
-Writes newline-delimited JSON (JSONL) to an output file.
+Writes newline-delimited JSON (JSONL) to an output file through a single
+buffered writer thread, with optional rotation by size or day.
 
 Designed to run on Windows. Uses only safe logging by default (no raw keystroke contents).
 """
 import argparse
+import atexit
+import gzip
 import json
 import os
 import platform
+import queue
+import shutil
 import socket
 import sys
 import threading
@@ -74,15 +79,162 @@ def gather_device_metadata():
     return data
 
 
-def write_event(fp, event):
-    fp.write(json.dumps(event, ensure_ascii=False) + "\n")
-    fp.flush()
+class EventWriter(threading.Thread):
+    """Single writer thread for the JSONL output, fed by a queue
+
+    Watchers only enqueue events, and never wait: put() is called from the
+    pynput input hooks, so when the queue is full (the writer is stuck on a
+    slow disk) the event is dropped and counted, and an events_dropped
+    record with the count is logged once the writer catches up. Lines are
+    written in groups, flushed when flush_bytes are buffered or
+    flush_interval has passed. fsync policy: 'never', 'flush' (every group
+    flush) or 'rotate' (when a segment closes). The active file is rotated
+    by size and/or local day; closed segments are renamed to
+    <name>.<opened>.jsonl and optionally gzipped in the background.
+    """
+
+    def __init__(self, path, flush_bytes=64 * 1024, flush_interval=1.0, fsync='never',
+                 rotate_bytes=None, rotate_daily=False, compress=False, queue_size=10000):
+        super().__init__(daemon=True)
+        self.path = path
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.rotate_bytes = rotate_bytes
+        self.rotate_daily = rotate_daily
+        self.compress = compress
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.buffer = []
+        self.buffered = 0
+        # Events put() could not queue, and how many of them are logged already
+        self.dropped = 0
+        self.dropped_logged = 0
+        self.compressors = []
+        self.closed = False
+        self.fp = None
+        self.open_segment()
+
+    def open_segment(self):
+        self.fp = open(self.path, 'a', encoding='utf-8')
+        self.size = self.fp.tell()
+        self.opened = datetime.now()
+
+    def put(self, event):
+        if not self.closed:
+            try:
+                self.queue.put_nowait(event)
+            except queue.Full:
+                self.dropped += 1
+
+    def log_dropped(self):
+        dropped = self.dropped
+        if dropped > self.dropped_logged:
+            self.add_line(json.dumps({"type": "events_dropped", "timestamp": now_iso(),
+                                      "count": dropped - self.dropped_logged}) + "\n")
+            self.dropped_logged = dropped
+
+    def run(self):
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(last_flush + self.flush_interval - time.monotonic(), 0)
+            try:
+                event = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                event = False
+            if event is None:
+                break
+            if event:
+                self.add_line(json.dumps(event, ensure_ascii=False) + "\n")
+            self.log_dropped()
+            if self.buffered >= self.flush_bytes or time.monotonic() - last_flush >= self.flush_interval:
+                self.flush()
+                last_flush = time.monotonic()
+        # Drain whatever was queued before close(), then make it durable
+        while True:
+            try:
+                event = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if event:
+                self.add_line(json.dumps(event, ensure_ascii=False) + "\n")
+        self.log_dropped()
+        self.flush(sync=True)
+        self.fp.close()
+
+    def add_line(self, line):
+        size = len(line.encode('utf-8'))
+        if self.should_rotate(size):
+            self.rotate()
+        self.buffer.append(line)
+        self.buffered += size
+        self.size += size
+
+    def should_rotate(self, size):
+        if self.size == 0:
+            return False
+        if self.rotate_bytes and self.size + size > self.rotate_bytes:
+            return True
+        return self.rotate_daily and datetime.now().date() != self.opened.date()
+
+    def flush(self, sync=False):
+        if self.buffer:
+            self.fp.write(''.join(self.buffer))
+            self.buffer = []
+            self.buffered = 0
+            self.fp.flush()
+            sync = sync or self.fsync == 'flush'
+        if sync:
+            os.fsync(self.fp.fileno())
+
+    def rotate(self):
+        self.flush(sync=self.fsync in ('flush', 'rotate'))
+        self.fp.close()
+        stem, ext = os.path.splitext(self.path)
+        closed = f"{stem}.{self.opened:%Y%m%d-%H%M%S}{ext}"
+        n = 1
+        while os.path.exists(closed) or os.path.exists(closed + '.gz'):
+            closed = f"{stem}.{self.opened:%Y%m%d-%H%M%S}-{n}{ext}"
+            n += 1
+        os.replace(self.path, closed)
+        self.open_segment()
+        if self.compress:
+            t = threading.Thread(target=gzip_segment, args=(closed,))
+            t.start()
+            self.compressors = [c for c in self.compressors if c.is_alive()] + [t]
+
+    def close(self, timeout=10.0):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self.join(timeout)
+        for t in self.compressors:
+            t.join()
+
+
+def gzip_segment(path):
+    # Write to a temp name first so a crash never leaves a truncated .gz next to a deleted original
+    tmp = path + '.gz.tmp'
+    try:
+        with open(path, 'rb') as src, gzip.open(tmp, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp, path + '.gz')
+        os.remove(path)
+    except Exception as e:
+        print(f"Failed to compress {path}: {e}")
+
+
+def write_event(writer, event):
+    writer.put(event)
 
 
 class ForegroundWatcher(threading.Thread):
-    def __init__(self, fp, poll_interval=1.0):
+    def __init__(self, writer, poll_interval=1.0):
         super().__init__(daemon=True)
-        self.fp = fp
+        self.writer = writer
         self.poll = poll_interval
         self.last = None
         self.running = True
@@ -176,15 +328,15 @@ class ForegroundWatcher(threading.Thread):
                     "process_path": info.get("process_path"),
                     "url": info.get("url"),
                 }
-                write_event(self.fp, ev)
+                write_event(self.writer, ev)
                 self.last = key
             time.sleep(self.poll)
 
 
 class MouseIdleWatcher(threading.Thread):
-    def __init__(self, fp, idle_seconds=60, poll_interval=1.0):
+    def __init__(self, writer, idle_seconds=60, poll_interval=1.0):
         super().__init__(daemon=True)
-        self.fp = fp
+        self.writer = writer
         self.idle_seconds = idle_seconds
         self.poll = poll_interval
         self.last_move = time.time()
@@ -200,7 +352,7 @@ class MouseIdleWatcher(threading.Thread):
         self.last_move = time.time()
         if self.is_idle:
             self.is_idle = False
-            write_event(self.fp, {"type": "mouse_active", "timestamp": now_iso(), "x": x, "y": y})
+            write_event(self.writer, {"type": "mouse_active", "timestamp": now_iso(), "x": x, "y": y})
 
     def run(self):
         if self.listener:
@@ -209,14 +361,14 @@ class MouseIdleWatcher(threading.Thread):
             idle = time.time() - self.last_move
             if idle >= self.idle_seconds and not self.is_idle:
                 self.is_idle = True
-                write_event(self.fp, {"type": "mouse_idle", "timestamp": now_iso(), "idle_seconds": idle})
+                write_event(self.writer, {"type": "mouse_idle", "timestamp": now_iso(), "idle_seconds": idle})
             time.sleep(self.poll)
 
 
 class KeyCountWatcher(threading.Thread):
-    def __init__(self, fp, report_interval=5.0):
+    def __init__(self, writer, report_interval=5.0):
         super().__init__(daemon=True)
-        self.fp = fp
+        self.writer = writer
         self.report_interval = report_interval
         self.count = 0
         self.lock = threading.Lock()
@@ -239,7 +391,7 @@ class KeyCountWatcher(threading.Thread):
             with self.lock:
                 c = self.count
                 self.count = 0
-            write_event(self.fp, {"type": "key_count", "timestamp": now_iso(), "count": c})
+            write_event(self.writer, {"type": "key_count", "timestamp": now_iso(), "count": c})
 
 
 def check_deps():
@@ -258,6 +410,13 @@ def main():
     parser.add_argument('--out', '-o', default=None, help='Output JSONL file path')
     parser.add_argument('--idle', type=int, default=60, help='Idle threshold in seconds')
     parser.add_argument('--poll', type=float, default=1.0, help='Polling interval for foreground checks')
+    parser.add_argument('--flush-interval', type=float, default=1.0, help='Seconds between buffered flushes')
+    parser.add_argument('--flush-kb', type=int, default=64, help='Flush early once this many KB are buffered')
+    parser.add_argument('--fsync', choices=['never', 'flush', 'rotate'], default='never',
+                        help='When to fsync the output file (always done on shutdown)')
+    parser.add_argument('--rotate-mb', type=float, default=None, help='Rotate the output file at this size')
+    parser.add_argument('--rotate-daily', action='store_true', help='Rotate the output file at local midnight')
+    parser.add_argument('--gzip', action='store_true', help='Gzip closed (rotated) segments')
     args = parser.parse_args()
 
     missing = check_deps()
@@ -267,14 +426,25 @@ def main():
         sys.exit(1)
 
     out = args.out or os.path.join(os.getcwd(), f"activity_log_{int(time.time())}.jsonl")
-    fp = open(out, 'a', encoding='utf-8')
+    writer = EventWriter(
+        out,
+        flush_bytes=args.flush_kb * 1024,
+        flush_interval=args.flush_interval,
+        fsync=args.fsync,
+        rotate_bytes=int(args.rotate_mb * 1024 * 1024) if args.rotate_mb else None,
+        rotate_daily=args.rotate_daily,
+        compress=args.gzip,
+    )
+    writer.start()
+    # Final flush + fsync even if we exit without Ctrl+C
+    atexit.register(writer.close)
 
     # write metadata
-    write_event(fp, gather_device_metadata())
+    write_event(writer, gather_device_metadata())
 
-    fg = ForegroundWatcher(fp, poll_interval=args.poll)
-    mi = MouseIdleWatcher(fp, idle_seconds=args.idle, poll_interval=args.poll)
-    kc = KeyCountWatcher(fp, report_interval=5.0)
+    fg = ForegroundWatcher(writer, poll_interval=args.poll)
+    mi = MouseIdleWatcher(writer, idle_seconds=args.idle, poll_interval=args.poll)
+    kc = KeyCountWatcher(writer, report_interval=5.0)
 
     fg.start()
     mi.start()
@@ -290,7 +460,7 @@ def main():
         mi.running = False
         kc.running = False
         time.sleep(0.2)
-        fp.close()
+        writer.close()
 
 
 if __name__ == '__main__':
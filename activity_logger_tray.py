@@ -6,6 +6,16 @@ Logs device metadata, foreground window, mouse activity, and keypress counts.
 Sends events to a remote server via HTTP POST with auth key validation.
 
 Right-click the tray icon to view logging status.
+
+With `aggregate = true` in [Logging] the watchers' events are folded into one
+activity_minute record per minute (ActivityAggregator) instead of being sent
+one by one; hosts listed in `raw_hosts`, and a stable `raw_sample` fraction
+of all hosts, keep sending raw events.
+
+ForegroundWatcher reports a focus change only once the new window has held
+focus for `focus_settle_ms`, and compares titles under the per-process
+[TitleRules] (TitleRules), so unread counters and title churn in one window
+do not each become a foreground_change/screen_time pair.
 """
 import argparse
 import configparser
@@ -13,13 +23,18 @@ import json
 import os
 import platform
 import queue
+import re
 import socket
 import sys
 import threading
 import time
 import webbrowser
+import zlib
 from datetime import datetime, timezone
 
+from activity_common import (AFK_END_TYPES, AFK_START_TYPES, MINUTE_TYPE, SESSION_TIMEOUT, epoch,
+                             normalize_domain, url_domain)
+
 try:
     import requests
 except ImportError:
@@ -52,6 +67,9 @@ except ImportError:
 
 ui = None
 
+# Reported in agent_health events so regressions can be tied to a build
+AGENT_VERSION = '1.0'
+
 
 def now_iso():
     return datetime.now(timezone.utc).isoformat()
@@ -113,10 +131,12 @@ class EventQueue:
         self.send_interval = config.getint('Logging', 'send_interval', fallback=5)
         self.retry_attempts = config.getint('Logging', 'retry_attempts', fallback=3)
         self.running = True
-        self.sender_thread = threading.Thread(target=self._sender_loop, daemon=True)
-        self.sender_thread.start()
         self.events_sent = 0
+        self.batches_sent = 0
+        self.batches_failed = 0
         self.last_error = None
+        self.sender_thread = threading.Thread(target=self._sender_loop, daemon=True)
+        self.sender_thread.start()
 
     def _build_server_url(self):
         host = self.config.get('Server', 'host', fallback='127.0.0.1')
@@ -157,6 +177,7 @@ class EventQueue:
                 resp = requests.post(self.server_url, json={'events': batch}, headers=headers, timeout=10)
                 if resp.status_code == 200:
                     self.events_sent += len(batch)
+                    self.batches_sent += 1
                     self.last_error = None
                     return
                 else:
@@ -165,6 +186,7 @@ class EventQueue:
                 self.last_error = str(e)
                 time.sleep(1)
 
+        self.batches_failed += 1
         self._write_to_fallback(batch)
 
     def _write_to_fallback(self, batch):
@@ -175,19 +197,132 @@ class EventQueue:
         except Exception as e:
             self.last_error = f"Fallback write error: {e}"
 
+    def spool_bytes(self):
+        try:
+            return os.path.getsize(self.fallback_file)
+        except OSError:
+            return 0
+
     def stop(self):
         self.running = False
         self.sender_thread.join(timeout=2)
 
 
+# Leading unread/notification counters: "(3) Inbox", "[12] #general", "(99+) Feed"
+COUNTER_PREFIX = re.compile(r'^\s*[(\[]\d+\+?[)\]]\s*')
+
+
+class TitleRules:
+    """Per-process rules for when a window title change counts as a focus change
+
+    Read from the [TitleRules] config section: each option is a process name
+    (`*` for all others) with `;`-separated rules:
+
+        counter          ignore a leading counter like "(3) " or "[12] "
+        ignore           title changes never count, only switching windows does
+        regex:<pattern>  remove matches of the pattern before comparing titles
+        settle=<ms>      focus must rest on the window this long (overrides
+                         focus_settle_ms)
+
+    Without the section every process gets `counter`.
+    """
+    def __init__(self, rules=None, settle_seconds=0.0):
+        self.settle_seconds = settle_seconds
+        self.rules = {name.lower(): self.parse(name, value)
+                      for name, value in (rules if rules is not None else {'*': 'counter'}).items()}
+        self.default = self.rules.pop('*', self.parse('*', ''))
+
+    @staticmethod
+    def parse(name, value):
+        rule = {'counter': False, 'ignore': False, 'patterns': [], 'settle': None}
+        for part in value.split(';'):
+            part = part.strip()
+            if part in ('counter', 'ignore'):
+                rule[part] = True
+            elif part.startswith('regex:'):
+                try:
+                    rule['patterns'].append(re.compile(part[len('regex:'):]))
+                except re.error as e:
+                    print(f"Invalid title rule for {name}: {e}")
+            elif part.startswith('settle='):
+                try:
+                    rule['settle'] = float(part[len('settle='):]) / 1000.0
+                except ValueError:
+                    print(f"Invalid title rule for {name}: {part}")
+            elif part:
+                print(f"Unknown title rule for {name}: {part}")
+        return rule
+
+    @classmethod
+    def from_config(cls, config):
+        rules = dict(config.items('TitleRules')) if config.has_section('TitleRules') else None
+        settle_ms = config.getfloat('Logging', 'focus_settle_ms', fallback=1000)
+        return cls(rules, settle_ms / 1000.0)
+
+    def rule(self, process_name):
+        return self.rules.get((process_name or '').lower(), self.default)
+
+    def key(self, info):
+        """Focus key of a foreground window: pid and the title as compared under its process's rules"""
+        rule = self.rule(info.get("process_name"))
+        title = info.get("title")
+        if rule['ignore']:
+            title = None
+        elif title:
+            if rule['counter']:
+                title = COUNTER_PREFIX.sub('', title)
+            for pattern in rule['patterns']:
+                title = pattern.sub('', title)
+        return (info.get("pid"), title)
+
+    def settle(self, process_name):
+        settle = self.rule(process_name)['settle']
+        return self.settle_seconds if settle is None else settle
+
+
+class FocusDebouncer:
+    """Turns foreground window polls into settled focus changes
+
+    A window whose focus key (TitleRules.key) differs from the current focus
+    becomes pending; it replaces the current focus once it has held for its
+    settle time, dated back to when it was first seen so durations stay
+    whole. Windows that lose focus sooner (alt-tab passes, a title flicker
+    that reverts) are never reported and their time stays with the current
+    focus. The first window seen is taken at once.
+    """
+    def __init__(self, rules=None):
+        self.rules = rules or TitleRules()
+        # (key, info, since) of the reported focus and of a change not settled yet
+        self.current = None
+        self.pending = None
+
+    def observe(self, now, info):
+        """Feed one poll at `now` (datetime); returns the new (info, since) when focus changed, else None"""
+        key = self.rules.key(info)
+        if self.current is not None and key == self.current[0]:
+            self.pending = None
+            return None
+        if self.pending is None or self.pending[0] != key:
+            self.pending = (key, info, now)
+        since = self.pending[2]
+        if self.current is None or (now - since).total_seconds() >= self.rules.settle(info.get("process_name")):
+            self.current, self.pending = self.pending, None
+            return info, since
+        return None
+
+
 class ForegroundWatcher(threading.Thread):
-    def __init__(self, event_queue, poll_interval=1.0, hostname=None):
+    def __init__(self, event_queue, poll_interval=1.0, hostname=None, title_rules=None):
         super().__init__(daemon=True)
         self.event_queue = event_queue
         self.poll = poll_interval
-        self.last = None
+        self.debouncer = FocusDebouncer(title_rules)
         self.running = True
         self.hostname = hostname or socket.gethostname()
+        # Time spent in UI Automation URL lookups (reported by HealthReporter)
+        self.uia_seconds = 0.0
+        self.focus_start = None
+        self.focus_info = None
 
     def get_foreground_info(self):
         if not win32gui:
@@ -204,6 +339,7 @@ class ForegroundWatcher(threading.Thread):
             except Exception:
                 proc_path = None
             url = None
+            uia_start = time.perf_counter()
             try:
                 global ui
                 if ui is None:
@@ -251,78 +387,64 @@ class ForegroundWatcher(threading.Thread):
                         url = None
             except Exception:
                 url = None
+            self.uia_seconds += time.perf_counter() - uia_start
 
             return {"title": title, "process_name": proc_name, "pid": pid, "process_path": proc_path, "url": url}
         except Exception:
             return {"title": None, "process_name": None, "pid": None}
 
+    def emit_screen_time(self, end_time):
+        """screen_time for the current focus, ending at end_time (the event timestamp is the END time)"""
+        if self.focus_info and self.focus_start:
+            duration = int((end_time - self.focus_start).total_seconds())
+            if duration > 0:
+                st_ev = {
+                    "type": "screen_time",
+                    "timestamp": end_time.isoformat(),
+                    "hostname": self.hostname,
+                    "process_name": self.focus_info.get("process_name"),
+                    "pid": self.focus_info.get("pid"),
+                    "title": self.focus_info.get("title"),
+                    "duration_seconds": duration,
+                }
+                print(f"[LOG] Emitting screen_time event: {st_ev}")
+                self.event_queue.add_event(st_ev)
+
+    def observe(self, info, now_ts):
+        """Handle one poll of the foreground window"""
+        change = self.debouncer.observe(now_ts, info)
+        if change is None:
+            return
+        info, since = change
+        # If we previously had focus on a window, emit screen_time for it
+        self.emit_screen_time(since)
+
+        # Emit foreground_change for the new focus, dated when it was first seen
+        ev = {
+            "type": "foreground_change",
+            "timestamp": since.isoformat(),
+            "hostname": self.hostname,
+            "title": info.get("title"),
+            "process_name": info.get("process_name"),
+            "pid": info.get("pid"),
+            "process_path": info.get("process_path"),
+            "url": info.get("url"),
+        }
+        self.event_queue.add_event(ev)
+
+        # update trackers
+        self.focus_start = since
+        self.focus_info = info
+
     def run(self):
-        focus_start = None
-        focus_info = None
         try:
             while self.running:
-                info = self.get_foreground_info()
-                key = (info.get("pid"), info.get("title"))
-                now_ts = datetime.now(timezone.utc)
-                if key != self.last:
-                    # If we previously had focus on a window, emit screen_time for it
-                    if focus_info and focus_start:
-                        duration = int((now_ts - focus_start).total_seconds())
-                        if duration > 0:
-                                end_time = datetime.now(timezone.utc)
-                                duration = int((end_time - focus_start).total_seconds())
-                                if duration > 0:
-                                    st_ev = {
-                                        "type": "screen_time",
-                                        "timestamp": end_time.isoformat(),
-                                        "hostname": self.hostname,
-                                        "process_name": focus_info.get("process_name"),
-                                        "pid": focus_info.get("pid"),
-                                        "title": focus_info.get("title"),
-                                        "duration_seconds": duration,
-                                    }
-                                    print(f"[LOG] Emitting screen_time event: {st_ev}")
-                                    self.event_queue.add_event(st_ev)
-
-                    # Emit foreground_change for the new focus
-                    ev = {
-                        "type": "foreground_change",
-                        "timestamp": now_iso(),
-                        "hostname": self.hostname,
-                        "title": info.get("title"),
-                        "process_name": info.get("process_name"),
-                        "pid": info.get("pid"),
-                        "process_path": info.get("process_path"),
-                        "url": info.get("url"),
-                    }
-                    self.event_queue.add_event(ev)
-
-                    # update trackers
-                    self.last = key
-                    focus_start = now_ts
-                    focus_info = info
-
+                self.observe(self.get_foreground_info(), datetime.now(timezone.utc))
                 time.sleep(self.poll)
         finally:
             # On shutdown, emit screen_time for the current focus
             try:
-                if focus_info and focus_start:
-                    now_ts = datetime.now(timezone.utc)
-                    duration = int((now_ts - focus_start).total_seconds())
-                    if duration > 0:
-                        # The END time (shutdown time) is now. The event timestamp must be the END time.
-                        end_time = datetime.now(timezone.utc)
-                        st_ev = {
-                            "type": "screen_time",
-                            "timestamp": end_time.isoformat(),
-                            "hostname": self.hostname,
-                            "process_name": focus_info.get("process_name"),
-                            "pid": focus_info.get("pid"),
-                            "title": focus_info.get("title"),
-                            "duration_seconds": duration,
-                        }
-                        print(f"[LOG] Emitting screen_time event: {st_ev}")
-                        self.event_queue.add_event(st_ev)
+                self.emit_screen_time(datetime.now(timezone.utc))
             except Exception:
                 pass
 
@@ -339,6 +461,7 @@ class MouseIdleWatcher(threading.Thread):
         self.running = True
         self.hostname = hostname or socket.gethostname()
         self.afk_watcher = afk_watcher
+        self.callbacks = 0
 
         if mouse:
             self.listener = mouse.Listener(on_move=self.on_move)
@@ -346,6 +469,7 @@ class MouseIdleWatcher(threading.Thread):
             self.listener = None
 
     def on_move(self, x, y):
+        self.callbacks += 1
         self.last_move = time.time()
         # Notify AFK watcher of activity
         if self.afk_watcher:
@@ -442,6 +566,7 @@ class KeyCountWatcher(threading.Thread):
         self.running = True
         self.hostname = hostname or socket.gethostname()
         self.afk_watcher = afk_watcher
+        self.callbacks = 0
 
         if keyboard:
             self.k_listener = keyboard.Listener(on_press=self.on_press)
@@ -449,6 +574,7 @@ class KeyCountWatcher(threading.Thread):
             self.k_listener = None
 
     def on_press(self, key):
+        self.callbacks += 1
         now = time.time()
         # Notify AFK watcher of activity
         if self.afk_watcher:
@@ -503,6 +629,248 @@ class KeyCountWatcher(threading.Thread):
                         self.keystrokes = []
 
 
+class HealthReporter(threading.Thread):
+    """Periodically emits an agent_health event: process CPU/RSS and event pipeline counters.
+
+    Counters are sampled as deltas over the interval, so the server can chart
+    them per host without knowing when the agent started.
+    """
+    def __init__(self, event_queue, interval=60, hostname=None, watchers=None, foreground=None, sink=None):
+        super().__init__(daemon=True)
+        self.event_queue = event_queue
+        # Where samples go (the ActivityAggregator in aggregate mode); counters always come from the queue
+        self.sink = sink or event_queue
+        self.interval = interval
+        self.hostname = hostname or socket.gethostname()
+        self.watchers = watchers or []  # objects with a .callbacks counter
+        self.foreground = foreground
+        self.running = True
+        self.process = psutil.Process() if psutil else None
+
+    def sample(self):
+        return {
+            'batches_sent': self.event_queue.batches_sent,
+            'batches_failed': self.event_queue.batches_failed,
+            'events_sent': self.event_queue.events_sent,
+            'callbacks': sum(w.callbacks for w in self.watchers),
+            'uia_seconds': self.foreground.uia_seconds if self.foreground else 0.0,
+            'time': time.monotonic(),
+        }
+
+    def run(self):
+        if self.process:
+            self.process.cpu_percent(None)  # first call only primes the counter
+        last = self.sample()
+        while self.running:
+            time.sleep(self.interval)
+            if not self.running:
+                break
+            current = self.sample()
+            elapsed = max(current['time'] - last['time'], 1e-6)
+            event = {
+                "type": "agent_health",
+                "timestamp": now_iso(),
+                "hostname": self.hostname,
+                "agent_version": AGENT_VERSION,
+                "interval_seconds": round(elapsed, 1),
+                "queue_depth": self.event_queue.queue.qsize(),
+                "spool_bytes": self.event_queue.spool_bytes(),
+                "batches_sent": current['batches_sent'] - last['batches_sent'],
+                "batches_failed": current['batches_failed'] - last['batches_failed'],
+                "events_sent": current['events_sent'] - last['events_sent'],
+                "uia_share": round((current['uia_seconds'] - last['uia_seconds']) / elapsed, 4),
+                "input_rate": round((current['callbacks'] - last['callbacks']) / elapsed, 2),
+            }
+            if self.process:
+                try:
+                    event["cpu_percent"] = self.process.cpu_percent(None)
+                    event["rss_bytes"] = self.process.memory_info().rss
+                    event["threads"] = self.process.num_threads()
+                except Exception:
+                    pass
+            self.sink.add_event(event)
+            last = current
+
+
+class ActivityAggregator(threading.Thread):
+    """Folds the watchers' events into one activity_minute record per minute.
+
+    Sits between the watchers and the EventQueue (same add_event interface).
+    A record holds the minute's focused seconds per app and domain, active
+    and AFK seconds and key count as seen by the agent, plus `transitions`:
+    the app/domain switches and AFK events in order, as
+    [offset seconds, event_type, fields], which the server replays to build
+    the same sessions as from raw events (sessionizer.py). Title changes
+    within the same app/domain, screen_time and the keystroke lists are not
+    sent. The minute's agent_health sample rides along as `health`. Minutes
+    without events and without active focus time are skipped.
+
+    Other event types (metadata, ...) pass straight through.
+    """
+    FOLDED_TYPES = ('foreground_change', 'screen_time', 'key_count', 'key_count_segment', 'agent_health',
+                    *AFK_START_TYPES, *AFK_END_TYPES)
+    # Fields the server reads from AFK transitions (sessionizer.py, alerts.py)
+    AFK_FIELDS = ('idle_seconds', 'end_time')
+
+    def __init__(self, event_queue, hostname=None, interval=60):
+        super().__init__(daemon=True)
+        self.event_queue = event_queue
+        self.interval = interval
+        self.hostname = hostname or socket.gethostname()
+        self.lock = threading.Lock()
+        self.running = True
+        # State carried across minutes
+        self.focus = None
+        self.afk = False
+        self.minute = None
+        self.accounted = None
+        # Last time the agent was known to be running (an event or a tick)
+        self.observed = None
+        self.records_sent = 0
+        self.events_folded = 0
+        self._reset()
+
+    def _reset(self):
+        self.first_event = None
+        self.last_event = None
+        self.transitions = []
+        self.apps = {}
+        self.domains = {}
+        self.active_seconds = 0.0
+        self.afk_seconds = 0.0
+        self.key_count = 0
+        self.health = None
+
+    def add_event(self, event):
+        at = epoch(event.get('timestamp')) or time.time()
+        with self.lock:
+            # Minutes that ended before the event are sent first, so the server gets them in order
+            self._advance(at)
+            if event.get('type') in self.FOLDED_TYPES:
+                self._fold(at, event)
+            else:
+                self.event_queue.add_event(event)
+
+    def _account(self, until):
+        """Credit the time since the last call to the current focus, as active or AFK"""
+        if self.accounted is not None and until > self.accounted:
+            seconds = until - self.accounted
+            if self.afk:
+                self.afk_seconds += seconds
+            elif self.focus is not None:
+                self.active_seconds += seconds
+                app, domain = self.focus
+                if app:
+                    self.apps[app] = self.apps.get(app, 0.0) + seconds
+                if domain:
+                    self.domains[domain] = self.domains.get(domain, 0.0) + seconds
+        if self.accounted is None or until > self.accounted:
+            self.accounted = until
+
+    def _fold(self, at, event):
+        self.events_folded += 1
+        if self.first_event is None:
+            self.first_event = at
+        self.last_event = max(self.last_event or at, at)
+        event_type = event['type']
+        if event_type == 'foreground_change':
+            focus = (event.get('process_name'), url_domain(event.get('url')))
+            if focus == self.focus:
+                return
+            self._account(at)
+            self.focus = focus
+            fields = {}
+            if focus[0]:
+                fields['process_name'] = focus[0]
+            if focus[1]:
+                fields['url'] = f'https://{focus[1]}/'
+            self.transitions.append((at, event_type, fields))
+        elif event_type in AFK_START_TYPES or event_type in AFK_END_TYPES:
+            self._account(at)
+            self.afk = event_type in AFK_START_TYPES
+            self.transitions.append((at, event_type, {
+                field: event[field] for field in self.AFK_FIELDS if event.get(field) is not None}))
+        elif event_type in ('key_count', 'key_count_segment'):
+            count = event.get('count')
+            if isinstance(count, int):
+                self.key_count += count
+        elif event_type == 'agent_health':
+            if self.health is not None:
+                # One sample per record: an earlier one this minute is sent as is
+                self.event_queue.add_event(dict(self.health, type=event_type, hostname=self.hostname))
+            self.health = {key: value for key, value in event.items() if key not in ('type', 'hostname')}
+
+    def _advance(self, now):
+        """Close every minute that ended by `now`"""
+        if self.minute is not None and now - self.observed > SESSION_TIMEOUT:
+            # Asleep or suspended: nothing after `observed` is credited (the server
+            # ends the session at the last event, as for raw events)
+            self._flush(self.observed)
+            self.minute = None
+        if self.minute is None:
+            self.minute = now - now % self.interval
+            self.accounted = max(self.accounted or now, now)
+        while now >= self.minute + self.interval:
+            self._flush(self.minute + self.interval)
+        self.observed = max(self.observed or now, now)
+
+    def _flush(self, end):
+        self._account(end)
+        if self.last_event is not None or self.active_seconds > 0:
+            # Offsets count from the first event of the minute (its start if there was none)
+            start = self.first_event if self.first_event is not None else self.minute
+            record = {
+                "type": MINUTE_TYPE,
+                "timestamp": datetime.fromtimestamp(start, tz=timezone.utc).isoformat(),
+                "hostname": self.hostname,
+                "interval_seconds": round(end - self.minute, 3),
+                "active_seconds": round(self.active_seconds, 3),
+                "afk_seconds": round(self.afk_seconds, 3),
+                "key_count": self.key_count,
+                "apps": {name: round(seconds, 3) for name, seconds in self.apps.items()},
+                "domains": {name: round(seconds, 3) for name, seconds in self.domains.items()},
+                "transitions": [[round(at - start, 3), event_type, fields]
+                                for at, event_type, fields in self.transitions],
+            }
+            if self.last_event is not None:
+                record["last_event"] = round(self.last_event - start, 3)
+            if self.health is not None:
+                record["health"] = self.health
+            self.event_queue.add_event(record)
+            self.records_sent += 1
+        self._reset()
+        self.minute = end
+
+    def flush(self, now=None):
+        """Send the current (partial) minute, e.g. on shutdown"""
+        with self.lock:
+            if self.minute is not None:
+                now = now or time.time()
+                self._advance(now)
+                self._flush(max(now, self.minute))
+
+    def run(self):
+        while self.running:
+            time.sleep(1.0)
+            with self.lock:
+                self._advance(time.time())
+
+    def stop(self):
+        self.running = False
+        self.flush()
+
+
+def sends_raw_events(hostname, raw_hosts=(), raw_sample=0.0):
+    """Whether this host keeps sending raw events in aggregate mode
+
+    Flagged hosts always do; otherwise a stable raw_sample fraction of
+    hostnames (by CRC32) is picked, the same across restarts.
+    """
+    if hostname.lower() in {h.strip().lower() for h in raw_hosts if h.strip()}:
+        return True
+    return zlib.crc32(hostname.lower().encode('utf-8')) % 10000 < raw_sample * 10000
+
+
 class BlockedSitesPoller(threading.Thread):
     """Thread that polls the server for blocked sites for this hostname and updates the hosts file."""
     START_MARKER = "# SPIEGO_BLOCK_START"
@@ -529,6 +897,12 @@ class BlockedSitesPoller(threading.Thread):
             self.write_retry_delay = float(self.config.get('Logging', 'blocked_write_retry_delay', fallback='0.5'))
         except Exception:
             self.write_retry_delay = 0.5
+        # Seconds to hold each poll open on servers that support it (async_server.py); 0 = plain polling
+        try:
+            self.long_poll = float(self.config.get('Logging', 'blocked_long_poll', fallback='0'))
+        except Exception:
+            self.long_poll = 0.0
+        self.version = ''
 
     def _get_server_url(self):
         host = self.config.get('Server', 'host', fallback='127.0.0.1')
@@ -567,32 +941,13 @@ class BlockedSitesPoller(threading.Thread):
                 pass
 
         # Normalize domains and build block section (use 127.0.0.1)
-        def normalize_domain(d):
-            if not d:
-                return None
-            d = d.strip().lower()
-            # Remove protocol if present
-            if d.startswith('http://'):
-                d = d[7:]
-            elif d.startswith('https://'):
-                d = d[8:]
-            # Strip path
-            if '/' in d:
-                d = d.split('/', 1)[0]
-            # Remove trailing colon/port
-            if ':' in d:
-                d = d.split(':', 1)[0]
-            # Do not remove leading www.; preserve subdomains as provided
-            # Basic validation: must contain at least one dot
-            if '.' not in d:
-                return None
-            return d
-
         lines = [self.START_MARKER]
         added = []
         for d in domains:
-            nd = normalize_domain(d)
-            if not nd:
+            # Do not remove leading www.; preserve subdomains as provided
+            nd = normalize_domain(d, strip_www=False)
+            # Basic validation: must contain at least one dot
+            if not nd or '.' not in nd:
                 continue
             if nd in added:
                 continue
@@ -641,12 +996,19 @@ class BlockedSitesPoller(threading.Thread):
         headers = {'Authorization': f'Bearer {auth_key}'}
 
         while self.running:
+            started = time.time()
             try:
                 if self.session:
-                    resp = self.session.get(url, headers=headers, timeout=self.http_timeout)
+                    if self.long_poll > 0:
+                        resp = self.session.get(f"{url}&wait={self.long_poll:g}&since={self.version}",
+                                                headers=headers, timeout=self.http_timeout + self.long_poll)
+                    else:
+                        resp = self.session.get(url, headers=headers, timeout=self.http_timeout)
                     if resp.status_code == 200:
                         data = resp.json()
                         domains = data.get('blocked', []) if isinstance(data, dict) else []
+                        if isinstance(data, dict):
+                            self.version = data.get('version', '')
                     else:
                         domains = []
                 else:
@@ -665,7 +1027,8 @@ class BlockedSitesPoller(threading.Thread):
                             if ok:
                                 self.current_list = domains
                                 break
-                time.sleep(self.interval)
+                # A long-poll that was held already waited; servers without it answer at once
+                time.sleep(max(0.0, self.interval - (time.time() - started)))
             except Exception as e:
                 # swallow and continue
                 print(f"BlockedSitesPoller error: {e}")
@@ -684,6 +1047,8 @@ class ActivityLoggerApp:
         self.mi = None
         self.kc = None
         self.afk = None
+        self.health = None
+        self.aggregator = None
         self.hostname = socket.gethostname()
         self.icon = None
         self.running = False
@@ -706,11 +1071,18 @@ class ActivityLoggerApp:
                 'retry_attempts': '3',
                 'idle_threshold': '60',
                 'poll_interval': '1.0',
+                'focus_settle_ms': '1000',
                 'afk_threshold': '20',
                 'blocked_poll_interval': '5',
                 'blocked_http_timeout': '5',
                 'blocked_write_retries': '3',
-                'blocked_write_retry_delay': '0.5'
+                'blocked_write_retry_delay': '0.5',
+                'blocked_long_poll': '0',
+                'health_interval': '60',
+                'aggregate': 'false',
+                'aggregate_interval': '60',
+                'raw_sample': '0',
+                'raw_hosts': ''
             }
             with open(config_path, 'w') as f:
                 config.write(f)
@@ -729,12 +1101,24 @@ class ActivityLoggerApp:
         self.event_queue = EventQueue(self.config)
         self.event_queue.add_event(gather_device_metadata())
 
+        # Watchers write into the aggregator in aggregate mode, else straight into the queue
+        sink = self.event_queue
+        raw_hosts = self.config.get('Logging', 'raw_hosts', fallback='').split(',')
+        raw_sample = self.config.getfloat('Logging', 'raw_sample', fallback=0.0)
+        if (self.config.getboolean('Logging', 'aggregate', fallback=False)
+                and not sends_raw_events(self.hostname, raw_hosts, raw_sample)):
+            interval = self.config.getint('Logging', 'aggregate_interval', fallback=60)
+            self.aggregator = ActivityAggregator(self.event_queue, hostname=self.hostname, interval=interval)
+            self.aggregator.start()
+            sink = self.aggregator
+
         # Create AFK watcher first so other watchers can reference it
-        self.afk = AFKWatcher(self.event_queue, idle_threshold=afk_threshold, hostname=self.hostname)
+        self.afk = AFKWatcher(sink, idle_threshold=afk_threshold, hostname=self.hostname)
 
-        self.fg = ForegroundWatcher(self.event_queue, poll_interval=poll_interval, hostname=self.hostname)
-        self.mi = MouseIdleWatcher(self.event_queue, idle_seconds=idle_threshold, poll_interval=poll_interval, hostname=self.hostname, afk_watcher=self.afk)
-        self.kc = KeyCountWatcher(self.event_queue, idle_timeout=10.0, hostname=self.hostname, afk_watcher=self.afk)
+        self.fg = ForegroundWatcher(sink, poll_interval=poll_interval, hostname=self.hostname,
+                                    title_rules=TitleRules.from_config(self.config))
+        self.mi = MouseIdleWatcher(sink, idle_seconds=idle_threshold, poll_interval=poll_interval, hostname=self.hostname, afk_watcher=self.afk)
+        self.kc = KeyCountWatcher(sink, idle_timeout=10.0, hostname=self.hostname, afk_watcher=self.afk)
 
         self.afk.start()
         self.fg.start()
@@ -744,6 +1128,12 @@ class ActivityLoggerApp:
         blocked_interval = self.config.getint('Logging', 'blocked_poll_interval', fallback=5)
         self.blocked_poller = BlockedSitesPoller(self.config, hostname=self.hostname, interval=blocked_interval)
         self.blocked_poller.start()
+        # Agent self-telemetry (0 disables)
+        health_interval = self.config.getint('Logging', 'health_interval', fallback=60)
+        if health_interval > 0:
+            self.health = HealthReporter(self.event_queue, interval=health_interval, hostname=self.hostname,
+                                         watchers=[self.mi, self.kc], foreground=self.fg, sink=sink)
+            self.health.start()
 
         self.running = True
 
@@ -759,6 +1149,10 @@ class ActivityLoggerApp:
             self.kc.running = False
         if self.afk:
             self.afk.running = False
+        if self.health:
+            self.health.running = False
+        if self.aggregator:
+            self.aggregator.stop()
         if self.event_queue:
             self.event_queue.stop()
         if self.blocked_poller:
@@ -776,6 +1170,9 @@ class ActivityLoggerApp:
         
         if self.event_queue:
             status += f"Events sent: {self.event_queue.events_sent}\n"
+            if self.aggregator:
+                status += (f"Aggregated: {self.aggregator.events_folded} events "
+                           f"in {self.aggregator.records_sent} records\n")
             status += f"Queue size: {self.event_queue.queue.qsize()}\n"
             if self.event_queue.last_error:
                 status += f"Last error: {self.event_queue.last_error}\n"
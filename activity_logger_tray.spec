@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    hiddenimports=['activity_common'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -0,0 +1,292 @@
+"""
+alerts.py
+
+In-process alert engine for offline, idle and AFK-too-long devices.
+
+Replaces the Laravel scheduler path for these alerts (spiego_server.py
+spawning `php artisan schedule:run` every minute, which then scans the
+devices/events tables). The engine is fed each stored batch on the ingest
+path and keeps per-host state in memory:
+
+    offline  no events received from the host for --offline-minutes
+    idle     mouse_idle without a following mouse_active for --idle-minutes
+    afk      afk_start without a following afk_end for --afk-minutes
+
+Deadlines sit in a heap with one live entry per (host, kind); new events only
+move the deadline in a dict and the entry is re-queued when it comes due, so
+heap size stays at the number of hosts. A timer thread sleeps until the
+earliest deadline, so alerts fire within a second of the threshold. Each
+alert fires once per episode; the next matching event re-arms it.
+
+Alerts are delivered to one or more sinks:
+
+    log:alerts.jsonl               append one JSON line per alert
+    smtp:localhost:1025            email --alert-email via an SMTP server
+    webhook:http://host/alerts     POST the alert as JSON
+
+On start the offline state is seeded from each host's last event
+(open_sessions.last_seen); hosts already past the threshold are treated as
+alerted. Idle/AFK state is learned from new events, including the transitions of
+the tray agent's activity_minute records.
+"""
+import heapq
+import json
+import smtplib
+import threading
+import time
+import urllib.request
+from datetime import datetime, timezone
+from email.message import EmailMessage
+
+import sessionizer
+
+DEFAULT_OFFLINE_MINUTES = 60
+DEFAULT_IDLE_MINUTES = 30
+DEFAULT_AFK_MINUTES = 120
+SEND_TIMEOUT = 10
+
+# Event type -> (alert kind, True to start an episode / False to end it)
+EPISODE_EVENTS = {
+    'mouse_idle': ('idle', True),
+    'mouse_active': ('idle', False),
+    'afk_start': ('afk', True),
+    'afk_end': ('afk', False),
+}
+
+MESSAGES = {
+    'offline': '{hostname} has sent nothing for {minutes} minutes',
+    'idle': '{hostname} has been idle for {minutes} minutes',
+    'afk': '{hostname} has been away for {minutes} minutes',
+}
+
+
+class LogSink:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def send(self, alert):
+        with self.lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(alert) + '\n')
+
+
+class SmtpSink:
+    """Plain SMTP (e.g. a local relay or `python -m aiosmtpd -n` for testing)"""
+
+    def __init__(self, host, port, recipients, sender='spiego-alerts@localhost'):
+        self.host = host
+        self.port = port
+        self.recipients = recipients
+        self.sender = sender
+
+    def send(self, alert):
+        message = EmailMessage()
+        message['Subject'] = f"[Spiego] {alert['kind']} alert: {alert['hostname']}"
+        message['From'] = self.sender
+        message['To'] = ', '.join(self.recipients)
+        message.set_content(f"{alert['message']}\n\nSince: {alert['since']}\nFired: {alert['fired_at']}\n")
+        with smtplib.SMTP(self.host, self.port, timeout=SEND_TIMEOUT) as smtp:
+            smtp.send_message(message)
+
+
+class WebhookSink:
+    def __init__(self, url):
+        self.url = url
+
+    def send(self, alert):
+        request = urllib.request.Request(self.url, data=json.dumps(alert).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        with urllib.request.urlopen(request, timeout=SEND_TIMEOUT) as response:
+            response.read()
+
+
+def parse_sink(spec, recipients=()):
+    """'log:PATH', 'smtp:HOST:PORT' or 'webhook:URL' -> sink"""
+    kind, _, target = spec.partition(':')
+    if kind == 'log' and target:
+        return LogSink(target)
+    if kind == 'smtp':
+        host, _, port = target.partition(':')
+        if not recipients:
+            raise ValueError('smtp alert sink needs --alert-email')
+        return SmtpSink(host or 'localhost', int(port or 25), list(recipients))
+    if kind == 'webhook' and target:
+        return WebhookSink(target)
+    raise ValueError(f'Unknown alert sink: {spec} (use log:PATH, smtp:HOST:PORT or webhook:URL)')
+
+
+def iso(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat()
+
+
+class AlertEngine:
+    def __init__(self, sinks, offline_minutes=DEFAULT_OFFLINE_MINUTES, idle_minutes=DEFAULT_IDLE_MINUTES,
+                 afk_minutes=DEFAULT_AFK_MINUTES):
+        self.sinks = sinks
+        self.thresholds = {'offline': offline_minutes * 60, 'idle': idle_minutes * 60, 'afk': afk_minutes * 60}
+        # (hostname, kind) -> episode start; the alert is due at start + threshold
+        self.started = {}
+        # (hostname, kind) -> deadline of that key's live heap entry
+        self.queued = {}
+        self.heap = []
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.fired = {kind: 0 for kind in self.thresholds}
+        self.failed = 0
+
+    @classmethod
+    def from_options(cls, options):
+        """Build from the picklable dict made by options_from_args (also used in the writer process)"""
+        recipients = options.get('emails') or ()
+        return cls([parse_sink(spec, recipients) for spec in options['sinks']],
+                   offline_minutes=options.get('offline_minutes', DEFAULT_OFFLINE_MINUTES),
+                   idle_minutes=options.get('idle_minutes', DEFAULT_IDLE_MINUTES),
+                   afk_minutes=options.get('afk_minutes', DEFAULT_AFK_MINUTES))
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='alert-engine', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread:
+            self.thread.join(timeout=2)
+
+    def arm(self, key, start):
+        """Start or move an episode; caller holds the condition"""
+        self.started[key] = start
+        deadline = start + self.thresholds[key[1]]
+        queued = self.queued.get(key)
+        if queued is None or deadline < queued:
+            self.queued[key] = deadline
+            heapq.heappush(self.heap, (deadline, key))
+            if self.heap[0][1] == key:
+                self.condition.notify()
+
+    def seed(self, cursor):
+        """Arm offline deadlines from each host's last stored event"""
+        now = time.time()
+        rows = cursor.execute('''
+            SELECT h.value, o.last_seen FROM open_sessions o JOIN hosts h ON h.id = o.host_id
+            WHERE o.last_seen IS NOT NULL
+        ''').fetchall()
+        with self.condition:
+            for hostname, last_seen in rows:
+                if last_seen + self.thresholds['offline'] > now:
+                    self.arm((hostname, 'offline'), last_seen)
+        return len(rows)
+
+    def observe(self, events):
+        """Update host state from a stored batch (events in arrival order)"""
+        now = time.time()
+        with self.condition:
+            seen = set()
+            for event in events:
+                hostname = event.get('hostname')
+                if not isinstance(hostname, str) or not hostname:
+                    hostname = 'unknown'
+                if hostname not in seen:
+                    seen.add(hostname)
+                    self.arm((hostname, 'offline'), now)
+                if event.get('type') == sessionizer.MINUTE_TYPE:
+                    episodes = sessionizer.transitions(sessionizer.epoch(event.get('timestamp')) or now, event)
+                else:
+                    episodes = [(None, event.get('type'), event)]
+                for at, event_type, fields in episodes:
+                    episode = EPISODE_EVENTS.get(event_type)
+                    if episode is None:
+                        continue
+                    kind, begins = episode
+                    key = (hostname, kind)
+                    if not begins:
+                        self.started.pop(key, None)
+                    elif key not in self.started:
+                        if at is None:
+                            at = sessionizer.epoch(fields.get('timestamp')) or now
+                        idle = fields.get('idle_seconds')
+                        if kind == 'idle' and isinstance(idle, (int, float)):
+                            at -= idle
+                        self.arm(key, min(at, now))
+
+    def due(self):
+        """Pop alerts whose deadline has passed; caller holds the condition"""
+        now = time.time()
+        alerts = []
+        while self.heap and self.heap[0][0] <= now:
+            deadline, key = heapq.heappop(self.heap)
+            if self.queued.get(key) != deadline:
+                continue
+            del self.queued[key]
+            start = self.started.get(key)
+            if start is None:
+                continue
+            target = start + self.thresholds[key[1]]
+            if target > deadline:
+                # Moved by newer events: wait for the new deadline
+                self.queued[key] = target
+                heapq.heappush(self.heap, (target, key))
+                continue
+            del self.started[key]
+            hostname, kind = key
+            minutes = int((now - start) // 60)
+            alerts.append({
+                'kind': kind,
+                'hostname': hostname,
+                'since': iso(start),
+                'minutes': minutes,
+                'message': MESSAGES[kind].format(hostname=hostname, minutes=minutes),
+                'fired_at': iso(now),
+            })
+        return alerts
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running:
+                    alerts = self.due()
+                    if alerts:
+                        break
+                    timeout = self.heap[0][0] - time.time() if self.heap else None
+                    self.condition.wait(timeout)
+                if not self.running:
+                    return
+            for alert in alerts:
+                self.deliver(alert)
+
+    def deliver(self, alert):
+        self.fired[alert['kind']] += 1
+        print(f"[ALERT] {alert['message']}")
+        for sink in self.sinks:
+            try:
+                sink.send(alert)
+            except Exception as e:
+                self.failed += 1
+                print(f"[ALERT] Delivery to {type(sink).__name__} failed: {e}")
+
+
+def add_arguments(parser):
+    parser.add_argument('--alert-sink', action='append', default=[], metavar='SINK',
+                        help='Enable alerts: log:PATH, smtp:HOST:PORT or webhook:URL (repeatable)')
+    parser.add_argument('--alert-email', action='append', default=[], help='Recipient for smtp alert sinks')
+    parser.add_argument('--offline-minutes', type=float, default=DEFAULT_OFFLINE_MINUTES)
+    parser.add_argument('--idle-minutes', type=float, default=DEFAULT_IDLE_MINUTES)
+    parser.add_argument('--afk-minutes', type=float, default=DEFAULT_AFK_MINUTES)
+
+
+def options_from_args(args):
+    """None unless a sink was given; raises ValueError for a bad sink spec"""
+    if not args.alert_sink:
+        return None
+    options = {
+        'sinks': args.alert_sink,
+        'emails': args.alert_email,
+        'offline_minutes': args.offline_minutes,
+        'idle_minutes': args.idle_minutes,
+        'afk_minutes': args.afk_minutes,
+    }
+    AlertEngine.from_options(options)
+    return options
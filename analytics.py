@@ -0,0 +1,391 @@
+"""
+analytics.py
+
+Vectorized per-host productivity metrics over a window of events.
+
+A window is loaded once into flat NumPy arrays (EventArrays): epoch
+timestamps, host / app / domain dictionary codes, an event kind and, for
+AFK events, a duration (idle seconds before mouse_idle, end_time after
+afk_end). Metrics are then computed for all hosts at once with sorts,
+searchsorted and grouped sums instead of a Python loop per event:
+
+    - each host is shifted onto its own stretch of one time axis, so a
+      single sort and searchsorted serve every host,
+    - the host is present between consecutive events less than
+      SESSION_TIMEOUT apart,
+    - AFK periods are paired, clipped and merged into disjoint intervals,
+      and their overlap with each present stretch comes from a cumulative
+      AFK measure,
+    - the remaining active seconds go to the app/domain of the last
+      focus event and are summed per (host, app), (host, domain) and
+      optionally per category.
+
+The rules are those of sessionizer.HostSessions, so active seconds agree
+with the sessions table for the same events, except that overlapping AFK
+periods are counted once; time before a host's first focus event in the
+window is not attributed.
+
+    import analytics
+    events = analytics.load_window([conn], '2026-10-01', '2026-10-08')
+    for host in analytics.host_metrics(events):
+        print(host['hostname'], host['active_seconds'], host['switches_per_hour'])
+
+or from the command line (JSON on stdout):
+
+    python analytics.py --db activity_logs.db --from 2026-10-01 --to 2026-10-07
+
+benchmarks/bench_analytics.py compares this with the per-event loop.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from datetime import date, timedelta
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import domains
+import event_store
+import export
+import sessionizer
+import shards
+
+TOP_N = 10
+
+KIND_OTHER = 0
+KIND_FOCUS = 1
+KIND_AFK_START = 2
+KIND_AFK_END = 3
+
+EVENT_KINDS = {event_type: KIND_FOCUS for event_type in sessionizer.FOCUS_TYPES}
+EVENT_KINDS.update({event_type: KIND_AFK_START for event_type in sessionizer.AFK_START_TYPES})
+EVENT_KINDS.update({event_type: KIND_AFK_END for event_type in sessionizer.AFK_END_TYPES})
+AFK_TYPES = sessionizer.AFK_START_TYPES + sessionizer.AFK_END_TYPES
+
+
+class EventArrays:
+    """One row per event; codes index into host_names / app_names / domain_names (-1 = none)"""
+
+    def __init__(self, host, time, kind, app, domain, duration, host_names, app_names, domain_names):
+        self.host = np.asarray(host, dtype=np.int32)
+        self.time = np.asarray(time, dtype=np.float64)
+        self.kind = np.asarray(kind, dtype=np.int8)
+        self.app = np.asarray(app, dtype=np.int32)
+        self.domain = np.asarray(domain, dtype=np.int32)
+        self.duration = np.asarray(duration, dtype=np.float64)
+        self.host_names = list(host_names)
+        self.app_names = list(app_names)
+        self.domain_names = list(domain_names)
+
+    def __len__(self):
+        return len(self.time)
+
+
+def afk_duration(kind, at, data):
+    """Seconds the AFK event reaches back (idle_seconds) or forward (end_time) from its timestamp"""
+    payload = event_store.decode_payload(data)
+    if kind == KIND_AFK_START:
+        idle = payload.get('idle_seconds')
+        return idle if isinstance(idle, (int, float)) and idle > 0 else 0.0
+    back = sessionizer.epoch(payload.get('end_time'))
+    return back - at if back is not None and back > at else 0.0
+
+
+def load_window(conns, start, end, hostname=None):
+    """EventArrays for events with start <= timestamp < end (ISO strings) across conns
+
+    Only AFK events have their payload decoded.
+    """
+    export.require_numpy()
+    hosts = export.Dictionary()
+    apps = export.Dictionary()
+    urls = export.Dictionary()
+    parts = {name: [] for name in ('host', 'time', 'kind', 'app', 'url', 'duration')}
+    afk_types = ', '.join(f"'{event_type}'" for event_type in AFK_TYPES)
+
+    for conn in conns:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        where = export.host_filter(cursor, hostname)
+        if where is None:
+            continue
+        cursor.execute(f'''
+            SELECT host_id,
+                   CASE WHEN timestamp LIKE '%+00:00' THEN substr(timestamp, 1, length(timestamp) - 6)
+                        ELSE timestamp END,
+                   event_type, process_name_id, url_id,
+                   CASE WHEN event_type IN ({afk_types}) THEN data END
+            FROM events WHERE timestamp >= ? AND timestamp < ? AND host_id IS NOT NULL{where[0]}
+        ''', [start, end] + where[1])
+        ids = {'host': [], 'app': [], 'url': []}
+        while True:
+            rows = cursor.fetchmany(export.FETCH_ROWS)
+            if not rows:
+                break
+            values = list(zip(*rows))
+            times = export.to_datetime(values[1]).astype(np.int64) / 1e6
+            kinds = np.array([EVENT_KINDS.get(event_type, KIND_OTHER) for event_type in values[2]], dtype=np.int8)
+            durations = np.zeros(len(rows))
+            for i in np.flatnonzero(kinds >= KIND_AFK_START):
+                if values[5][i] is not None:
+                    durations[i] = afk_duration(kinds[i], times[i], values[5][i])
+            parts['time'].append(times)
+            parts['kind'].append(kinds)
+            parts['duration'].append(durations)
+            for name, column in (('host', 0), ('app', 3), ('url', 4)):
+                ids[name].append(np.array([value or 0 for value in values[column]], dtype=np.int64))
+        # Interned ids are per database: map them through shared dictionaries
+        lookup = conn.cursor()
+        lookup.row_factory = None
+        for name, table, dictionary in (('host', 'hosts', hosts), ('app', 'process_names', apps),
+                                        ('url', 'urls', urls)):
+            if ids[name]:
+                parts[name].append(export.encode_ids(lookup, table, np.concatenate(ids[name]), dictionary))
+
+    if not parts['time']:
+        return EventArrays([], [], [], [], [], [], [], [], [])
+    columns = {name: np.concatenate(arrays) for name, arrays in parts.items()}
+    # URLs -> domains on the (small) dictionary, then per event through the codes
+    sites = export.Dictionary()
+    url_domains = np.array([-1] + [sites.code(domain) if domain else -1
+                                   for domain in map(domains.url_domain, urls.values)], dtype=np.int32)
+    return EventArrays(columns['host'], columns['time'], columns['kind'], columns['app'],
+                       url_domains[columns['url'] + 1], columns['duration'],
+                       hosts.values, apps.values, sites.values)
+
+
+def merge_intervals(starts, ends):
+    """Sorted disjoint union of [start, end) intervals"""
+    if len(starts) == 0:
+        return starts, ends
+    order = np.argsort(starts, kind='stable')
+    starts, ends = starts[order], ends[order]
+    reach = np.maximum.accumulate(ends)
+    first = np.ones(len(starts), dtype=bool)
+    first[1:] = starts[1:] > reach[:-1]
+    last = np.append(np.flatnonzero(first)[1:] - 1, len(starts) - 1)
+    return starts[first], reach[last]
+
+
+def measure_before(points, starts, ends):
+    """Total length of the disjoint sorted intervals that lies before each point"""
+    if len(starts) == 0:
+        return np.zeros(len(points))
+    lengths = ends - starts
+    before = np.concatenate(([0.0], np.cumsum(lengths)))
+    index = np.searchsorted(starts, points, side='right') - 1
+    inside = index >= 0
+    index = np.maximum(index, 0)
+    partial = np.clip(points - starts[index], 0, lengths[index])
+    return np.where(inside, before[index] + partial, 0.0)
+
+
+def grouped_sums(host, codes, seconds, names, top):
+    """Per host [[name, seconds], ...] for the largest `top` codes (codes < 0 skipped)"""
+    result = {}
+    keep = codes >= 0
+    if not keep.any():
+        return result
+    width = max(len(names), 1)
+    flat = host[keep].astype(np.int64) * width + codes[keep]
+    if (int(host.max()) + 1) * width <= 4 * len(flat):
+        totals = np.bincount(flat, weights=seconds[keep])
+        keys = np.arange(len(totals))
+    else:
+        keys, inverse = np.unique(flat, return_inverse=True)
+        totals = np.bincount(inverse, weights=seconds[keep])
+    keys, totals = keys[totals > 0], totals[totals > 0]
+    key_hosts, key_codes = keys // width, keys % width
+    order = np.lexsort((-totals, key_hosts))
+    for index in order:
+        ranked = result.setdefault(int(key_hosts[index]), [])
+        if len(ranked) < top:
+            ranked.append([names[key_codes[index]], round(float(totals[index]), 1)])
+    return result
+
+
+def host_metrics(events, categories=None, top=TOP_N):
+    """Metrics per host, one dict each:
+
+    active/afk/present seconds, focus switches (focus events that change
+    app or domain) and switches per active hour, top apps and domains by
+    active seconds and, when `categories` maps app or domain names to a
+    category (None = uncategorized), each category's share of active time.
+    """
+    export.require_numpy()
+    if len(events) == 0:
+        return []
+    # Shift each host onto its own stretch of the axis: x = t - t0 + host * stride
+    t0 = events.time.min()
+    span = events.time.max() - t0
+    margin = sessionizer.SESSION_TIMEOUT + float(events.duration.max(initial=0.0)) + 1.0
+    stride = span + 2 * margin
+    x = events.time - t0 + margin + events.host.astype(np.int64) * stride
+    if not (x[1:] >= x[:-1]).all():
+        # Rows usually arrive in time order: a stable (radix) sort by host is then enough
+        order = np.argsort(events.host.astype(np.int16) if len(events.host_names) < 2 ** 15 else events.host,
+                           kind='stable')
+        x = x[order]
+        if not (x[1:] >= x[:-1]).all():
+            resort = np.argsort(x, kind='stable')
+            order, x = order[resort], x[resort]
+        host, kind, app, domain, duration = (getattr(events, name)[order]
+                                             for name in ('host', 'kind', 'app', 'domain', 'duration'))
+    else:
+        host, kind, app, domain, duration = events.host, events.kind, events.app, events.domain, events.duration
+    host = host.astype(np.int64)
+    count = len(x)
+    n_hosts = len(events.host_names)
+
+    # Runs: consecutive events of one host less than SESSION_TIMEOUT apart
+    gap = np.diff(x)
+    same_host = host[1:] == host[:-1]
+    present = same_host & (gap <= sessionizer.SESSION_TIMEOUT)
+    run_first = np.ones(count, dtype=bool)
+    run_first[1:] = ~present
+    run = np.cumsum(run_first) - 1
+    run_starts = x[run_first]
+    run_last = np.ones(count, dtype=bool)
+    run_last[:-1] = ~present
+    run_ends = x[run_last]
+
+    # Focus in effect at each event (last focus event of the host at or before it), and where
+    # its session began: focus events repeating the app/domain continue the session
+    focus_rows = np.flatnonzero(kind == KIND_FOCUS)
+    focus_host = host[focus_rows]
+    focus_key = app[focus_rows].astype(np.int64) * (len(events.domain_names) + 1) + domain[focus_rows] + 1
+    changed = np.ones(len(focus_rows), dtype=bool)
+    changed[1:] = (focus_host[1:] != focus_host[:-1]) | (focus_key[1:] != focus_key[:-1])
+    chain_start = x[focus_rows][changed][np.cumsum(changed) - 1]
+    focus_row = np.full(count, -1, dtype=np.int64)
+    session_from = np.full(count, -np.inf)
+    if len(focus_rows):
+        at_focus = np.cumsum(kind == KIND_FOCUS) - 1
+        has_focus = at_focus >= 0
+        has_focus[has_focus] = focus_host[at_focus[has_focus]] == host[has_focus]
+        focus_row[has_focus] = focus_rows[at_focus[has_focus]]
+        session_from[has_focus] = chain_start[at_focus[has_focus]]
+
+    # AFK intervals: a start opens one unless the previous AFK event of the run was a start;
+    # it ends at the next AFK end in the same run, or at the end of the run
+    afk_rows = np.flatnonzero(kind >= KIND_AFK_START)
+    afk_kind = kind[afk_rows]
+    afk_run = run[afk_rows]
+    new_run = np.ones(len(afk_rows), dtype=bool)
+    new_run[1:] = afk_run[1:] != afk_run[:-1]
+    after_start = np.zeros(len(afk_rows), dtype=bool)
+    after_start[1:] = (afk_kind[:-1] == KIND_AFK_START) & ~new_run[1:]
+    opens = afk_rows[(afk_kind == KIND_AFK_START) & ~after_start]
+    closes = afk_rows[(afk_kind == KIND_AFK_END) & after_start]
+    # Back-dated starts never reach before the current session (its focus event or the run start)
+    afk_starts = np.maximum(x[opens] - duration[opens], np.maximum(run_starts[run[opens]], session_from[opens]))
+    close_index = np.searchsorted(closes, opens)
+    paired = close_index < len(closes)
+    paired[paired] = run[closes[close_index[paired]]] == run[opens[paired]]
+    afk_ends = run_ends[run[opens]].copy()
+    matched = closes[close_index[paired]]
+    afk_ends[paired] = np.minimum(x[matched] + duration[matched], afk_ends[paired])
+    keep = afk_ends > afk_starts
+    afk_starts, afk_ends = merge_intervals(afk_starts[keep], afk_ends[keep])
+
+    # Present stretches between consecutive events, minus AFK overlap
+    stretch = np.flatnonzero(present)
+    begin, finish = x[stretch], x[stretch + 1]
+    length = finish - begin
+    afk = measure_before(finish, afk_starts, afk_ends) - measure_before(begin, afk_starts, afk_ends)
+    focused = focus_row[stretch]
+    stretch_app = np.where(focused >= 0, app[np.maximum(focused, 0)], -1)
+    stretch_domain = np.where(focused >= 0, domain[np.maximum(focused, 0)], -1)
+    counted = (stretch_app >= 0) | (stretch_domain >= 0)
+    stretch_host = host[stretch]
+    active = np.where(counted, length - afk, 0.0)
+
+    active_seconds = np.bincount(stretch_host, weights=active, minlength=n_hosts)
+    afk_seconds = np.bincount(stretch_host, weights=np.where(counted, afk, 0.0), minlength=n_hosts)
+    present_seconds = np.bincount(stretch_host, weights=length, minlength=n_hosts)
+    event_counts = np.bincount(host, minlength=n_hosts)
+
+    # Switches: focus events whose app/domain differs from the host's previous focus event
+    switched = changed.copy()
+    switched[1:] &= focus_host[1:] == focus_host[:-1]
+    switched[:1] = False
+    switches = np.bincount(focus_host[switched], minlength=n_hosts)
+
+    top_apps = grouped_sums(stretch_host, stretch_app, active, events.app_names, top)
+    top_domains = grouped_sums(stretch_host, stretch_domain, active, events.domain_names, top)
+    shares = {}
+    if categories is not None:
+        # Categorize the dictionaries once; in a browser the domain's category wins over the app's
+        category_names = {}
+        app_category, domain_category = (
+            np.array([-1] + [category_names.setdefault(category, len(category_names)) if category else -1
+                             for category in map(categories, names)], dtype=np.int32)
+            for names in (events.app_names, events.domain_names))
+        by_domain = domain_category[stretch_domain + 1]
+        category = np.where(by_domain >= 0, by_domain, app_category[stretch_app + 1])
+        shares = grouped_sums(stretch_host, category, active, list(category_names), len(category_names))
+
+    results = []
+    for code in np.flatnonzero(event_counts):
+        active_total = float(active_seconds[code])
+        results.append({
+            'hostname': events.host_names[code],
+            'events': int(event_counts[code]),
+            'active_seconds': round(active_total, 1),
+            'afk_seconds': round(float(afk_seconds[code]), 1),
+            'present_seconds': round(float(present_seconds[code]), 1),
+            'focus_switches': int(switches[code]),
+            'switches_per_hour': round(float(switches[code]) * 3600 / active_total, 2) if active_total else 0.0,
+            'top_apps': top_apps.get(code, []),
+            'top_domains': top_domains.get(code, []),
+        })
+        if categories is not None:
+            results[-1]['categories'] = {name: round(seconds / active_total, 4) if active_total else 0.0
+                                         for name, seconds in shares.get(code, [])}
+    return results
+
+
+def main(argv=None):
+    today = date.today()
+    parser = argparse.ArgumentParser(description='Per-host productivity metrics for a range of days (JSON)')
+    parser.add_argument('--db', default='activity_logs.db', help='SQLite database path')
+    parser.add_argument('--shards', type=int, default=1, help='Shard count the server runs with (see shards.py)')
+    parser.add_argument('--from', dest='first', default=(today - timedelta(days=6)).isoformat(),
+                        help='First day, YYYY-MM-DD (default: 6 days ago)')
+    parser.add_argument('--to', dest='last', default=today.isoformat(), help='Last day, YYYY-MM-DD (default: today)')
+    parser.add_argument('--hostname', help='Only this host')
+    parser.add_argument('--top', type=int, default=TOP_N, help='Apps and domains listed per host')
+    args = parser.parse_args(argv)
+
+    if np is None:
+        print("Missing dependency: numpy")
+        print("Install with: pip install numpy")
+        return 1
+    try:
+        end = (export.parse_day(args.last) + timedelta(days=1)).isoformat()
+        export.parse_day(args.first)
+    except ValueError:
+        parser.error('--from and --to must be YYYY-MM-DD')
+    paths = shards.shard_paths(args.db, args.shards)
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"Database not found: {path}")
+            return 1
+
+    conns = [sqlite3.connect(path) for path in paths]
+    try:
+        events = load_window(conns, args.first, end, args.hostname)
+    finally:
+        for conn in conns:
+            conn.close()
+    json.dump(host_metrics(events, categories=domains.name_category, top=args.top), sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
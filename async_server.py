@@ -0,0 +1,542 @@
+"""
+async_server.py
+
+asyncio (aiohttp) front end for large agent fleets.
+
+A thread-per-request server runs out of threads once thousands of agents
+hold keep-alive connections or long-poll for their block list. Here the
+agent-facing endpoints run on the event loop, where an idle connection
+costs a few KB and no thread:
+
+    POST /api/events          ingest (same auth, license and storage as server_tray.py)
+    GET  /api/blocked_sites   block list; ?wait=<s>&since=<version> long-polls until it changes
+    GET  /api/stream          server-sent events with each ingested batch (?hostname= filter)
+
+Writes go through the write_coordinator group commit on a single writer
+thread, fed from an asyncio queue. Everything else (dashboard, /metrics,
+bulk upload, ...) is handed to the unchanged server_tray Flask app on a
+thread pool, so the dashboard works as before, and its writes join the
+same writer queue. Request and response bodies are streamed across, so a
+bulk NDJSON upload is parsed as it arrives and each of its batches is a
+group commit of its own.
+
+Usage:
+    pip install aiohttp
+    python async_server.py --port 5000 --auth-key <key>
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import wraps
+from urllib.parse import unquote_to_bytes
+
+try:
+    from aiohttp import web
+    from multidict import CIMultiDict
+except ImportError:
+    web = None
+
+import alerts
+import event_store
+import server_tray
+import tail_buffer
+import write_coordinator
+
+# Threads for the Flask fallback and read queries
+READER_THREADS = 16
+# Longest ?wait= a long-polling agent may ask for
+MAX_LONG_POLL = 120.0
+# Seconds between block list reloads (picks up edits made by other processes)
+BLOCKED_REFRESH = 2.0
+# Comment line sent to idle SSE clients so proxies keep the connection
+SSE_KEEPALIVE = 15.0
+# Batches buffered per SSE client before it is considered too slow and dropped
+SSE_QUEUE = 256
+DEVICE_COUNT_INTERVAL = 5.0
+# Response bytes of the WSGI app collected before switching to a streamed response
+WSGI_BUFFER = 1024 * 1024
+# Dropped response headers when relaying the WSGI app (aiohttp sets its own)
+HOP_HEADERS = {'content-length', 'transfer-encoding', 'connection', 'keep-alive'}
+
+
+class AsyncWriter:
+    """Group-commit queue on the event loop; commits run on one dedicated thread
+
+    With a shards.ShardSet the shard writer threads do the commits instead.
+    """
+
+    def __init__(self, db_path, shards=None):
+        self.shards = shards
+        self.coordinator = write_coordinator.WriteCoordinator(db_path, None, None)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='writer')
+        self.queue = None
+        self.loop = None
+        self.task = None
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        if self.shards is not None:
+            self.shards.start()
+            return
+        await self.loop.run_in_executor(self.executor, self.coordinator.open)
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+        self.executor.shutdown(wait=True)
+
+    async def run(self):
+        while True:
+            group = [await self.queue.get()]
+            size = len(group[0]['events'])
+            while size < write_coordinator.GROUP_MAX_EVENTS and not self.queue.empty():
+                item = self.queue.get_nowait()
+                group.append(item)
+                size += len(item['events'])
+            await self.loop.run_in_executor(self.executor, self.coordinator.commit_group, group)
+            for item in group:
+                if not item['future'].done():
+                    item['future'].set_result(item['result'])
+
+    async def submit(self, events):
+        """Store a batch; returns [(event_type, timestamp, hostname), ...]"""
+        if self.shards is not None:
+            return await self.loop.run_in_executor(None, self.shards.store_events, events)
+        future = self.loop.create_future()
+        self.queue.put_nowait({'events': events, 'future': future, 'result': None})
+        status, result = await future
+        if status != 'ok':
+            raise RuntimeError(result)
+        return result
+
+    # WriterClient interface, so server_tray.write_events() from Flask threads joins this queue
+    def store_events(self, events):
+        return asyncio.run_coroutine_threadsafe(self.submit(events), self.loop).result()
+
+    def stats(self):
+        if self.shards is not None:
+            return self.shards.stats()
+        return dict(self.coordinator.stats, queue_depth=self.queue.qsize())
+
+
+class Broker:
+    """Fan-out of ingested batches to SSE clients"""
+
+    def __init__(self):
+        self.subscribers = {}
+
+    def subscribe(self, hostname=None):
+        queue = asyncio.Queue(maxsize=SSE_QUEUE)
+        self.subscribers[queue] = hostname
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.pop(queue, None)
+
+    def publish(self, events):
+        for queue, hostname in list(self.subscribers.items()):
+            batch = events if hostname is None else [e for e in events if e.get('hostname') == hostname]
+            if not batch:
+                continue
+            try:
+                queue.put_nowait(batch)
+            except asyncio.QueueFull:
+                # Slow client: end its stream, it reconnects and resyncs
+                self.unsubscribe(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+
+class BlockedSites:
+    """Cached block lists with long-poll waiters per hostname"""
+
+    def __init__(self):
+        self.lists = {}
+        self.waiters = {}
+
+    def get(self, hostname):
+        return self.lists.get(hostname, [])
+
+    def version(self, hostname):
+        return event_store.blocked_version(self.get(hostname))
+
+    def update(self, lists):
+        changed = {h for h in set(lists) | set(self.lists) if lists.get(h) != self.lists.get(h)}
+        self.lists = lists
+        for hostname in changed:
+            for future in self.waiters.pop(hostname, ()):
+                if not future.done():
+                    future.set_result(None)
+
+    async def wait(self, hostname, timeout):
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(hostname, set()).add(future)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            waiters = self.waiters.get(hostname)
+            if waiters is not None:
+                waiters.discard(future)
+                if not waiters:
+                    del self.waiters[hostname]
+
+
+def read_blocked_sites():
+    lists = {}
+    for conn, _ in server_tray.shard_dbs():
+        try:
+            lists.update(event_store.blocked_sites(conn.cursor()))
+        finally:
+            conn.close()
+    return lists
+
+
+def require_auth(handler):
+    """Same bearer check and error bodies as server_tray.require_auth"""
+    @wraps(handler)
+    async def decorated(request):
+        failure = server_tray.check_auth(request.headers.get('Authorization', ''))
+        if failure:
+            return web.json_response({'error': failure[0]}, status=failure[1])
+        return await handler(request)
+    return decorated
+
+
+if web is not None:
+    @web.middleware
+    async def native_middleware(request, handler):
+        """License check and request metrics for the routes served on the loop"""
+        if request.match_info.route.name == 'wsgi':
+            # The Flask app applies its own license check and metrics
+            return await handler(request)
+        provided = (server_tray.app.config.get('LICENSE_KEY') or request.query.get('license')
+                    or request.headers.get('X-License-Key'))
+        if not server_tray.license_valid(provided):
+            return web.json_response({'error': 'Trial expired - invalid license'}, status=403)
+        start = time.perf_counter()
+        response = await handler(request)
+        route = request.match_info.route.resource.canonical
+        server_tray.REQUEST_LATENCY.labels(route, request.method).observe(time.perf_counter() - start)
+        server_tray.REQUESTS.labels(route, request.method, response.status).inc()
+        return response
+
+
+@require_auth
+async def receive_events(request):
+    try:
+        data = await request.json()
+        events = data.get('events', [])
+
+        await request.app['writer'].submit(events)
+        if server_tray.alert_engine is not None:
+            server_tray.alert_engine.observe(events)
+        if server_tray.tail is not None:
+            server_tray.tail.add(events)
+
+        server_tray.stats['total_events'] += len(events)
+        if events:
+            server_tray.stats['last_event'] = datetime.now()
+        server_tray.EVENTS_INGESTED.labels('events').inc(len(events))
+        server_tray.INGEST_BATCH.labels('events').observe(len(events))
+        request.app['broker'].publish(events)
+
+        return web.json_response({'status': 'success', 'received': len(events)})
+    except Exception as e:
+        return web.json_response({'error': str(e)}, status=500)
+
+
+@require_auth
+async def get_blocked_sites(request):
+    hostname = request.query.get('hostname')
+    if not hostname:
+        return web.json_response({'error': 'hostname parameter required'}, status=400)
+    blocked = request.app['blocked']
+    try:
+        wait = min(float(request.query.get('wait', 0)), MAX_LONG_POLL)
+    except ValueError:
+        wait = 0
+    since = request.query.get('since')
+    if wait > 0 and since == blocked.version(hostname):
+        server_tray.STREAM_CLIENTS.inc()
+        try:
+            await blocked.wait(hostname, wait)
+        finally:
+            server_tray.STREAM_CLIENTS.dec()
+    return web.json_response({'blocked': blocked.get(hostname), 'version': blocked.version(hostname)})
+
+
+async def stream_events(request):
+    """text/event-stream of ingested batches: 'event: events' with a JSON list of events"""
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    await response.prepare(request)
+    broker = request.app['broker']
+    queue = broker.subscribe(request.query.get('hostname'))
+    server_tray.STREAM_CLIENTS.inc()
+    try:
+        while True:
+            try:
+                batch = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE)
+            except asyncio.TimeoutError:
+                await response.write(b': keepalive\n\n')
+                continue
+            if batch is None:
+                break
+            await response.write(f'event: events\ndata: {json.dumps(batch)}\n\n'.encode('utf-8'))
+    except ConnectionResetError:
+        pass
+    finally:
+        broker.unsubscribe(queue)
+        server_tray.STREAM_CLIENTS.dec()
+    return response
+
+
+class StreamInput:
+    """wsgi.input over the aiohttp request body, read from a reader thread
+
+    Each read waits for the event loop to deliver that much of the body, so
+    the Flask app (bulk NDJSON upload, ...) parses it as it arrives instead
+    of the whole body being buffered first.
+    """
+
+    def __init__(self, content, loop):
+        self.content = content
+        self.loop = loop
+
+    def _wait(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return self._wait(self.content.read())
+        return self._wait(self.content.read(size))
+
+    def readline(self, size=-1):
+        line = self._wait(self.content.readline())
+        return line if size is None or size < 0 else line[:size]
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+
+def call_wsgi(environ):
+    """Start the Flask app; returns (status, headers, body start, (rest of the body, result) or None)
+
+    Up to WSGI_BUFFER bytes are collected here; larger bodies (exports) are
+    passed on as an iterator for wsgi_fallback to stream.
+    """
+    captured = []
+
+    def start_response(status, headers, exc_info=None):
+        captured[:] = [status, headers]
+
+    result = server_tray.app(environ, start_response)
+    chunks = iter(result)
+    body = []
+    size = 0
+    try:
+        for chunk in chunks:
+            body.append(chunk)
+            size += len(chunk)
+            if size >= WSGI_BUFFER:
+                return captured[0], captured[1], b''.join(body), (chunks, result)
+    except BaseException:
+        close_wsgi(result)
+        raise
+    close_wsgi(result)
+    return captured[0], captured[1], b''.join(body), None
+
+
+def close_wsgi(result):
+    if hasattr(result, 'close'):
+        result.close()
+
+
+def next_chunk(chunks):
+    return next(chunks, None)
+
+
+async def wsgi_fallback(request):
+    """Serve any other route with the server_tray Flask app on the reader pool
+
+    The request body is streamed to the app (StreamInput) and large
+    response bodies are streamed back, so neither is held in memory whole.
+    """
+    loop = asyncio.get_running_loop()
+    raw_path = request.raw_path.split('?', 1)[0]
+    environ = {
+        'REQUEST_METHOD': request.method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': unquote_to_bytes(raw_path).decode('latin-1'),
+        'QUERY_STRING': request.query_string,
+        'SERVER_NAME': request.host.split(':')[0],
+        'SERVER_PORT': str(request.app['port']),
+        'SERVER_PROTOCOL': f'HTTP/{request.version.major}.{request.version.minor}',
+        'REMOTE_ADDR': request.remote or '',
+        'CONTENT_TYPE': request.headers.get('Content-Type', ''),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': request.scheme,
+        'wsgi.input': StreamInput(request.content, loop),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    if request.content_length is not None and 'Content-Encoding' not in request.headers:
+        environ['CONTENT_LENGTH'] = str(request.content_length)
+    else:
+        # Chunked or compressed upload (aiohttp inflates it, so the length does not hold):
+        # aiohttp ends the stream, so the app may read it without a length
+        environ['wsgi.input_terminated'] = True
+    for name in request.headers.keys():
+        key = 'HTTP_' + name.upper().replace('-', '_')
+        # aiohttp has already decoded a gzip/deflate body, so its Content-Encoding no longer applies
+        if key not in ('HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH', 'HTTP_CONTENT_ENCODING'):
+            environ[key] = ','.join(request.headers.getall(name))
+    readers = request.app['readers']
+    status, headers, payload, rest = await loop.run_in_executor(readers, call_wsgi, environ)
+    status = int(status.split(' ', 1)[0])
+    headers = CIMultiDict((k, v) for k, v in headers if k.lower() not in HOP_HEADERS)
+    if rest is None:
+        return web.Response(status=status, body=payload, headers=headers)
+
+    response = web.StreamResponse(status=status, headers=headers)
+    chunks, result = rest
+    try:
+        await response.prepare(request)
+        await response.write(payload)
+        while True:
+            chunk = await loop.run_in_executor(readers, next_chunk, chunks)
+            if chunk is None:
+                break
+            await response.write(chunk)
+        await response.write_eof()
+    finally:
+        await loop.run_in_executor(readers, close_wsgi, result)
+    return response
+
+
+async def refresh_blocked_sites(app):
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            app['blocked'].update(await loop.run_in_executor(app['readers'], read_blocked_sites))
+        except Exception as e:
+            print(f"Blocked sites refresh failed: {e}")
+        await asyncio.sleep(BLOCKED_REFRESH)
+
+
+async def refresh_device_count(app):
+    """server_tray runs this after every ingest request; here it is rate limited"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(DEVICE_COUNT_INTERVAL)
+        try:
+            await loop.run_in_executor(app['readers'], server_tray.update_device_count)
+        except Exception as e:
+            print(f"Device count refresh failed: {e}")
+
+
+async def start_background(app):
+    await app['writer'].start()
+    server_tray.writer_client = app['writer']
+    app['tasks'] = [asyncio.create_task(refresh_blocked_sites(app)),
+                    asyncio.create_task(refresh_device_count(app))]
+
+
+async def stop_background(app):
+    for task in app['tasks']:
+        task.cancel()
+    server_tray.writer_client = None
+    await app['writer'].stop()
+    app['readers'].shutdown(wait=False)
+
+
+def create_app(port=5000):
+    server_tray.init_db()
+    # Body limit of the native /api/events; the Flask routes read their body as a stream
+    app = web.Application(middlewares=[native_middleware], client_max_size=256 * 1024 * 1024)
+    app['port'] = port
+    app['writer'] = AsyncWriter(server_tray.app.config['DATABASE'], server_tray.shard_set)
+    app['broker'] = Broker()
+    app['blocked'] = BlockedSites()
+    app['readers'] = ThreadPoolExecutor(max_workers=READER_THREADS, thread_name_prefix='reader')
+    app.router.add_post('/api/events', receive_events)
+    app.router.add_get('/api/blocked_sites', get_blocked_sites)
+    app.router.add_get('/api/stream', stream_events)
+    app.router.add_route('*', '/{tail:.*}', wsgi_fallback, name='wsgi')
+    app.on_startup.append(start_background)
+    app.on_cleanup.append(stop_background)
+    return app
+
+
+def raise_open_file_limit():
+    """Each idle connection is a file descriptor; lift the soft limit to the hard one"""
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Activity Logger Server (asyncio)')
+    parser.add_argument('--host', default='0.0.0.0', help='Host to bind to')
+    parser.add_argument('--port', type=int, default=5000, help='Port to bind to')
+    parser.add_argument('--auth-key', help='Authentication key')
+    parser.add_argument('--license-key', help='License key')
+    parser.add_argument('--db', help='Database path (default activity_logs.db)')
+    parser.add_argument('--shards', type=int, default=1, help='Split storage by hostname across N databases')
+    parser.add_argument('--keepalive', type=float, default=75.0, help='Idle keep-alive timeout in seconds')
+    alerts.add_arguments(parser)
+    tail_buffer.add_arguments(parser)
+    args = parser.parse_args(argv)
+    try:
+        alert_options = alerts.options_from_args(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if web is None:
+        print("Missing dependency: aiohttp")
+        print("Install with: pip install aiohttp")
+        return 1
+
+    if args.auth_key:
+        server_tray.app.config['AUTH_KEY'] = args.auth_key
+    if args.license_key:
+        server_tray.app.config['LICENSE_KEY'] = args.license_key
+        server_tray.app.config['SESSION_START'] = datetime.now()
+    if args.db:
+        server_tray.app.config['DATABASE'] = args.db
+    if args.shards > 1:
+        import shards
+        server_tray.shard_set = shards.ShardSet(server_tray.app.config['DATABASE'], args.shards)
+    if alert_options:
+        server_tray.start_alerts(alert_options)
+    server_tray.tail = tail_buffer.from_args(args)
+
+    raise_open_file_limit()
+    web.run_app(create_app(args.port), host=args.host, port=args.port,
+                keepalive_timeout=args.keepalive, backlog=4096, access_log=None)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""
+bench_aggregation.py
+
+Replays synthetic tray agent streams (synth.py, with browser title churn and
+an agent_health event per minute) through activity_logger_tray's
+ActivityAggregator and compares what the server receives and computes:
+
+    - events and JSON bytes sent, raw vs aggregate mode,
+    - the per-host sessions (sessionizer.HostSessions): active seconds per
+      app and domain, session count, AFK seconds,
+    - with --db, the daily summaries both streams produce when stored
+      through event_store (active/AFK/idle seconds, keys, sessions).
+
+Usage:
+    python benchmarks/bench_aggregation.py --hosts 20 --days 2 --title-churn 6
+    python benchmarks/bench_aggregation.py --hosts 5 --days 1 --db
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import activity_logger_tray  # noqa: E402
+import daily_summary  # noqa: E402
+import event_store  # noqa: E402
+import sessionizer  # noqa: E402
+import synth  # noqa: E402
+
+HEALTH_INTERVAL = 60
+# Longer gaps between a host's events are the nights between simulated days (agent not running)
+DAY_GAP = 3 * 3600
+
+
+class Collector:
+    """EventQueue stand-in that keeps what would be sent"""
+
+    def __init__(self):
+        self.events = []
+
+    def add_event(self, event):
+        self.events.append(event)
+
+
+def host_streams(hosts, days, hours, seed, title_churn):
+    """{hostname: raw events in time order}, with agent_health every HEALTH_INTERVAL seconds"""
+    start = datetime(2026, 10, 1, 8, tzinfo=timezone.utc)
+    streams = {}
+    for event in synth.generate_events(hosts, days, hours, seed, start=start, title_churn=title_churn):
+        streams.setdefault(event['hostname'], []).append(event)
+    for hostname, events in streams.items():
+        events.sort(key=lambda event: sessionizer.epoch(event['timestamp']))
+        times = [sessionizer.epoch(event['timestamp']) for event in events]
+        health = []
+        for previous, current in zip(times, times[1:]):
+            if current - previous < DAY_GAP:
+                for at in range(int(previous) // HEALTH_INTERVAL + 1, int(current) // HEALTH_INTERVAL + 1):
+                    health.append({'type': 'agent_health', 'hostname': hostname, 'queue_depth': 0,
+                                   'agent_version': activity_logger_tray.AGENT_VERSION,
+                                   'timestamp': datetime.fromtimestamp(at * HEALTH_INTERVAL, timezone.utc).isoformat()})
+        events.extend(health)
+        events.sort(key=lambda event: sessionizer.epoch(event['timestamp']))
+    return streams
+
+
+def aggregate(hostname, events, interval):
+    sink = Collector()
+    aggregator = activity_logger_tray.ActivityAggregator(sink, hostname=hostname, interval=interval)
+    for event in events:
+        aggregator.add_event(event)
+    aggregator.flush(sessionizer.epoch(events[-1]['timestamp']))
+    return sink.events
+
+
+def session_totals(events):
+    """Per-app/domain active seconds, sessions and AFK seconds from one host's stream"""
+    host = sessionizer.HostSessions()
+    for event in sorted(events, key=lambda event: sessionizer.epoch(event['timestamp'])):
+        host.feed(sessionizer.epoch(event['timestamp']), event['type'], event)
+    host.close(host.last_seen)
+    apps, sites = {}, {}
+    afk = 0.0
+    for app, domain, start, end, active in host.closed:
+        apps[app] = apps.get(app, 0.0) + active
+        if domain:
+            sites[domain] = sites.get(domain, 0.0) + active
+        afk += end - start - active
+    afk += sum(end - start for start, end in host.away)
+    keys = sum(event.get(daily_summary.KEY_FIELDS[event['type']]) or 0
+               for event in events if event['type'] in daily_summary.KEY_FIELDS)
+    return {'apps': apps, 'domains': sites, 'sessions': len(host.closed), 'afk_seconds': afk, 'keys': keys}
+
+
+def largest_difference(a, b):
+    return max((abs(a.get(name, 0.0) - b.get(name, 0.0)) for name in set(a) | set(b)), default=0.0)
+
+
+def stored_summaries(streams):
+    """daily_summaries rows after storing the streams through event_store, keyed by (hostname, day)"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        event_store.init_db(path)
+        conn = sqlite3.connect(path)
+        interner = event_store.StringInterner()
+        cursor = conn.cursor()
+        started = time.perf_counter()
+        for events in streams.values():
+            for i in range(0, len(events), 500):
+                event_store.store_events(cursor, events[i:i + 500], interner)
+        conn.commit()
+        elapsed = time.perf_counter() - started
+        size = os.path.getsize(path)
+        rows = {}
+        for hostname, day, active, afk, keys, sessions in cursor.execute('''
+                SELECT h.value, s.day, s.active_seconds, s.afk_seconds, s.key_count, s.sessions
+                FROM daily_summaries s JOIN hosts h ON h.id = s.host_id'''):
+            rows[(hostname, day)] = (active, afk, keys, sessions)
+        conn.close()
+        return rows, elapsed, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Raw vs agent-aggregated event streams')
+    parser.add_argument('--hosts', type=int, default=20)
+    parser.add_argument('--days', type=int, default=2)
+    parser.add_argument('--hours', type=float, default=8.0, help='Simulated hours per day')
+    parser.add_argument('--title-churn', type=float, default=6.0,
+                        help='Browser title changes per minute while a browser is focused')
+    parser.add_argument('--interval', type=int, default=60, help='Seconds per aggregated record')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--db', action='store_true', help='Also store both streams and compare daily summaries')
+    parser.add_argument('--out', help='Write results JSON to this file')
+    args = parser.parse_args()
+
+    streams = host_streams(args.hosts, args.days, args.hours, args.seed, args.title_churn)
+    started = time.perf_counter()
+    aggregated = {hostname: aggregate(hostname, events, args.interval) for hostname, events in streams.items()}
+    aggregate_s = time.perf_counter() - started
+
+    raw_events = sum(len(events) for events in streams.values())
+    agg_events = sum(len(events) for events in aggregated.values())
+    raw_bytes = sum(len(json.dumps(event)) for events in streams.values() for event in events)
+    agg_bytes = sum(len(json.dumps(event)) for events in aggregated.values() for event in events)
+    print(f"raw:        {raw_events:10,} events {raw_bytes / 1e6:10.2f} MB")
+    print(f"aggregated: {agg_events:10,} events {agg_bytes / 1e6:10.2f} MB "
+          f"({raw_events / agg_events:.1f}x fewer events, {raw_bytes / agg_bytes:.1f}x fewer bytes; "
+          f"{raw_events / aggregate_s:,.0f} events/s folded)")
+
+    worst = {'app_seconds': 0.0, 'domain_seconds': 0.0, 'afk_seconds': 0.0, 'sessions': 0, 'keys': 0}
+    for hostname, events in streams.items():
+        raw = session_totals(events)
+        agg = session_totals(aggregated[hostname])
+        worst['app_seconds'] = max(worst['app_seconds'], largest_difference(raw['apps'], agg['apps']))
+        worst['domain_seconds'] = max(worst['domain_seconds'], largest_difference(raw['domains'], agg['domains']))
+        worst['afk_seconds'] = max(worst['afk_seconds'], abs(raw['afk_seconds'] - agg['afk_seconds']))
+        worst['sessions'] = max(worst['sessions'], abs(raw['sessions'] - agg['sessions']))
+        worst['keys'] = max(worst['keys'], abs(raw['keys'] - agg['keys']))
+    print("largest per-host difference: " + ", ".join(f"{name} {value:g}" for name, value in worst.items()))
+    results = {'config': vars(args), 'raw_events': raw_events, 'aggregated_events': agg_events,
+               'raw_bytes': raw_bytes, 'aggregated_bytes': agg_bytes, 'max_diff': worst}
+
+    if args.db:
+        raw_rows, raw_s, raw_size = stored_summaries(streams)
+        agg_rows, agg_s, agg_size = stored_summaries(aggregated)
+        print(f"stored raw in {raw_s:.2f}s ({raw_size / 1e6:.1f} MB), "
+              f"aggregated in {agg_s:.2f}s ({agg_size / 1e6:.1f} MB)")
+        fields = ('active_seconds', 'afk_seconds', 'key_count', 'sessions')
+        diffs = {field: max((abs(raw_rows[key][i] - agg_rows.get(key, (0, 0, 0, 0))[i]) for key in raw_rows),
+                            default=0) for i, field in enumerate(fields)}
+        print("daily_summaries, largest per-day difference: "
+              + ", ".join(f"{field} {value:g}" for field, value in diffs.items()))
+        results.update({'raw_store_s': raw_s, 'aggregated_store_s': agg_s, 'raw_db_bytes': raw_size,
+                        'aggregated_db_bytes': agg_size, 'summary_max_diff': diffs})
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+bench_analytics.py
+
+Per-host metrics with analytics.py (vectorized) vs the per-event row loop
+(sessionizer.HostSessions fed one event dict at a time, as ingest does) on
+the same synthetic events, and checks that active seconds agree.
+
+Events are generated directly as arrays (no database), so 10M events fit in
+memory; the row loop walks them in chunks and builds an event dict per row.
+It does not pay for json.loads of stored payloads, so it is the optimistic
+end of what a Python loop over the events table costs.
+
+Usage:
+    python benchmarks/bench_analytics.py --events 10000000 --hosts 500
+    python benchmarks/bench_analytics.py --events 1000000 --skip-loop
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+import analytics  # noqa: E402
+import sessionizer  # noqa: E402
+
+APPS = ['chrome.exe', 'msedge.exe', 'Code.exe', 'EXCEL.EXE', 'OUTLOOK.EXE', 'Teams.exe', 'explorer.exe',
+        'SearchHost.exe', 'slack.exe', 'WINWORD.EXE', 'POWERPNT.EXE', 'notepad.exe']
+BROWSERS = 2
+DOMAINS = [f'site{i}.example.com' for i in range(200)]
+TYPES = {analytics.KIND_OTHER: 'screen_time', analytics.KIND_FOCUS: 'foreground_change',
+         analytics.KIND_AFK_START: 'afk_start', analytics.KIND_AFK_END: 'afk_end'}
+LOOP_CHUNK = 1000000
+
+
+def generate(events, hosts, seed):
+    """Synthetic EventArrays: ~20 s between events, occasional hour-long gaps, AFK pairs"""
+    rng = np.random.default_rng(seed)
+    host = np.sort(rng.integers(0, hosts, events)).astype(np.int32)
+    gaps = rng.exponential(20.0, events)
+    gaps[rng.random(events) < 0.002] = 3600.0
+    start = 1_790_000_000.0
+    time_ = start + np.cumsum(gaps)
+    # Restart each host's clock at the same start
+    first = np.searchsorted(host, np.arange(hosts))
+    time_ -= np.repeat(time_[first] - start, np.diff(np.append(first, events)))
+    kind = rng.choice([analytics.KIND_OTHER, analytics.KIND_FOCUS, analytics.KIND_AFK_START,
+                       analytics.KIND_AFK_END], events, p=[0.66, 0.3, 0.02, 0.02]).astype(np.int8)
+    app = np.where(kind == analytics.KIND_FOCUS, rng.integers(0, len(APPS), events), -1).astype(np.int32)
+    domain = np.where(app < BROWSERS, rng.integers(0, len(DOMAINS), events), -1).astype(np.int32)
+    # Idle time reaches back at most to the previous event (input resets the idle timer)
+    duration = np.where(kind == analytics.KIND_AFK_START, np.minimum(rng.uniform(30, 900, events), gaps), 0.0)
+    # Arrival order, as load_window returns them
+    order = np.argsort(time_, kind='stable')
+    return analytics.EventArrays(host[order], time_[order], kind[order], app[order], domain[order], duration[order],
+                                 [f'DESKTOP-{i:04d}' for i in range(hosts)], APPS, DOMAINS)
+
+
+def row_loop(events):
+    """Active seconds per host and app via HostSessions, one event dict per row"""
+    sessions = {}
+    for offset in range(0, len(events), LOOP_CHUNK):
+        rows = slice(offset, offset + LOOP_CHUNK)
+        for host, at, kind, app, domain, duration in zip(
+                events.host[rows].tolist(), events.time[rows].tolist(), events.kind[rows].tolist(),
+                events.app[rows].tolist(), events.domain[rows].tolist(), events.duration[rows].tolist()):
+            event = {}
+            if app >= 0:
+                event['process_name'] = events.app_names[app]
+            if domain >= 0:
+                event['url'] = f'https://{events.domain_names[domain]}/'
+            if duration:
+                event['idle_seconds'] = duration
+            state = sessions.get(host)
+            if state is None:
+                state = sessions[host] = sessionizer.HostSessions()
+            state.feed(at, TYPES[kind], event)
+    results = {}
+    for host, state in sessions.items():
+        state.close(state.last_seen)
+        apps = {}
+        for app, _, _, _, seconds in state.closed:
+            apps[app] = apps.get(app, 0.0) + seconds
+        results[events.host_names[host]] = {'active_seconds': sum(apps.values()), 'apps': apps}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Vectorized vs row-loop per-host metrics')
+    parser.add_argument('--events', type=int, default=10_000_000)
+    parser.add_argument('--hosts', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--skip-loop', action='store_true', help='Only time the vectorized path')
+    parser.add_argument('--out', help='Write results JSON to this file')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    events = generate(args.events, args.hosts, args.seed)
+    print(f"Generated {len(events):,} events for {args.hosts} hosts in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    metrics = analytics.host_metrics(events, categories=lambda name: 'browser' if name in APPS[:BROWSERS] else None)
+    vectorized_s = time.perf_counter() - start
+    print(f"vectorized: {vectorized_s:8.2f}s ({len(events) / vectorized_s:,.0f} events/s)")
+    results = {'config': vars(args), 'vectorized_s': vectorized_s}
+
+    if not args.skip_loop:
+        start = time.perf_counter()
+        reference = row_loop(events)
+        loop_s = time.perf_counter() - start
+        print(f"row loop:   {loop_s:8.2f}s ({len(events) / loop_s:,.0f} events/s) -> "
+              f"{loop_s / vectorized_s:.1f}x faster vectorized")
+        worst = max(abs(host['active_seconds'] - reference[host['hostname']]['active_seconds'])
+                    for host in metrics)
+        total = sum(host['active_seconds'] for host in metrics)
+        print(f"active seconds: {total:,.0f} total, largest per-host difference {worst:.1f}s")
+        results.update({'loop_s': loop_s, 'speedup': loop_s / vectorized_s, 'max_diff_s': worst})
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
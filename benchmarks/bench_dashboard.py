@@ -0,0 +1,217 @@
+"""
+bench_dashboard.py
+
+Times every dashboard/read endpoint of server_tray.py through the Flask test
+client against a large generated database (synth.py streams loaded with
+bulk_import.py), and prints EXPLAIN QUERY PLAN for each SQL statement the
+endpoints run so full-table scans show up as regressions.
+
+The database is generated once and reused while --hosts/--days/--seed match.
+
+Usage:
+    python benchmarks/bench_dashboard.py --hosts 500 --days 30 --out dashboard.json
+    python benchmarks/bench_dashboard.py --db big.db --compare dashboard.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bulk_import  # noqa: E402
+import server_tray  # noqa: E402
+from synth import generate_events, host_names  # noqa: E402
+
+
+def dashboard_requests(hostname):
+    """(name, url) for every read endpoint, with filters and a deep page"""
+    return [
+        ('stats', '/api/dashboard/stats'),
+        ('devices', '/api/dashboard/devices'),
+        ('timeline 24h', '/api/dashboard/activity_timeline?hours=24'),
+        ('timeline 7d host', f'/api/dashboard/activity_timeline?hours=168&hostname={hostname}'),
+        ('top_domains 24h', '/api/dashboard/top_domains?hours=24'),
+        ('top_domains 7d host', f'/api/dashboard/top_domains?hours=168&hostname={hostname}'),
+        ('recent_events', '/api/dashboard/recent_events'),
+        ('recent_events type', '/api/dashboard/recent_events?type=foreground_change'),
+        ('recent_events host', f'/api/dashboard/recent_events?hostname={hostname}&hours=168'),
+        ('recent_events app', '/api/dashboard/recent_events?app=chrome.exe'),
+        ('recent_events deep page', '/api/dashboard/recent_events?page=200&limit=50&hours=168'),
+        ('device_activity', f'/api/dashboard/device_activity?hostname={hostname}&hours=168'),
+        ('legacy stats', '/api/stats'),
+        ('legacy devices', '/api/devices'),
+        ('legacy recent-events', f'/api/recent-events?hostname={hostname}'),
+        ('legacy activity-timeline', '/api/activity-timeline?hours=24'),
+        ('legacy top-domains', '/api/top-domains?hours=24'),
+    ]
+
+
+def synth_blocks(hosts, days, seed, block_lines=bulk_import.BLOCK_LINES):
+    block = []
+    for event in generate_events(hosts=hosts, days=days, seed=seed):
+        block.append(json.dumps(event).encode('utf-8'))
+        if len(block) >= block_lines:
+            yield block
+            block = []
+    if block:
+        yield block
+
+
+def ensure_database(path, hosts, days, seed, workers, regenerate):
+    params = {'hosts': hosts, 'days': days, 'seed': seed}
+    params_path = path + '.params.json'
+    if not regenerate and os.path.exists(path) and os.path.exists(params_path):
+        with open(params_path, encoding='utf-8') as f:
+            if json.load(f) == params:
+                print(f"Reusing {path}")
+                return
+    for p in (path, params_path):
+        if os.path.exists(p):
+            os.remove(p)
+    print(f"Generating {path} ({hosts} hosts x {days} days)...")
+    report = bulk_import.Importer(path, workers=workers).run_blocks(synth_blocks(hosts, days, seed))
+    bulk_import.print_report(report)
+    with open(params_path, 'w', encoding='utf-8') as f:
+        json.dump(params, f)
+
+
+class QueryCapture:
+    """Records the (parameter-expanded) SELECTs run on server_tray's connections"""
+
+    def __init__(self):
+        self.enabled = False
+        self.statements = []
+        self.get_db = server_tray.get_db
+        server_tray.get_db = self.traced_get_db
+
+    def traced_get_db(self):
+        conn = self.get_db()
+        conn.set_trace_callback(self.trace)
+        return conn
+
+    def trace(self, sql):
+        if self.enabled and sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+            self.statements.append(sql)
+
+
+def explain(db_path, statements):
+    conn = sqlite3.connect(db_path)
+    plans = []
+    for sql in statements:
+        try:
+            rows = conn.execute('EXPLAIN QUERY PLAN ' + sql).fetchall()
+            plan = [row[-1] for row in rows]
+        except sqlite3.Error as e:
+            plan = [f'error: {e}']
+        plans.append({'sql': ' '.join(sql.split()), 'plan': plan})
+    conn.close()
+    return plans
+
+
+def is_scan(line):
+    # "SCAN events" without an index is a full table scan; covering index scans are fine
+    return line.startswith('SCAN') and 'INDEX' not in line and 'CONSTANT ROW' not in line
+
+
+def run(db_path, repeat, hostname):
+    server_tray.app.config['DATABASE'] = db_path
+    server_tray.app.config['LICENSE_KEY'] = server_tray.VALID_LICENSE
+    capture = QueryCapture()
+    client = server_tray.app.test_client()
+
+    results = []
+    for name, url in dashboard_requests(hostname):
+        capture.statements = []
+        capture.enabled = True
+        resp = client.get(url)
+        capture.enabled = False
+        statements = capture.statements
+
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            client.get(url)
+            times.append((time.perf_counter() - start) * 1000)
+        results.append({
+            'name': name,
+            'url': url,
+            'status': resp.status_code,
+            'bytes': len(resp.data),
+            'ms_min': min(times),
+            'ms_median': statistics.median(times),
+            'ms_max': max(times),
+            'queries': explain(db_path, statements),
+        })
+    return results
+
+
+def print_results(results, show_plans=True):
+    print(f"{'endpoint':<26}{'status':>7}{'KB':>9}{'min ms':>10}{'median ms':>11}{'max ms':>10}{'scans':>7}")
+    for r in results:
+        scans = sum(1 for q in r['queries'] for line in q['plan'] if is_scan(line))
+        print(f"{r['name']:<26}{r['status']:>7}{r['bytes'] / 1024:>9.1f}{r['ms_min']:>10.1f}"
+              f"{r['ms_median']:>11.1f}{r['ms_max']:>10.1f}{scans:>7}")
+    if not show_plans:
+        return
+    for r in results:
+        print()
+        print(f"== {r['name']}: {r['url']}")
+        for q in r['queries']:
+            print(f"  {q['sql'][:200]}")
+            for line in q['plan']:
+                marker = '!' if is_scan(line) else ' '
+                print(f"   {marker} {line}")
+
+
+def print_comparison(results, baseline):
+    old = {r['name']: r for r in baseline['results']}
+    print()
+    print(f"{'endpoint':<26}{'before ms':>11}{'after ms':>11}{'change':>9}")
+    for r in results:
+        before = old.get(r['name'])
+        if not before:
+            continue
+        change = (r['ms_median'] - before['ms_median']) / before['ms_median'] if before['ms_median'] else 0.0
+        print(f"{r['name']:<26}{before['ms_median']:>11.1f}{r['ms_median']:>11.1f}{change:>+9.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dashboard endpoint latency and query plan benchmark')
+    parser.add_argument('--db', default=os.path.join(tempfile.gettempdir(), 'bench_dashboard.db'))
+    parser.add_argument('--hosts', type=int, default=500)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=None, help='Parser processes for generation')
+    parser.add_argument('--regenerate', action='store_true', help='Rebuild the database even if it matches')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed requests per endpoint')
+    parser.add_argument('--no-plans', action='store_true', help='Only print the latency table')
+    parser.add_argument('--out', help='Write results JSON to this file')
+    parser.add_argument('--compare', help='Results JSON from an earlier run to compare against')
+    args = parser.parse_args()
+
+    ensure_database(args.db, args.hosts, args.days, args.seed, args.workers, args.regenerate)
+    conn = sqlite3.connect(args.db)
+    events = conn.execute('SELECT COUNT(*) FROM events').fetchone()[0]
+    conn.close()
+    print(f"Database: {args.db} ({events:,} events, {os.path.getsize(args.db) / 1e9:.2f} GB)")
+
+    hostname = host_names(args.hosts)[args.hosts // 2]
+    results = run(args.db, args.repeat, hostname)
+    print_results(results, show_plans=not args.no_plans)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            print_comparison(results, json.load(f))
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({'events': events, 'hosts': args.hosts, 'days': args.days, 'results': results}, f, indent=2)
+        print(f"Results saved to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
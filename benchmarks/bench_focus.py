@@ -0,0 +1,245 @@
+"""
+bench_focus.py
+
+Replays foreground window timelines through activity_logger_tray's
+ForegroundWatcher, polled every --poll seconds, once as the agent used to
+report them (no title rules, no settle time) and once with TitleRules and
+focus_settle_ms, and compares:
+
+    - foreground_change + screen_time events and JSON bytes sent,
+    - focused seconds per process against the timeline itself, from the
+      foreground_change timestamps (as the server's sessions count them)
+      and from the screen_time durations,
+    - the same against the timeline without the added flickers, i.e. the
+      windows the user meant to work in.
+
+Timelines come from the foreground_change events of a recorded stream
+(--events: JSONL as in test_activity.jsonl or the agent's fallback file)
+or from synth.py with browser title churn; --flickers adds brief switches
+to the taskbar/search (alt-tab passes) that last under --flicker-max seconds.
+A host's stream is cut where it goes quiet for DAY_GAP (the agent was not
+running); each part is replayed from a fresh watcher and ends at its last event.
+
+Usage:
+    python benchmarks/bench_focus.py --hosts 10 --days 2 --title-churn 6 --flickers 20
+    python benchmarks/bench_focus.py --events test_activity.jsonl --settle-ms 2000
+"""
+import argparse
+import bisect
+import configparser
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import activity_logger_tray  # noqa: E402
+import sessionizer  # noqa: E402
+import synth  # noqa: E402
+
+DAY_GAP = 3 * 3600
+FLICKER_WINDOWS = [
+    {'title': '', 'process_name': 'explorer.exe', 'pid': 4242},
+    {'title': 'Search', 'process_name': 'SearchHost.exe', 'pid': 4343},
+    {'title': 'Task Switching', 'process_name': 'explorer.exe', 'pid': 4242},
+]
+
+
+class Collector:
+    """EventQueue stand-in that keeps what would be sent"""
+
+    def __init__(self):
+        self.events = []
+
+    def add_event(self, event):
+        self.events.append(event)
+
+
+def load_streams(args):
+    """{hostname: events in time order} from --events or synth.py"""
+    if args.events:
+        with open(args.events, encoding='utf-8') as f:
+            events = [json.loads(line) for line in f if line.strip()]
+    else:
+        start = datetime(2026, 10, 1, 8, tzinfo=timezone.utc)
+        events = synth.generate_events(args.hosts, args.days, args.hours, args.seed, start=start,
+                                       title_churn=args.title_churn)
+    streams = {}
+    for event in events:
+        if sessionizer.epoch(event.get('timestamp')) is not None:
+            streams.setdefault(event.get('hostname') or 'unknown', []).append(event)
+    for events in streams.values():
+        events.sort(key=lambda event: sessionizer.epoch(event['timestamp']))
+    return streams
+
+
+def timelines(events, rng, flickers, flicker_max):
+    """[(change times, windows, end)] per part of a host's stream, with flickers added"""
+    parts = []
+    changes, windows, last = [], [], None
+    for event in events:
+        at = sessionizer.epoch(event['timestamp'])
+        if last is not None and at - last > DAY_GAP:
+            if changes:
+                parts.append((changes, windows, last))
+            changes, windows = [], []
+        last = at
+        if event['type'] == 'foreground_change':
+            changes.append(at)
+            windows.append({key: event.get(key) for key in ('title', 'process_name', 'pid', 'process_path', 'url')})
+    if changes:
+        parts.append((changes, windows, last))
+    if flickers <= 0:
+        return parts
+
+    flickered = []
+    for changes, windows, end in parts:
+        points = list(zip(changes, windows))
+        at = changes[0] + rng.expovariate(flickers / 3600.0)
+        while at < end:
+            length = rng.uniform(0.1, flicker_max)
+            index = bisect.bisect_right(changes, at) - 1
+            # Back to the window that had focus, unless it changes during the flicker
+            if at + length < end and (index + 1 >= len(changes) or changes[index + 1] > at + length):
+                points.append((at, rng.choice(FLICKER_WINDOWS)))
+                points.append((at + length, windows[index]))
+            at += rng.expovariate(flickers / 3600.0)
+        points.sort(key=lambda point: point[0])
+        flickered.append(([at for at, _ in points], [window for _, window in points], end))
+    return flickered
+
+
+def true_seconds(changes, windows, end):
+    seconds = {}
+    for i, at in enumerate(changes):
+        until = changes[i + 1] if i + 1 < len(changes) else end
+        name = windows[i]['process_name']
+        seconds[name] = seconds.get(name, 0.0) + until - at
+    return seconds
+
+
+def replay(changes, windows, end, poll, rules, phase):
+    """Events a ForegroundWatcher sends when polling the timeline every `poll` seconds"""
+    sink = Collector()
+    watcher = activity_logger_tray.ForegroundWatcher(sink, poll_interval=poll, hostname='replay', title_rules=rules)
+    at = changes[0] + phase
+    with contextlib.redirect_stdout(io.StringIO()):
+        while at < end:
+            window = windows[bisect.bisect_right(changes, at) - 1]
+            watcher.observe(window, datetime.fromtimestamp(at, timezone.utc))
+            at += poll
+        watcher.emit_screen_time(datetime.fromtimestamp(end, timezone.utc))
+    return sink.events
+
+
+def reported_seconds(events, end):
+    """(per-process seconds between foreground_change timestamps, per-process screen_time seconds)"""
+    focus, screen = {}, {}
+    changes = [event for event in events if event['type'] == 'foreground_change']
+    for i, event in enumerate(changes):
+        at = sessionizer.epoch(event['timestamp'])
+        until = sessionizer.epoch(changes[i + 1]['timestamp']) if i + 1 < len(changes) else end
+        focus[event['process_name']] = focus.get(event['process_name'], 0.0) + until - at
+    for event in events:
+        if event['type'] == 'screen_time':
+            screen[event['process_name']] = screen.get(event['process_name'], 0) + event['duration_seconds']
+    return focus, screen
+
+
+def add_into(total, part):
+    for name, value in part.items():
+        total[name] = total.get(name, 0.0) + value
+
+
+def errors(truth, measured):
+    """(largest per-process difference in seconds, summed absolute difference / total seconds)"""
+    names = set(truth) | set(measured)
+    diffs = [abs(truth.get(name, 0.0) - measured.get(name, 0.0)) for name in names]
+    total = sum(truth.values()) or 1.0
+    return max(diffs, default=0.0), sum(diffs) / total
+
+
+def rules_from(args):
+    if args.config:
+        config = configparser.ConfigParser()
+        config.read(args.config)
+        rules = activity_logger_tray.TitleRules.from_config(config)
+        if args.settle_ms is not None:
+            rules.settle_seconds = args.settle_ms / 1000.0
+        return rules
+    settle_ms = 1000 if args.settle_ms is None else args.settle_ms
+    return activity_logger_tray.TitleRules(None, settle_ms / 1000.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Foreground window events with and without title rules/debouncing')
+    parser.add_argument('--events', help='Recorded JSONL event stream to replay (default: synth.py)')
+    parser.add_argument('--hosts', type=int, default=10)
+    parser.add_argument('--days', type=int, default=2)
+    parser.add_argument('--hours', type=float, default=8.0, help='Simulated hours per day')
+    parser.add_argument('--title-churn', type=float, default=6.0,
+                        help='Browser title changes per minute while a browser is focused')
+    parser.add_argument('--flickers', type=float, default=20.0, help='Brief focus switches added per hour')
+    parser.add_argument('--flicker-max', type=float, default=1.5, help='Longest flicker, seconds')
+    parser.add_argument('--poll', type=float, default=1.0, help='Agent poll_interval, seconds')
+    parser.add_argument('--settle-ms', type=float, help='focus_settle_ms (default 1000, or the config file)')
+    parser.add_argument('--config', help='Agent config.ini to take [TitleRules] and focus_settle_ms from')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help='Write results JSON to this file')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    baseline_rules = activity_logger_tray.TitleRules({}, 0.0)
+    rules = rules_from(args)
+    truth, intended = {}, {}
+    counts, sizes, timings = {'baseline': 0, 'debounced': 0}, {'baseline': 0, 'debounced': 0}, {}
+    measured = {'baseline': ({}, {}), 'debounced': ({}, {})}
+    for events in load_streams(args).values():
+        for changes, windows, end in timelines(events, rng, 0, args.flicker_max):
+            add_into(intended, true_seconds(changes, windows, end))
+        for changes, windows, end in timelines(events, rng, args.flickers, args.flicker_max):
+            add_into(truth, true_seconds(changes, windows, end))
+            phase = rng.uniform(0, args.poll)
+            for mode, mode_rules in (('baseline', baseline_rules), ('debounced', rules)):
+                started = time.perf_counter()
+                sent = replay(changes, windows, end, args.poll, mode_rules, phase)
+                timings[mode] = timings.get(mode, 0.0) + time.perf_counter() - started
+                counts[mode] += len(sent)
+                sizes[mode] += sum(len(json.dumps(event)) for event in sent)
+                focus, screen = reported_seconds(sent, end)
+                add_into(measured[mode][0], focus)
+                add_into(measured[mode][1], screen)
+
+    if not truth:
+        print("No foreground_change events to replay")
+        return
+    results = {'config': vars(args), 'focused_hours': sum(truth.values()) / 3600}
+    print(f"replayed {results['focused_hours']:,.1f} focused hours, polled every {args.poll:g}s, "
+          f"settle {rules.settle_seconds * 1000:g} ms")
+    for mode in ('baseline', 'debounced'):
+        print(f"{mode + ':':11} {counts[mode]:9,} events {sizes[mode] / 1e6:8.2f} MB, replayed in {timings[mode]:.2f}s")
+        results[mode] = {'events': counts[mode], 'bytes': sizes[mode], 'replay_s': timings[mode]}
+        for reference, seconds in (('timeline', truth), ('without flickers', intended)):
+            focus_max, focus_rel = errors(seconds, measured[mode][0])
+            screen_max, screen_rel = errors(seconds, measured[mode][1])
+            print(f"    per-process error vs {reference + ':':17} foreground_change {focus_max:7.1f}s max "
+                  f"{focus_rel:7.3%}, screen_time {screen_max:7.1f}s max {screen_rel:7.3%}")
+            results[mode][reference] = {'focus_max_s': focus_max, 'focus_rel': focus_rel,
+                                        'screen_time_max_s': screen_max, 'screen_time_rel': screen_rel}
+    print(f"{counts['baseline'] / max(counts['debounced'], 1):.1f}x fewer events, "
+          f"{sizes['baseline'] / max(sizes['debounced'], 1):.1f}x fewer bytes")
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+bench_shards.py
+
+Ingest scaling with the number of hostname shards (shards.py).
+
+Synthetic agent batches (one host per batch, like activity_logger_tray.py
+sends them) are pushed by concurrent producer threads straight into a
+ShardSet, skipping HTTP, so the numbers show the storage layer alone. Each
+shard count runs on fresh files.
+
+--synchronous FULL fsyncs every commit, which is where one database file
+hits the disk's fsync rate and extra shards help most.
+
+Usage:
+    python benchmarks/bench_shards.py --shards 1 2 4 8 --hosts 200 --producers 32
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import shards  # noqa: E402
+import write_coordinator  # noqa: E402
+from synth import generate_events  # noqa: E402
+
+
+def make_batches(hosts, days, batch_size):
+    """Per-host batches, interleaved across hosts the way a live fleet sends them"""
+    per_host = {}
+    for event in generate_events(hosts=hosts, days=days, hours_per_day=2.0):
+        per_host.setdefault(event['hostname'], []).append(event)
+    queues = [[events[i:i + batch_size] for i in range(0, len(events), batch_size)] for events in per_host.values()]
+    batches = []
+    for round_index in range(max(len(q) for q in queues)):
+        for q in queues:
+            if round_index < len(q):
+                batches.append(q[round_index])
+    return batches
+
+
+def run(count, batches, producers, workdir):
+    shard_set = shards.ShardSet(os.path.join(workdir, f'bench{count}.db'), count)
+    shard_set.init_db()
+    shard_set.start()
+    position = iter(range(len(batches)))
+    lock = threading.Lock()
+    latencies = []
+
+    def producer():
+        while True:
+            with lock:
+                index = next(position, None)
+            if index is None:
+                return
+            start = time.perf_counter()
+            shard_set.store_events(batches[index])
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=producer) for _ in range(producers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    events = sum(len(b) for b in batches)
+    latencies.sort()
+    stats = shard_set.stats()
+    return {
+        'shards': count,
+        'events': events,
+        'elapsed_s': elapsed,
+        'events_per_s': events / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000,
+        'commits': stats['commits'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest throughput vs number of hostname shards')
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--hosts', type=int, default=200)
+    parser.add_argument('--days', type=int, default=1)
+    parser.add_argument('--batch', type=int, default=50, help='Events per batch')
+    parser.add_argument('--producers', type=int, default=32, help='Concurrent batch senders')
+    parser.add_argument('--synchronous', default=write_coordinator.SYNCHRONOUS,
+                        choices=['OFF', 'NORMAL', 'FULL'], help='PRAGMA synchronous for the shard writers')
+    parser.add_argument('--dir', default=None, help='Directory for the shard files (default: temp)')
+    parser.add_argument('--out', help='Write results JSON to this file')
+    args = parser.parse_args()
+
+    write_coordinator.SYNCHRONOUS = args.synchronous
+    batches = make_batches(args.hosts, args.days, args.batch)
+    print(f"{sum(len(b) for b in batches):,} events in {len(batches):,} batches, {args.hosts} hosts, "
+          f"{args.producers} producers, synchronous={args.synchronous}")
+
+    workdir = args.dir or tempfile.mkdtemp(prefix='bench_shards_')
+    results = []
+    try:
+        print(f"{'shards':>6}{'events/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'commits':>10}{'speedup':>9}")
+        for count in args.shards:
+            r = run(count, batches, args.producers, workdir)
+            results.append(r)
+            speedup = r['events_per_s'] / results[0]['events_per_s']
+            print(f"{count:>6}{r['events_per_s']:>12,.0f}{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+                  f"{r['commits']:>10,}{speedup:>8.2f}x")
+    finally:
+        if not args.dir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
+        print(f"Results saved to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+bench_storage.py
+
+Compares the legacy events layout (full hostname column + full JSON blob) with the
+current event_store.py layout (interned strings, slim/compressed payloads) on the
+same synthetic data.
+
+Reports database size and scan times: a raw read of every stored payload, a full
+decode of every event and the top-applications aggregation used by the dashboard.
+
+Usage:
+    python benchmarks/bench_storage.py --hosts 500 --days 30
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import event_store  # noqa: E402
+from synth import generate_events  # noqa: E402
+
+BATCH = 5000
+
+
+def build_legacy(path, events):
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            hostname TEXT,
+            data TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_events_timestamp ON events(timestamp)')
+    conn.execute('CREATE INDEX idx_events_type ON events(event_type)')
+    conn.execute('CREATE INDEX idx_events_hostname ON events(hostname)')
+    rows = []
+    count = 0
+    for event in events:
+        rows.append((event['timestamp'], event['type'], event.get('hostname', 'unknown'), json.dumps(event)))
+        if len(rows) >= BATCH:
+            conn.executemany('INSERT INTO events (timestamp, event_type, hostname, data) VALUES (?, ?, ?, ?)', rows)
+            count += len(rows)
+            rows = []
+    conn.executemany('INSERT INTO events (timestamp, event_type, hostname, data) VALUES (?, ?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+    return count + len(rows)
+
+
+def build_current(path, events):
+    event_store.init_db(path)
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    interner = event_store.StringInterner()
+    count = 0
+    for event in events:
+        event_store.store_event(cursor, event, interner)
+        count += 1
+        if count % BATCH == 0:
+            conn.commit()
+            interner.commit(conn)
+    conn.commit()
+    conn.close()
+    return count
+
+
+def db_size(path):
+    conn = sqlite3.connect(path)
+    conn.execute('VACUUM')
+    conn.close()
+    return os.path.getsize(path)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def scan_raw(path):
+    """Touch every row's stored payload without decoding it (page read cost)"""
+    conn = sqlite3.connect(path)
+    total = conn.execute('SELECT SUM(length(data)) FROM events').fetchone()[0]
+    conn.close()
+    return total
+
+
+def scan_legacy_full(path):
+    conn = sqlite3.connect(path)
+    total = 0
+    for hostname, data in conn.execute('SELECT hostname, data FROM events'):
+        total += len(json.loads(data))
+    conn.close()
+    return total
+
+
+def scan_current_full(path):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    total = 0
+    for row in conn.execute('SELECT * FROM events_view'):
+        total += len(event_store.decode_event(row))
+    conn.close()
+    return total
+
+
+def top_apps_legacy(path):
+    conn = sqlite3.connect(path)
+    counts = {}
+    for (data,) in conn.execute("SELECT data FROM events WHERE event_type = 'foreground_change'"):
+        name = json.loads(data).get('process_name')
+        if name:
+            counts[name] = counts.get(name, 0) + 1
+    conn.close()
+    return len(counts)
+
+
+def top_apps_current(path):
+    conn = sqlite3.connect(path)
+    counts = dict(conn.execute('''
+        SELECT process_name, COUNT(*) FROM events_view
+        WHERE event_type = 'foreground_change' GROUP BY process_name
+    ''').fetchall())
+    conn.close()
+    return len(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Event storage size/scan benchmark')
+    parser.add_argument('--hosts', type=int, default=500)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--hours-per-day', type=float, default=8.0)
+    parser.add_argument('--dir', default=None, help='Directory for the benchmark databases')
+    args = parser.parse_args()
+
+    workdir = args.dir or tempfile.mkdtemp(prefix='bench_storage_')
+    legacy_path = os.path.join(workdir, 'legacy.db')
+    current_path = os.path.join(workdir, 'current.db')
+    for path in (legacy_path, current_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+    def events():
+        return generate_events(hosts=args.hosts, days=args.days, hours_per_day=args.hours_per_day)
+
+    load_legacy, count = timed(build_legacy, legacy_path, events())
+    load_current, _ = timed(build_current, current_path, events())
+
+    results = {
+        'events': count,
+        'legacy': {'load_s': load_legacy, 'size_bytes': db_size(legacy_path)},
+        'current': {'load_s': load_current, 'size_bytes': db_size(current_path)},
+    }
+    results['legacy']['raw_scan_s'] = timed(scan_raw, legacy_path)[0]
+    results['current']['raw_scan_s'] = timed(scan_raw, current_path)[0]
+    results['legacy']['full_scan_s'] = timed(scan_legacy_full, legacy_path)[0]
+    results['current']['full_scan_s'] = timed(scan_current_full, current_path)[0]
+    results['legacy']['top_apps_s'] = timed(top_apps_legacy, legacy_path)[0]
+    results['current']['top_apps_s'] = timed(top_apps_current, current_path)[0]
+
+    print(f"Events: {count:,} ({args.hosts} hosts x {args.days} days)")
+    print(f"{'':<10}{'size MB':>10}{'load s':>10}{'raw scan s':>12}{'full scan s':>14}{'top apps s':>12}")
+    for name in ('legacy', 'current'):
+        r = results[name]
+        print(f"{name:<10}{r['size_bytes'] / 1e6:>10.1f}{r['load_s']:>10.2f}{r['raw_scan_s']:>12.2f}"
+              f"{r['full_scan_s']:>14.2f}{r['top_apps_s']:>12.3f}")
+    print(json.dumps(results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+idle_connections.py
+
+Connection-scaling check for async_server.py: opens N agent connections that
+sit in a /api/blocked_sites long-poll (the idle state of a large fleet), then
+measures /api/events latency while they are held.
+
+Usage:
+    python async_server.py --port 5000 --auth-key <key> &
+    python benchmarks/idle_connections.py --url http://127.0.0.1:5000 --auth-key <key> --connections 10000
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from urllib.parse import urlsplit
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+DEFAULT_AUTH_KEY = 'your-secret-auth-key-change-me'
+
+
+async def request(host, port, raw):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(raw)
+    await writer.drain()
+    return reader, writer
+
+
+def http(method, path, host, auth_key, body=b''):
+    head = (f'{method} {path} HTTP/1.1\r\nHost: {host}\r\nAuthorization: Bearer {auth_key}\r\n'
+            f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n')
+    return head.encode('ascii') + body
+
+
+async def read_response(reader):
+    status = await reader.readline()
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    body = await reader.readexactly(length)
+    return int(status.split()[1]), body
+
+
+async def main_async(args):
+    parts = urlsplit(args.url)
+    host, port = parts.hostname, parts.port or 80
+
+    reader, writer = await request(host, port, http('GET', '/api/blocked_sites?hostname=idle-0', host, args.auth_key))
+    status, body = await read_response(reader)
+    writer.close()
+    if status != 200:
+        print(f"/api/blocked_sites returned {status}: {body[:200]!r}")
+        return 1
+    version = json.loads(body)['version']
+
+    # Idle agents: each waits on its own long-poll until the server's wait expires
+    held = []
+    failed = 0
+    start = time.perf_counter()
+    for batch_start in range(0, args.connections, 500):
+        tasks = []
+        for i in range(batch_start, min(batch_start + 500, args.connections)):
+            path = f'/api/blocked_sites?hostname=idle-{i}&wait={args.wait}&since={version}'
+            tasks.append(request(host, port, http('GET', path, host, args.auth_key)))
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, Exception):
+                failed += 1
+            else:
+                held.append(result)
+    print(f"Opened {len(held):,} idle long-poll connections in {time.perf_counter() - start:.1f}s ({failed} failed)")
+
+    await asyncio.sleep(1)
+    event = {'type': 'key_count', 'hostname': 'idle-probe', 'count': 1,
+             'timestamp': '2025-01-01T00:00:00+00:00'}
+    body = json.dumps({'events': [event] * 50}).encode('utf-8')
+    latencies = []
+    reader, writer = await request(host, port, b'')
+    for _ in range(args.probes):
+        t = time.perf_counter()
+        writer.write(http('POST', '/api/events', host, args.auth_key, body))
+        await writer.drain()
+        status, _ = await read_response(reader)
+        latencies.append((time.perf_counter() - t) * 1000)
+        if status != 200:
+            failed += 1
+    writer.close()
+    latencies.sort()
+    print(f"/api/events with {len(held):,} idle: p50 {latencies[len(latencies) // 2]:.1f} ms, "
+          f"max {latencies[-1]:.1f} ms over {len(latencies)} requests")
+
+    still_open = sum(1 for r, w in held if not r.at_eof())
+    print(f"Connections still waiting: {still_open:,}")
+    for _, w in held:
+        w.close()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hold N idle agent connections against async_server.py')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='Server base URL')
+    parser.add_argument('--auth-key', default=DEFAULT_AUTH_KEY)
+    parser.add_argument('--connections', type=int, default=10000, help='Idle connections to hold')
+    parser.add_argument('--wait', type=float, default=120, help='Long-poll wait requested per connection')
+    parser.add_argument('--probes', type=int, default=50, help='Ingest requests timed while connections are held')
+    args = parser.parse_args()
+
+    if resource is not None:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        if hard < args.connections + 100:
+            print(f"Open file limit {hard} is below --connections {args.connections}; raise ulimit -n")
+    return asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
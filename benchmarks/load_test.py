@@ -0,0 +1,324 @@
+"""
+load_test.py
+
+Ingest load generator: N simulated hosts (synth.py streams modeled on
+test_activity.jsonl) post event batches to /api/events concurrently, the way
+activity_logger_tray.py agents do.
+
+Reports events/s, request latency percentiles, error rate and database growth,
+and saves everything as JSON so runs can be compared across versions.
+
+Usage:
+    # Start a throwaway server (server.py or server_tray.py) on a temp database
+    python benchmarks/load_test.py --server server_tray --hosts 200 --duration 60 --out results.json
+
+    # Multi-process mode (server_tray.py --production: gunicorn workers + writer process)
+    python benchmarks/load_test.py --server production --workers 4 --hosts 200 --compare results.json
+
+    # Against a running server, compared with an earlier run
+    python benchmarks/load_test.py --url http://127.0.0.1:5000/api/events --db activity_logs.db \\
+        --hosts 500 --send-interval 5 --compare results.json
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+from synth import host_names, simulate_host
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_AUTH_KEY = 'your-secret-auth-key-change-me'
+
+SERVER_BOOT = '''
+import sys
+sys.path.insert(0, {repo!r})
+import {module} as server
+server.app.config['AUTH_KEY'] = {auth_key!r}
+server.init_db()
+server.app.run(host='127.0.0.1', port={port}, threaded=True, debug=False, use_reloader=False)
+'''
+
+
+class Host:
+    """One simulated agent: an endless event stream cut into batches"""
+
+    def __init__(self, hostname, seed):
+        self.hostname = hostname
+        self.rng = random.Random(seed)
+        self.stream = None
+        self.next_send = 0.0
+
+    def next_batch(self, size):
+        batch = []
+        while len(batch) < size:
+            if self.stream is None:
+                start = datetime.now(timezone.utc) - timedelta(hours=8)
+                self.stream = simulate_host(self.hostname, start, 8 * 3600, self.rng)
+            try:
+                batch.append(next(self.stream))
+            except StopIteration:
+                self.stream = None
+        return batch
+
+
+class LoadStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.requests = 0
+        self.errors = 0
+        self.events = 0
+        self.error_samples = []
+
+    def record(self, latency, events, error=None):
+        with self.lock:
+            self.requests += 1
+            self.latencies.append(latency)
+            if error is None:
+                self.events += events
+            else:
+                self.errors += 1
+                if len(self.error_samples) < 5:
+                    self.error_samples.append(error)
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(int(round(pct / 100.0 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def db_bytes(path):
+    if not path:
+        return None
+    return sum(os.path.getsize(p) for p in (path, path + '-wal') if os.path.exists(p))
+
+
+def db_events(path):
+    if not path or not os.path.exists(path):
+        return None
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM events').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def start_server(module, port, auth_key, workdir, workers=None):
+    """Run server.py / server_tray.py's Flask app in a subprocess with its database in workdir"""
+    if module == 'production':
+        command = [sys.executable, os.path.join(REPO, 'server_tray.py'), '--production',
+                   '--host', '127.0.0.1', '--port', str(port), '--auth-key', auth_key]
+        if workers:
+            command += ['--workers', str(workers)]
+    else:
+        code = SERVER_BOOT.format(repo=REPO, module=module, auth_key=auth_key, port=port)
+        command = [sys.executable, '-c', code]
+    proc = subprocess.Popen(command, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}/api/events'
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f'{module} exited with code {proc.returncode}')
+        try:
+            requests.post(url, json={'events': []}, headers={'Authorization': f'Bearer {auth_key}'}, timeout=1)
+            return proc, url
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f'{module} did not start on port {port}')
+
+
+def worker(hosts, url, auth_key, batch_size, send_interval, stop_at, stats):
+    session = requests.Session()
+    headers = {'Authorization': f'Bearer {auth_key}'}
+    while time.time() < stop_at:
+        # Paced mode: each host posts one batch every send_interval seconds
+        host = min(hosts, key=lambda h: h.next_send)
+        if send_interval:
+            wait = host.next_send - time.time()
+            if wait > 0:
+                if time.time() + wait >= stop_at:
+                    break
+                time.sleep(wait)
+            host.next_send = max(host.next_send + send_interval, time.time() - send_interval)
+        else:
+            host.next_send = time.time()
+        batch = host.next_batch(batch_size)
+        start = time.perf_counter()
+        try:
+            resp = session.post(url, json={'events': batch}, headers=headers, timeout=30)
+            error = None if resp.status_code == 200 else f'HTTP {resp.status_code}: {resp.text[:200].strip()}'
+        except requests.RequestException as e:
+            error = str(e)
+        stats.record((time.perf_counter() - start) * 1000, len(batch), error)
+
+
+def run(args, url, db_path):
+    hosts = [Host(name, seed=i) for i, name in enumerate(host_names(args.hosts))]
+    if args.send_interval:
+        # Spread the first sends over one interval like agents starting at random times
+        now = time.time()
+        for host in hosts:
+            host.next_send = now + host.rng.uniform(0, args.send_interval)
+    concurrency = args.concurrency or min(args.hosts, 64)
+    groups = [hosts[i::concurrency] for i in range(concurrency)]
+
+    size_before = db_bytes(db_path)
+    events_before = db_events(db_path)
+    stats = LoadStats()
+    started = time.time()
+    stop_at = started + args.duration
+    threads = [threading.Thread(target=worker, daemon=True,
+                                args=(group, url, args.auth_key, args.batch, args.send_interval, stop_at, stats))
+               for group in groups if group]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - started
+
+    size_after = db_bytes(db_path)
+    events_after = db_events(db_path)
+    results = {
+        'events_sent': stats.events,
+        'requests': stats.requests,
+        'errors': stats.errors,
+        'error_rate': stats.errors / stats.requests if stats.requests else 0.0,
+        'elapsed_s': elapsed,
+        'events_per_s': stats.events / elapsed if elapsed else 0.0,
+        'requests_per_s': stats.requests / elapsed if elapsed else 0.0,
+        'latency_ms': {
+            'p50': percentile(stats.latencies, 50),
+            'p90': percentile(stats.latencies, 90),
+            'p99': percentile(stats.latencies, 99),
+            'max': max(stats.latencies) if stats.latencies else None,
+        },
+        'error_samples': stats.error_samples,
+    }
+    if size_before is not None:
+        growth = size_after - size_before
+        results['db'] = {
+            'bytes_before': size_before,
+            'bytes_after': size_after,
+            'growth_bytes': growth,
+            'events_stored': events_after - events_before if events_after is not None else None,
+            'bytes_per_event': growth / stats.events if stats.events else None,
+        }
+    return results
+
+
+def print_results(results):
+    r = results['results']
+    lat = r['latency_ms']
+    print(f"Hosts: {results['config']['hosts']}, duration {r['elapsed_s']:.1f}s, target {results['target']}")
+    print(f"  events/s:   {r['events_per_s']:,.0f} ({r['events_sent']:,} events, {r['requests']:,} requests)")
+    if lat['p50'] is not None:
+        print(f"  latency ms: p50 {lat['p50']:.1f}  p90 {lat['p90']:.1f}  p99 {lat['p99']:.1f}  max {lat['max']:.1f}")
+    print(f"  errors:     {r['errors']:,} ({r['error_rate']:.2%})")
+    for sample in r['error_samples']:
+        print(f"    {sample}")
+    if 'db' in r:
+        db = r['db']
+        per_event = f"{db['bytes_per_event']:.0f} B/event" if db['bytes_per_event'] else '-'
+        print(f"  db growth:  {db['growth_bytes'] / 1e6:,.1f} MB ({per_event}, {db['events_stored']} rows stored)")
+
+
+def print_comparison(results, baseline):
+    print(f"Compared with {baseline.get('label') or baseline.get('revision') or 'baseline'}:")
+    old, new = baseline['results'], results['results']
+    rows = [
+        ('events/s', old['events_per_s'], new['events_per_s']),
+        ('p50 ms', old['latency_ms']['p50'], new['latency_ms']['p50']),
+        ('p99 ms', old['latency_ms']['p99'], new['latency_ms']['p99']),
+        ('error rate', old['error_rate'], new['error_rate']),
+    ]
+    if 'db' in old and 'db' in new:
+        rows.append(('bytes/event', old['db']['bytes_per_event'], new['db']['bytes_per_event']))
+    for name, before, after in rows:
+        if before is None or after is None:
+            continue
+        change = f"{(after - before) / before:+.1%}" if before else '-'
+        print(f"  {name:<12}{before:>14,.3f}{after:>14,.3f}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest load generator for /api/events')
+    parser.add_argument('--url', default='http://127.0.0.1:5000/api/events', help='Events endpoint to drive')
+    parser.add_argument('--server', choices=['server', 'server_tray', 'production'],
+                        help='Start this server on a temp database instead of using --url')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes for --server production')
+    parser.add_argument('--port', type=int, default=5099, help='Port for --server')
+    parser.add_argument('--auth-key', default=DEFAULT_AUTH_KEY)
+    parser.add_argument('--db', help='Server database path, for growth stats (set automatically with --server)')
+    parser.add_argument('--hosts', type=int, default=50, help='Simulated hosts')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds to run')
+    parser.add_argument('--batch', type=int, default=50, help='Events per request')
+    parser.add_argument('--send-interval', type=float, default=0.0,
+                        help='Seconds between batches per host (agent default is 5); 0 = as fast as possible')
+    parser.add_argument('--concurrency', type=int, default=None, help='Client threads (default: min(hosts, 64))')
+    parser.add_argument('--label', help='Name for this run in the results file')
+    parser.add_argument('--out', help='Write results JSON to this file')
+    parser.add_argument('--compare', help='Results JSON from an earlier run to compare against')
+    args = parser.parse_args()
+
+    if requests is None:
+        print("Missing dependency: requests")
+        print("Install with: python -m pip install requests")
+        sys.exit(1)
+
+    proc = None
+    db_path = args.db
+    url = args.url
+    if args.server:
+        workdir = tempfile.mkdtemp(prefix='load_test_')
+        db_path = os.path.join(workdir, 'activity_logs.db')
+        proc, url = start_server(args.server, args.port, args.auth_key, workdir, args.workers)
+    try:
+        results = {
+            'label': args.label,
+            'revision': git_revision(),
+            'started': datetime.now(timezone.utc).isoformat(),
+            'target': args.server or url,
+            'config': {k: v for k, v in vars(args).items() if k not in ('auth_key', 'out', 'compare')},
+            'results': run(args, url, db_path),
+        }
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+
+    print_results(results)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            print_comparison(results, json.load(f))
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""
+synth.py
+
+Synthetic activity event streams for benchmarks, modeled on test_activity.jsonl
+and the events emitted by activity_logger_tray.py (metadata, foreground_change,
+screen_time, key_count_segment, afk_start/afk_end, mouse_idle/mouse_active).
+
+Streams are deterministic for a given seed. `title_churn` adds browser tab
+title changes (notification counters, video progress), which the agent reports
+as a screen_time plus a foreground_change each.
+"""
+import random
+import string
+from datetime import datetime, timedelta, timezone
+
+APPS = [
+    # (process_name, process_path, titles, urls)
+    ('Code.exe', r'C:\Users\{user}\AppData\Local\Programs\Microsoft VS Code\Code.exe',
+     ['activity_logger.py - HugoApp - Visual Studio Code', 'server_tray.py - HugoApp - Visual Studio Code',
+      'README.md - HugoApp - Visual Studio Code', 'test_activity.jsonl - HugoApp - Visual Studio Code'], None),
+    ('chrome.exe', r'C:\Program Files\Google\Chrome\Application\chrome.exe',
+     ['Netflix - Google Chrome', 'Facebook - Google Chrome', 'New Tab - Google Chrome',
+      'Inbox (3) - Gmail - Google Chrome', 'YouTube - Google Chrome', 'Jira - Sprint Board - Google Chrome'],
+     ['https://www.netflix.com/browse', 'https://www.facebook.com/', None,
+      'https://mail.google.com/mail/u/0/#inbox', 'https://www.youtube.com/watch?v={rand}',
+      'https://company.atlassian.net/jira/software/projects/OPS/boards/1']),
+    ('msedge.exe', r'C:\Program Files (x86)\Microsoft\Edge\Application\msedge.exe',
+     ['New tab - Personal - Microsoft\u200b Edge', 'Facebook \u2013 log in or sign up - Personal - Microsoft\u200b Edge',
+      'TikTok - Make Your Day - Personal - Microsoft\u200b Edge', 'Outlook - Personal - Microsoft\u200b Edge'],
+     [None, 'https://www.facebook.com/', 'https://www.tiktok.com/explore', 'https://outlook.office.com/mail/']),
+    ('EXCEL.EXE', r'C:\Program Files\Microsoft Office\root\Office16\EXCEL.EXE',
+     ['Budget 2025.xlsx - Excel', 'Timesheet.xlsx - Excel'], None),
+    ('OUTLOOK.EXE', r'C:\Program Files\Microsoft Office\root\Office16\OUTLOOK.EXE',
+     ['Inbox - user@company.com - Outlook', 'Calendar - user@company.com - Outlook'], None),
+    ('Teams.exe', r'C:\Users\{user}\AppData\Local\Microsoft\Teams\current\Teams.exe',
+     ['Chat | Microsoft Teams', 'General (Ops) | Microsoft Teams', 'Meeting with Hugo | Microsoft Teams'], None),
+    ('explorer.exe', r'C:\Windows\explorer.exe', ['', 'Downloads', 'Documents'], None),
+    ('SearchHost.exe', r'C:\Windows\SystemApps\MicrosoftWindows.Client.CBS_cw5n1h2txyewy\SearchHost.exe',
+     ['Search'], None),
+]
+
+BROWSERS = ('chrome.exe', 'msedge.exe')
+
+KEYS = list(string.ascii_lowercase) + ['space', 'backspace', 'enter', 'shift', 'ctrl_l', 'tab']
+
+
+def host_names(count):
+    return [f'DESKTOP-{i:04d}' for i in range(count)]
+
+
+def iso(ts):
+    return ts.isoformat()
+
+
+def metadata_event(hostname, ts, rng):
+    return {
+        'type': 'metadata',
+        'timestamp': iso(ts),
+        'hostname': hostname,
+        'platform': 'Windows-11-10.0.26100-SP0',
+        'python_version': '3.13.8',
+        'cpu_count': rng.choice([4, 8, 12, 16]),
+        'pid': rng.randint(1000, 30000),
+        'memory_total': rng.choice([8, 16, 32]) * 1024 ** 3,
+        'disk_total': 999336964096,
+        'boot_time': iso(ts - timedelta(hours=rng.randint(1, 72))),
+        'mac_addresses': [f'fe80::{rng.randint(0, 0xffff):x}:{rng.randint(0, 0xffff):x}' for _ in range(3)],
+    }
+
+
+def simulate_host(hostname, start, seconds, rng, user=None, title_churn=0.0):
+    """Yield one host's events in time order over `seconds` of simulated activity
+
+    title_churn: average title changes per minute while a browser is focused.
+    """
+    user = user or hostname.title()
+    ts = start
+    end = start + timedelta(seconds=seconds)
+    yield metadata_event(hostname, ts, rng)
+
+    pid_by_app = {}
+    focus = None
+    focus_start = ts
+    while ts < end:
+        # Focus dwell time, heavy-tailed like real usage
+        dwell = min(rng.expovariate(1 / 45.0) + 1, 900)
+        app = rng.choice(APPS)
+        process_name, path, titles, urls = app
+        index = rng.randrange(len(titles))
+        url = urls[index] if urls else None
+        if url and '{rand}' in url:
+            url = url.format(rand=''.join(rng.choices(string.ascii_letters, k=11)))
+        pid = pid_by_app.setdefault(process_name, rng.randint(1000, 30000))
+
+        if focus is not None:
+            duration = int((ts - focus_start).total_seconds())
+            if duration > 0:
+                yield {
+                    'type': 'screen_time',
+                    'timestamp': iso(ts),
+                    'hostname': hostname,
+                    'process_name': focus[0],
+                    'pid': focus[1],
+                    'title': focus[2],
+                    'duration_seconds': duration,
+                }
+        yield {
+            'type': 'foreground_change',
+            'timestamp': iso(ts),
+            'hostname': hostname,
+            'title': titles[index],
+            'process_name': process_name,
+            'pid': pid,
+            'process_path': path.format(user=user),
+            'url': url,
+        }
+        focus = (process_name, pid, titles[index])
+        focus_start = ts
+
+        # Same tab, new title: the agent sees a new (pid, title) focus key
+        if title_churn > 0 and process_name in BROWSERS:
+            change = ts + timedelta(seconds=rng.expovariate(title_churn / 60.0))
+            unread = 0
+            while change < ts + timedelta(seconds=dwell):
+                unread += 1
+                title = f'({unread}) {titles[index]}'
+                yield {
+                    'type': 'screen_time',
+                    'timestamp': iso(change),
+                    'hostname': hostname,
+                    'process_name': process_name,
+                    'pid': pid,
+                    'title': focus[2],
+                    'duration_seconds': int((change - focus_start).total_seconds()),
+                }
+                yield {
+                    'type': 'foreground_change',
+                    'timestamp': iso(change),
+                    'hostname': hostname,
+                    'title': title,
+                    'process_name': process_name,
+                    'pid': pid,
+                    'process_path': path.format(user=user),
+                    'url': url,
+                }
+                focus = (process_name, pid, title)
+                focus_start = change
+                change += timedelta(seconds=rng.expovariate(title_churn / 60.0))
+
+        # Typing inside this focus period
+        if rng.random() < 0.4:
+            count = rng.randint(5, 250)
+            seg_start = ts + timedelta(seconds=rng.uniform(0, dwell / 2))
+            key_ts = seg_start
+            keystrokes = []
+            for _ in range(count):
+                key_ts += timedelta(milliseconds=rng.randint(40, 400))
+                keystrokes.append({'key': rng.choice(KEYS), 'timestamp': iso(key_ts)})
+            keystrokes = keystrokes[-100:]
+            yield {
+                'type': 'key_count_segment',
+                'timestamp': iso(key_ts + timedelta(seconds=10)),
+                'hostname': hostname,
+                'count': count,
+                'keystrokes': keystrokes,
+                'start_time': iso(seg_start),
+                'end_time': iso(key_ts),
+                'duration_seconds': int((key_ts - seg_start).total_seconds()),
+            }
+
+        # Occasional AFK break
+        if rng.random() < 0.03:
+            afk_at = ts + timedelta(seconds=dwell)
+            afk_len = rng.randint(60, 1800)
+            yield {'type': 'afk_start', 'timestamp': iso(afk_at), 'hostname': hostname, 'idle_seconds': 20}
+            yield {'type': 'mouse_idle', 'timestamp': iso(afk_at + timedelta(seconds=40)),
+                   'hostname': hostname, 'idle_seconds': 60.0}
+            back = afk_at + timedelta(seconds=afk_len)
+            yield {'type': 'mouse_active', 'timestamp': iso(back), 'hostname': hostname,
+                   'x': rng.randint(0, 1920), 'y': rng.randint(0, 1080), 'idle_duration_seconds': afk_len - 60}
+            yield {'type': 'afk_end', 'timestamp': iso(back), 'hostname': hostname,
+                   'start_time': iso(afk_at), 'end_time': iso(back), 'duration_seconds': afk_len}
+            dwell += afk_len
+
+        ts += timedelta(seconds=dwell)
+
+
+def generate_events(hosts=500, days=30, hours_per_day=8.0, seed=1, start=None, title_churn=0.0):
+    """Yield events for `hosts` machines over `days` working days, host by host, day by day"""
+    start = start or (datetime.now(timezone.utc).replace(hour=8, minute=0, second=0, microsecond=0)
+                      - timedelta(days=days))
+    for i, hostname in enumerate(host_names(hosts)):
+        rng = random.Random(seed * 1000003 + i)
+        for day in range(days):
+            day_start = start + timedelta(days=day, minutes=rng.randint(0, 60))
+            yield from simulate_host(hostname, day_start, hours_per_day * 3600, rng, title_churn=title_churn)
@@ -15,6 +15,7 @@ pyinstaller --onefile `
   --hidden-import=win32timezone `
   --hidden-import=win32api `
   --hidden-import=win32con `
+  --hidden-import=activity_common `
   activity_logger_tray.py
 
 Write-Host ""
@@ -0,0 +1,256 @@
+"""
+bulk_import.py
+
+Offline importer that loads JSONL activity logs (activity_logger.py output,
+activity_log_fallback.jsonl, test_activity.jsonl) straight into the server's
+SQLite database, without going through HTTP.
+
+Lines are parsed and encoded in a process pool; results are written in file
+order by the main process with bulk-load settings: secondary indexes dropped
+and rebuilt at the end, synchronous=OFF, large transactions and executemany.
+The hourly rollups are backfilled for the imported rows once loading is done;
+focus sessions and daily summaries are updated as each block is written.
+
+Usage:
+    python server_tray.py import activity_log_*.jsonl --db activity_logs.db
+    python bulk_import.py activity_log_fallback.jsonl --workers 8 --report import_report.json
+"""
+import argparse
+import gzip
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import daily_summary
+import device_state
+import event_store
+import sessionizer
+
+BLOCK_LINES = 20000
+COMMIT_EVENTS = 1000000
+
+# Event types that also update devices / agent_health / sessions / daily summaries / device state besides the events table
+SIDE_TABLE_TYPES = ('metadata', 'agent_health', *sessionizer.FOCUS_TYPES,
+                    *sessionizer.AFK_START_TYPES, *sessionizer.AFK_END_TYPES, *daily_summary.KEY_FIELDS)
+
+
+def open_log(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def read_blocks(paths, block_lines=BLOCK_LINES):
+    """Yield lists of raw lines, block_lines at a time, across all files in order"""
+    for path in paths:
+        with open_log(path) as f:
+            block = []
+            for line in f:
+                block.append(line)
+                if len(block) >= block_lines:
+                    yield block
+                    block = []
+            if block:
+                yield block
+
+
+def parse_block(lines, default_hostname=None):
+    """Parse and encode one block of JSONL lines (runs in a worker process)
+
+    Returns (rows, invalid line count, byte count); each row is
+    (timestamp, event_type, payload, interned strings, event or None); the full
+    event is only kept for types that also feed other tables.
+    """
+    rows = []
+    invalid = 0
+    size = 0
+    for line in lines:
+        size += len(line)
+        if not line.strip():
+            continue
+        try:
+            event = json.loads(line)
+        except ValueError:
+            invalid += 1
+            continue
+        if not isinstance(event, dict):
+            invalid += 1
+            continue
+        if default_hostname and not event.get('hostname'):
+            event['hostname'] = default_hostname
+        event_type, timestamp, hostname = event_store.normalize_event(event)
+        strings, payload = event_store.split_event(dict(event, hostname=hostname))
+        rows.append((timestamp, event_type, payload, strings, event if event_type in SIDE_TABLE_TYPES else None))
+    return rows, invalid, size
+
+
+class Importer:
+    def __init__(self, db_path, workers=None, default_hostname=None, defer_indexes=True,
+                 block_lines=BLOCK_LINES, commit_events=COMMIT_EVENTS):
+        self.db_path = db_path
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.default_hostname = default_hostname
+        self.defer_indexes = defer_indexes
+        self.block_lines = block_lines
+        self.commit_events = commit_events
+        self.interner = event_store.StringInterner()
+        self.report = {
+            'events': 0,
+            'invalid': 0,
+            'bytes': 0,
+            'workers': self.workers,
+            'load_s': 0.0,
+            'write_s': 0.0,
+            'index_s': 0.0,
+            'rollup_s': 0.0,
+        }
+
+    def run(self, paths):
+        return self.run_blocks(read_blocks(paths, self.block_lines))
+
+    def run_blocks(self, blocks):
+        """Import from any iterable of raw JSONL line blocks (files, generators)"""
+        event_store.init_db(self.db_path)
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn.execute('PRAGMA cache_size = -262144')
+        cursor = conn.cursor()
+        start_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+        started = time.perf_counter()
+
+        if self.defer_indexes:
+            for name in event_store.EVENT_INDEXES:
+                conn.execute(f'DROP INDEX IF EXISTS {name}')
+
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            load_start = time.perf_counter()
+            self.uncommitted = 0
+            if self.workers > 1:
+                self._load_parallel(cursor, blocks)
+            else:
+                for block in blocks:
+                    self._write(cursor, parse_block(block, self.default_hostname))
+            cursor.execute('COMMIT')
+            self.interner.commit(conn)
+            self.report['load_s'] = time.perf_counter() - load_start
+        except BaseException:
+            if conn.in_transaction:
+                cursor.execute('ROLLBACK')
+            self.interner.rollback(conn)
+            raise
+        finally:
+            # Committed blocks stay, so always restore indexes and rollups for them
+            index_start = time.perf_counter()
+            for sql in event_store.EVENT_INDEXES.values():
+                conn.execute(sql)
+            self.report['index_s'] = time.perf_counter() - index_start
+
+            rollup_start = time.perf_counter()
+            cursor.execute('BEGIN IMMEDIATE')
+            event_store.backfill_rollups(conn, start_id)
+            cursor.execute('COMMIT')
+            self.report['rollup_s'] = time.perf_counter() - rollup_start
+            conn.close()
+
+        elapsed = time.perf_counter() - started
+        self.report['elapsed_s'] = elapsed
+        self.report['events_per_s'] = self.report['events'] / elapsed if elapsed else 0.0
+        self.report['events_per_min'] = self.report['events_per_s'] * 60
+        self.report['mb_per_s'] = self.report['bytes'] / 1e6 / elapsed if elapsed else 0.0
+        return self.report
+
+    def _load_parallel(self, cursor, blocks):
+        # Bounded window of in-flight blocks; popping from the left keeps writes in file order
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            pending = deque()
+            for block in blocks:
+                pending.append(pool.submit(parse_block, block, self.default_hostname))
+                if len(pending) >= self.workers * 2:
+                    self._write(cursor, pending.popleft().result())
+            while pending:
+                self._write(cursor, pending.popleft().result())
+
+    def _write(self, cursor, parsed):
+        rows, invalid, size = parsed
+        write_start = time.perf_counter()
+        params = []
+        health = []
+        session_rows = []
+        for timestamp, event_type, payload, strings, event in rows:
+            ids = event_store.event_ids(cursor, event_type, strings, self.interner)
+            params.append((timestamp, event_type, payload, *ids))
+            if event_type == 'metadata':
+                event_store.upsert_device(cursor, event, strings[0], timestamp)
+            elif event_type == 'agent_health':
+                health.append((ids[0], timestamp, event))
+            elif event_type == sessionizer.MINUTE_TYPE:
+                sample = sessionizer.record_health(timestamp, event)
+                if sample:
+                    health.append((ids[0], *sample))
+            session_rows.append((ids[0], timestamp, event_type, event or {}))
+        cursor.executemany(event_store.INSERT_EVENT_SQL, params)
+        event_store.store_agent_health(cursor, health)
+        hosts = sessionizer.update_sessions(cursor, session_rows)
+        daily_summary.update_summaries(cursor, session_rows, hosts)
+        # hourly_counts are rebuilt after the load, so 24h counts are left to the first read
+        device_state.update_state(cursor, session_rows, hosts, counts=False)
+
+        self.uncommitted += len(rows)
+        if self.uncommitted >= self.commit_events:
+            cursor.execute('COMMIT')
+            self.interner.commit(cursor.connection)
+            cursor.execute('BEGIN IMMEDIATE')
+            self.uncommitted = 0
+
+        self.report['events'] += len(rows)
+        self.report['invalid'] += invalid
+        self.report['bytes'] += size
+        self.report['write_s'] += time.perf_counter() - write_start
+
+
+def print_report(report):
+    print(f"Imported {report['events']:,} events ({report['invalid']:,} invalid lines, "
+          f"{report['bytes'] / 1e6:,.1f} MB) with {report['workers']} worker(s)")
+    print(f"  load:    {report['load_s']:8.2f}s (main-process write time {report['write_s']:.2f}s)")
+    print(f"  indexes: {report['index_s']:8.2f}s")
+    print(f"  rollups: {report['rollup_s']:8.2f}s")
+    print(f"  total:   {report['elapsed_s']:8.2f}s -> {report['events_per_s']:,.0f} events/s "
+          f"({report['events_per_min'] / 1e6:.2f}M events/min, {report['mb_per_s']:.1f} MB/s)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import JSONL activity logs directly into the SQLite database')
+    parser.add_argument('files', nargs='+', help='JSONL files to import (.gz accepted)')
+    parser.add_argument('--db', default='activity_logs.db', help='SQLite database path')
+    parser.add_argument('--workers', type=int, default=None, help='Parser processes (default: CPU count, 1 = no pool)')
+    parser.add_argument('--hostname', help='Hostname for events that carry none (activity_logger.py output)')
+    parser.add_argument('--keep-indexes', action='store_true',
+                        help='Maintain indexes during the load instead of rebuilding them at the end')
+    parser.add_argument('--report', help='Write the throughput report as JSON to this file')
+    args = parser.parse_args(argv)
+
+    for path in args.files:
+        if not os.path.exists(path):
+            print(f"File not found: {path}")
+            return 1
+
+    importer = Importer(args.db, workers=args.workers, default_hostname=args.hostname,
+                        defer_indexes=not args.keep_indexes)
+    report = importer.run(args.files)
+    print_report(report)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
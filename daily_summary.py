@@ -0,0 +1,314 @@
+"""
+daily_summary.py
+
+Per-(host, UTC day) activity summaries, maintained at ingest so the device
+view and reports read one row per day instead of scanning raw events.
+
+Fed from event_store.store_events (and bulk_import.py) with the batch's
+events and the sessions sessionizer.py closed for it:
+
+    - event and key counts, first/last activity from every event,
+    - active and AFK seconds from closed sessions (split at midnight),
+      per-app / per-domain / per-category seconds into daily_usage,
+    - AFK periods long enough to split a session count as AFK too.
+
+A day is finalized once the host's open session starts after it: idle
+seconds (time between first and last activity spent neither active nor AFK)
+and the top apps/domains are then written into the row. Days not finalized
+yet (today, or a host that went offline) are completed on read.
+"""
+import json
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+import domains
+import sessionizer
+
+TOP_N = 10
+KEY_FIELDS = {'key_count': 'count', 'key_count_segment': 'count', sessionizer.MINUTE_TYPE: 'key_count'}
+DAY = 86400
+
+SUMMARY_UPSERT_SQL = '''
+    INSERT INTO daily_summaries (host_id, day, first_activity, last_activity, active_seconds,
+                                 afk_seconds, key_count, event_count, sessions)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (host_id, day) DO UPDATE SET
+        first_activity = COALESCE(MIN(first_activity, excluded.first_activity), first_activity,
+                                  excluded.first_activity),
+        last_activity = COALESCE(MAX(last_activity, excluded.last_activity), last_activity,
+                                 excluded.last_activity),
+        active_seconds = active_seconds + excluded.active_seconds,
+        afk_seconds = afk_seconds + excluded.afk_seconds,
+        key_count = key_count + excluded.key_count,
+        event_count = event_count + excluded.event_count,
+        sessions = sessions + excluded.sessions
+'''
+
+USAGE_UPSERT_SQL = '''
+    INSERT INTO daily_usage (host_id, day, kind, name, seconds) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (host_id, day, kind, name) DO UPDATE SET seconds = seconds + excluded.seconds
+'''
+
+SUMMARY_COLUMNS = ('day', 'first_activity', 'last_activity', 'active_seconds', 'afk_seconds',
+                   'idle_seconds', 'key_count', 'event_count', 'sessions', 'top_apps', 'top_domains',
+                   'finalized')
+
+
+def create_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_summaries (
+            host_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            first_activity TEXT,
+            last_activity TEXT,
+            active_seconds REAL NOT NULL DEFAULT 0,
+            afk_seconds REAL NOT NULL DEFAULT 0,
+            idle_seconds REAL,
+            key_count INTEGER NOT NULL DEFAULT 0,
+            event_count INTEGER NOT NULL DEFAULT 0,
+            sessions INTEGER NOT NULL DEFAULT 0,
+            top_apps TEXT,
+            top_domains TEXT,
+            finalized INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (host_id, day)
+        ) WITHOUT ROWID
+    ''')
+    # Active seconds per app ('app'), domain ('domain') and category ('category', see
+    # domains.py), for exact multi-day reports
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_usage (
+            host_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            name TEXT NOT NULL,
+            seconds REAL NOT NULL,
+            PRIMARY KEY (host_id, day, kind, name)
+        ) WITHOUT ROWID
+    ''')
+
+
+@lru_cache(maxsize=4096)
+def day_name(day_number):
+    return datetime.fromtimestamp(day_number * DAY, timezone.utc).strftime('%Y-%m-%d')
+
+
+def day_of(seconds):
+    return day_name(int(seconds // DAY))
+
+
+def day_parts(start, end):
+    """Split [start, end) epoch seconds at UTC midnights: [(day, seconds), ...]"""
+    parts = []
+    while start < end:
+        midnight = (start // DAY + 1) * DAY
+        stop = min(end, midnight)
+        parts.append((day_of(start), stop - start))
+        start = stop
+    return parts
+
+
+def add_session(totals, usage, host_id, app, domain, start, end, active):
+    """Spread one session's active/AFK seconds over the days it covers"""
+    span = end - start
+    category = domains.session_category(app, domain)
+    for index, (day, seconds) in enumerate(day_parts(start, end)):
+        share = seconds / span
+        entry = totals.setdefault((host_id, day), [None, None, 0.0, 0.0, 0, 0, 0])
+        entry[2] += active * share
+        entry[3] += (span - active) * share
+        if index == 0:
+            entry[6] += 1
+        for kind, name in (('app', app), ('domain', domain), ('category', category)):
+            if name:
+                key = (host_id, day, kind, name)
+                usage[key] = usage.get(key, 0.0) + active * share
+
+
+def update_summaries(cursor, rows, hosts):
+    """Add a stored batch to daily_summaries
+
+    rows are the sessionizer rows [(host_id, timestamp, event_type, event), ...];
+    hosts is what sessionizer.update_sessions returned for them.
+    """
+    # (host_id, day) -> [first, last (epoch seconds), active, afk, keys, events, sessions]
+    totals = {}
+    usage = {}
+    for host_id, timestamp, event_type, event in rows:
+        at = sessionizer.epoch(timestamp)
+        if host_id is None or at is None:
+            continue
+        entry = totals.setdefault((host_id, day_of(at)), [None, None, 0.0, 0.0, 0, 0, 0])
+        if entry[0] is None or at < entry[0]:
+            entry[0] = at
+        # An activity_minute record lasts until its last folded event
+        end = sessionizer.record_end(at, event) if event_type == sessionizer.MINUTE_TYPE else at
+        if entry[1] is None or end > entry[1]:
+            entry[1] = end
+        entry[5] += 1
+        field = KEY_FIELDS.get(event_type)
+        if field:
+            count = event.get(field)
+            if isinstance(count, int):
+                entry[4] += count
+
+    for host_id, host in hosts.items():
+        for app, domain, start, end, active in host.closed:
+            add_session(totals, usage, host_id, app, domain, start, end, active)
+        for start, end in host.away:
+            for day, seconds in day_parts(start, end):
+                totals.setdefault((host_id, day), [None, None, 0.0, 0.0, 0, 0, 0])[3] += seconds
+
+    cursor.executemany(SUMMARY_UPSERT_SQL, [
+        (*key, sessionizer.sql_time(first) if first is not None else None,
+         sessionizer.sql_time(last) if last is not None else None, *values)
+        for key, (first, last, *values) in totals.items()
+    ])
+    cursor.executemany(USAGE_UPSERT_SQL, [(*key, seconds) for key, seconds in usage.items()])
+
+    # Only hosts whose boundary moved to a later day, or that got rows for earlier days, can finalize
+    touched = {}
+    for host_id, day in totals:
+        if day < touched.get(host_id, '9999'):
+            touched[host_id] = day
+    for host_id, host in hosts.items():
+        boundary = host.boundary()
+        if boundary is None:
+            continue
+        day = day_of(boundary)
+        loaded = host.loaded_boundary
+        if (loaded is not None and day_of(loaded) != day) or touched.get(host_id, day) < day:
+            finalize_days(cursor, host_id, day)
+
+
+def top_usage(cursor, host_id, first_day, last_day, kind, limit=TOP_N):
+    """[[name, seconds], ...] summed over daily_usage for the day range (all hosts if host_id is None)"""
+    query = 'SELECT name, SUM(seconds) AS seconds FROM daily_usage WHERE day BETWEEN ? AND ? AND kind = ?'
+    params = [first_day, last_day, kind]
+    if host_id is not None:
+        query += ' AND host_id = ?'
+        params.append(host_id)
+    query += ' GROUP BY name ORDER BY seconds DESC'
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(limit)
+    return [[name, round(seconds, 1)] for name, seconds in cursor.execute(query, params)]
+
+
+def idle_seconds(first, last, active, afk):
+    if not first or not last:
+        return 0.0
+    span = (datetime.fromisoformat(last) - datetime.fromisoformat(first)).total_seconds()
+    return max(0.0, span - active - afk)
+
+
+def finalize_days(cursor, host_id, before_day):
+    """Write idle seconds and top lists into the host's open days before before_day"""
+    days = cursor.execute('''
+        SELECT day, first_activity, last_activity, active_seconds, afk_seconds FROM daily_summaries
+        WHERE host_id = ? AND finalized = 0 AND day < ?
+    ''', (host_id, before_day)).fetchall()
+    for day, first, last, active, afk in days:
+        cursor.execute('''
+            UPDATE daily_summaries SET idle_seconds = ?, top_apps = ?, top_domains = ?, finalized = 1
+            WHERE host_id = ? AND day = ?
+        ''', (idle_seconds(first, last, active, afk),
+              json.dumps(top_usage(cursor, host_id, day, day, 'app')),
+              json.dumps(top_usage(cursor, host_id, day, day, 'domain')),
+              host_id, day))
+
+
+def open_sessions(cursor, host_id=None):
+    """What the hosts' open sessions add on read, keyed like add_session's output
+
+    Returns ({(host_id, day): [.., .., active, afk, ...]}, {(host_id, day, kind, name): seconds})
+    for one host, or all hosts if host_id is None. Open sessions lie after
+    each host's finalized days, so only days still open get anything.
+    """
+    live = {}
+    live_usage = {}
+    for row_host, app, domain, start, end, active in sessionizer.open_session_rows(cursor, host_id):
+        start, end = sessionizer.epoch(start), sessionizer.epoch(end)
+        if end > start:
+            add_session(live, live_usage, row_host, app, domain, start, end, active)
+    return live, live_usage
+
+
+def usage_totals(cursor, host_id, first_day, last_day, kind, live_usage):
+    """{name: seconds} over the day range: daily_usage plus live_usage (open_sessions()[1])"""
+    totals = dict(top_usage(cursor, host_id, first_day, last_day, kind, limit=None))
+    for (usage_host, day, usage_kind, name), seconds in live_usage.items():
+        if usage_kind == kind and first_day <= day <= last_day and host_id in (None, usage_host):
+            totals[name] = totals.get(name, 0.0) + seconds
+    return totals
+
+
+def ranked(totals, limit=TOP_N):
+    """[[name, seconds], ...] of the largest totals"""
+    return [[name, round(seconds, 1)] for name, seconds
+            in sorted(totals.items(), key=lambda x: x[1], reverse=True)[:limit]]
+
+
+def open_day_totals(cursor, host_id, first_day, last_day, live):
+    """{host_id: [active, afk, idle]} to add to the stored sums of its days in the range
+
+    The open session's active and AFK seconds (live, open_sessions()[0])
+    and the change in the idle estimate of days not finalized (first to
+    last activity minus active and AFK) once they are counted.
+    """
+    query = '''
+        SELECT host_id, day, first_activity, last_activity, active_seconds, afk_seconds FROM daily_summaries
+        WHERE finalized = 0 AND day BETWEEN ? AND ?
+    '''
+    params = [first_day, last_day]
+    if host_id is not None:
+        query += ' AND host_id = ?'
+        params.append(host_id)
+    added = {}
+    for row_host, day, first, last, active, afk in cursor.execute(query, params).fetchall():
+        extra = live.get((row_host, day))
+        if not extra:
+            continue
+        entry = added.setdefault(row_host, [0.0, 0.0, 0.0])
+        entry[0] += extra[2]
+        entry[1] += extra[3]
+        entry[2] += (idle_seconds(first, last, active + extra[2], afk + extra[3])
+                     - idle_seconds(first, last, active, afk))
+    return added
+
+
+def day_summaries(cursor, host_id, first_day, last_day):
+    """Summary dicts for one host's days in [first_day, last_day], oldest first
+
+    Days still open are completed here, including the host's open session.
+    """
+    cursor.execute(f'''
+        SELECT {", ".join(SUMMARY_COLUMNS)} FROM daily_summaries
+        WHERE host_id = ? AND day BETWEEN ? AND ? ORDER BY day
+    ''', (host_id, first_day, last_day))
+    days = [dict(zip(SUMMARY_COLUMNS, row)) for row in cursor.fetchall()]
+    open_days = [day for day in days if not day['finalized']]
+    if open_days:
+        live, live_usage = open_sessions(cursor, host_id)
+        for day in open_days:
+            extra = live.get((host_id, day['day']))
+            if extra:
+                day['active_seconds'] += extra[2]
+                day['afk_seconds'] += extra[3]
+            day['idle_seconds'] = idle_seconds(day['first_activity'], day['last_activity'],
+                                               day['active_seconds'], day['afk_seconds'])
+            for kind, field in (('app', 'top_apps'), ('domain', 'top_domains')):
+                day[field] = ranked(usage_totals(cursor, host_id, day['day'], day['day'], kind, live_usage))
+    for day in days:
+        if day['finalized']:
+            day['top_apps'] = json.loads(day['top_apps'])
+            day['top_domains'] = json.loads(day['top_domains'])
+        day['finalized'] = bool(day['finalized'])
+        for field in ('active_seconds', 'afk_seconds', 'idle_seconds'):
+            day[field] = round(day[field], 1)
+    return days
+
+
+def day_range(days):
+    """(first_day, last_day) covering the last `days` UTC days including today"""
+    today = datetime.utcnow().date()
+    return (today - timedelta(days=max(1, days) - 1)).isoformat(), today.isoformat()
@@ -0,0 +1,206 @@
+"""
+device_state.py
+
+Live state per device, kept current at ingest so the fleet overview reads
+one row per device instead of grouping the last 24 hours of events.
+
+Fed from event_store.store_events (and bulk_import.py) with the batch's
+sessionizer rows and the HostSessions sessionizer.update_sessions returned
+for them, so it costs one upsert per host per batch:
+
+    - last_seen, the current app/domain and AFK state from the host's
+      session state,
+    - agent_version from the latest agent_health event (or sample folded
+      into an activity_minute record),
+    - events in the last 24 hours, summed from hourly_counts over the
+      (host_id, hour) index (whole hours: the oldest one overlapping the
+      window counts in full).
+
+The 24h count is exact for the hour it was computed in (count_hour). Rows
+from an earlier hour (hosts that went quiet, bulk imports) are recounted
+on read; hosts silent for more than a day read as 0 without a lookup.
+"""
+from datetime import datetime, timedelta
+
+import sessionizer
+
+# Hours of rollups summed into events_24h
+COUNT_HOURS = 24
+
+STATE_COLUMNS = ('last_seen', 'app', 'domain', 'afk_since', 'agent_version', 'events_24h', 'count_hour')
+
+STATE_UPSERT_SQL = f'''
+    INSERT INTO device_state (host_id, {", ".join(STATE_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (host_id) DO UPDATE SET
+        last_seen = excluded.last_seen,
+        app = excluded.app,
+        domain = excluded.domain,
+        afk_since = excluded.afk_since,
+        agent_version = COALESCE(excluded.agent_version, agent_version),
+        events_24h = excluded.events_24h,
+        count_hour = excluded.count_hour
+'''
+
+# Sort keys accepted by overview(); hostname breaks ties
+SORT_KEYS = ('last_seen', 'hostname', 'event_count', 'app', 'agent_version', 'afk')
+
+
+def create_tables(cursor):
+    # Times are UTC 'YYYY-MM-DD HH:MM:SS' (sessionizer.sql_time), count_hour an hourly_counts hour
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS device_state (
+            host_id INTEGER PRIMARY KEY,
+            last_seen TEXT,
+            app TEXT,
+            domain TEXT,
+            afk_since TEXT,
+            agent_version TEXT,
+            events_24h INTEGER NOT NULL DEFAULT 0,
+            count_hour TEXT
+        )
+    ''')
+
+
+def iso_time(value):
+    """'YYYY-MM-DD HH:MM:SS' (UTC) -> ISO 8601 with offset, as the other endpoints return timestamps"""
+    return value.replace(' ', 'T') + '+00:00'
+
+
+def current_hour(now=None):
+    return (now or datetime.utcnow()).strftime('%Y-%m-%d %H:00:00')
+
+
+def count_cutoff(now=None):
+    """First rollup hour overlapping the last COUNT_HOURS hours (so up to an hour more is counted)"""
+    return current_hour((now or datetime.utcnow()) - timedelta(hours=COUNT_HOURS))
+
+
+def recent_counts(cursor, host_ids, now=None):
+    """{host_id: events in the rollup hours overlapping the last COUNT_HOURS hours}"""
+    counts = {}
+    cutoff = count_cutoff(now)
+    for i in range(0, len(host_ids), 500):
+        chunk = host_ids[i:i + 500]
+        marks = ', '.join('?' * len(chunk))
+        for host_id, count in cursor.execute(f'''
+                SELECT host_id, SUM(count) FROM hourly_counts
+                WHERE host_id IN ({marks}) AND hour >= ? GROUP BY host_id
+                ''', (*chunk, cutoff)):
+            counts[host_id] = count
+    return counts
+
+
+def write_state(cursor, hosts, versions, counts=True):
+    """Upsert device_state from {host_id: HostSessions} and {host_id: agent_version}
+
+    With counts=False (rollups not written yet, as in bulk_import.py) the
+    rows are left for overview() to recount.
+    """
+    if not hosts:
+        return
+    hour = current_hour()
+    tallies = recent_counts(cursor, list(hosts)) if counts else {}
+    cursor.executemany(STATE_UPSERT_SQL, [
+        (host_id,
+         sessionizer.sql_time(host.last_seen) if host.last_seen is not None else None,
+         host.app, host.domain,
+         sessionizer.sql_time(host.afk_since) if host.afk_since is not None else None,
+         versions.get(host_id),
+         tallies.get(host_id, 0),
+         hour if counts else None)
+        for host_id, host in hosts.items()
+    ])
+
+
+def update_state(cursor, rows, hosts, counts=True):
+    """Apply a stored batch: rows are the sessionizer rows, hosts what update_sessions returned"""
+    versions = {}
+    latest = {}
+    for host_id, timestamp, event_type, event in rows:
+        if event_type == sessionizer.MINUTE_TYPE:
+            # The minute's agent_health sample, if the agent folded one in
+            timestamp, event = sessionizer.record_health(timestamp, event) or (timestamp, {})
+        elif event_type != 'agent_health':
+            continue
+        if event.get('agent_version') and timestamp >= latest.get(host_id, ''):
+            latest[host_id] = timestamp
+            versions[host_id] = event['agent_version']
+    write_state(cursor, hosts, versions, counts)
+
+
+def backfill_state(conn):
+    """Build device_state from open_sessions and agent_health (databases from before it)"""
+    cursor = conn.cursor()
+    hosts = {
+        row[0]: sessionizer.HostSessions(dict(zip(sessionizer.STATE_COLUMNS, row[1:])))
+        for row in cursor.execute(f'SELECT host_id, {", ".join(sessionizer.STATE_COLUMNS)} FROM open_sessions')
+    }
+    # Bare column with MAX(): agent_version comes from each host's latest sample
+    versions = {host_id: version for host_id, version, _ in cursor.execute(
+        'SELECT host_id, agent_version, MAX(timestamp) FROM agent_health GROUP BY host_id')}
+    write_state(cursor, hosts, versions)
+    return len(hosts)
+
+
+OVERVIEW_COLUMNS = ('hostname', 'platform', 'python_version', 'cpu_count', 'memory_total', 'host_id',
+                    *STATE_COLUMNS)
+
+
+def sort_devices(devices, sort='last_seen', descending=True):
+    """Sort overview() dicts in place by one of SORT_KEYS, hostname breaking ties"""
+    key = {
+        'hostname': lambda d: d['hostname'],
+        'event_count': lambda d: d['event_count'],
+        'afk': lambda d: d['afk'],
+    }.get(sort, lambda d: d[sort] or '')
+    devices.sort(key=lambda d: d['hostname'])
+    devices.sort(key=key, reverse=descending)
+    return devices
+
+
+def overview(cursor, sort='last_seen', descending=True, limit=None, now=None):
+    """Device dicts (state joined with hostname and device metadata), sorted, first `limit` of them
+
+    Reads one row per device; only rows whose 24h count is from an earlier
+    hour touch hourly_counts.
+    """
+    rows = [dict(zip(OVERVIEW_COLUMNS, row)) for row in cursor.execute(f'''
+        SELECT h.value, d.platform, d.python_version, d.cpu_count, d.memory_total,
+               s.host_id, {", ".join("s." + column for column in STATE_COLUMNS)}
+        FROM device_state s
+        JOIN hosts h ON h.id = s.host_id
+        LEFT JOIN devices d ON d.hostname = h.value
+    ''')]
+    hour = current_hour(now)
+    # Hosts whose last event is older than the first counted hour have nothing left in it
+    quiet = ((now or datetime.utcnow()) - timedelta(hours=COUNT_HOURS + 1)).strftime('%Y-%m-%d %H:%M:%S')
+
+    def recount(devices):
+        stale = []
+        for device in devices:
+            if device['count_hour'] == hour:
+                device['event_count'] = device['events_24h']
+            elif device['last_seen'] is None or device['last_seen'] < quiet:
+                device['event_count'] = 0
+            else:
+                stale.append(device)
+        counts = recent_counts(cursor, [device['host_id'] for device in stale], now)
+        for device in stale:
+            device['event_count'] = counts.get(device['host_id'], 0)
+
+    for device in rows:
+        device['afk'] = device['afk_since'] is not None
+    if sort == 'event_count':
+        recount(rows)
+    sort_devices(rows, sort, descending)
+    if limit is not None:
+        rows = rows[:limit]
+    if sort != 'event_count':
+        recount(rows)
+    for device in rows:
+        for column in ('host_id', 'events_24h', 'count_hour'):
+            del device[column]
+        for column in ('last_seen', 'afk_since'):
+            if device[column]:
+                device[column] = iso_time(device[column])
+    return rows
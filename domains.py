@@ -0,0 +1,193 @@
+"""
+domains.py
+
+Domain normalization and activity categories for the server (ingest,
+sessions, reports).
+
+normalize_domain() and url_domain() live in activity_common.py, which the
+tray agent bundles for its block list, and are re-exported here.
+normalize_domain() reduces a URL or host to a lowercase host name: scheme,
+credentials, path, query and port are dropped, and so is a leading `www.`
+unless the caller keeps it. registrable_domain() goes one step further, to
+the name a site is registered under (mail.google.com -> google.com,
+news.bbc.co.uk -> bbc.co.uk), using the multi-label suffixes in
+MULTI_LABEL_SUFFIXES rather than the full Public Suffix List.
+
+CategoryMatcher compiles rules ({category: [domain or process name, ...]})
+into a suffix trie over domain labels plus a process name table, so a
+lookup costs one dict step per label. A domain rule matches the domain and
+all of its subdomains, and the longest matching rule wins (docs.google.com
+can be work while google.com is not). In a browser the domain's category
+wins over the app's.
+
+categorize() is the memoized entry point ingest calls for every
+foreground_change / screen_time event. The rules are DEFAULT_RULES, with
+the patterns of a JSON file {"category": ["pattern", ...]} named by the
+SPIEGO_CATEGORIES environment variable added on top (a pattern listed
+there replaces its default category).
+"""
+import json
+import os
+from functools import lru_cache
+
+# Re-exported: the server imports these from here
+from activity_common import HOST_CHARACTERS, NON_HOST_SCHEMES, normalize_domain, url_domain  # noqa: F401
+
+CATEGORIES_ENV = 'SPIEGO_CATEGORIES'
+CACHE_SIZE = 65536
+
+# Public suffixes of two labels (the registrable domain is one label more)
+MULTI_LABEL_SUFFIXES = frozenset({
+    'co.uk', 'org.uk', 'ac.uk', 'gov.uk', 'me.uk', 'net.uk', 'ltd.uk', 'plc.uk',
+    'com.au', 'net.au', 'org.au', 'edu.au', 'gov.au',
+    'co.nz', 'net.nz', 'org.nz',
+    'co.jp', 'ne.jp', 'or.jp', 'ac.jp', 'go.jp',
+    'co.kr', 'or.kr',
+    'co.in', 'net.in', 'org.in',
+    'co.za', 'org.za',
+    'co.il', 'co.id',
+    'com.br', 'net.br', 'org.br', 'gov.br',
+    'com.cn', 'net.cn', 'org.cn', 'gov.cn',
+    'com.ar', 'com.mx', 'com.tr', 'com.tw', 'com.hk', 'com.sg', 'com.my', 'com.ph',
+    'com.pl', 'com.ua', 'com.vn', 'com.pk', 'com.sa', 'com.eg',
+    # Hosting platforms that hand out subdomains to unrelated owners
+    'github.io', 'gitlab.io', 'blogspot.com', 'appspot.com', 'herokuapp.com',
+    'azurewebsites.net', 'cloudfront.net', 'netlify.app', 'vercel.app', 'pages.dev',
+})
+
+# Patterns ending in .exe are process names, with a dot domains; dotless ones
+# (slack, localhost) match both a process name and a local host name
+DEFAULT_RULES = {
+    'work': [
+        'github.com', 'gitlab.com', 'bitbucket.org', 'atlassian.net', 'stackoverflow.com',
+        'docs.google.com', 'drive.google.com', 'mail.google.com', 'calendar.google.com', 'meet.google.com',
+        'office.com', 'office365.com', 'sharepoint.com', 'outlook.live.com', 'teams.microsoft.com',
+        'slack.com', 'zoom.us', 'notion.so', 'trello.com', 'asana.com', 'figma.com', 'salesforce.com',
+        'Code.exe', 'devenv.exe', 'pycharm64.exe', 'idea64.exe', 'WindowsTerminal.exe', 'cmd.exe',
+        'powershell.exe', 'notepad++.exe', 'EXCEL.EXE', 'WINWORD.EXE', 'POWERPNT.EXE', 'OUTLOOK.EXE',
+        'ONENOTE.EXE', 'Teams.exe', 'ms-teams.exe', 'slack.exe', 'Zoom.exe', 'AcroRd32.exe', 'Acrobat.exe',
+    ],
+    'social': [
+        'facebook.com', 'messenger.com', 'instagram.com', 'twitter.com', 'x.com', 'reddit.com',
+        'linkedin.com', 'tiktok.com', 'pinterest.com', 'snapchat.com', 'tumblr.com', 'threads.net',
+        'whatsapp.com', 'telegram.org', 'discord.com', 'bsky.app', 'mastodon.social',
+        'WhatsApp.exe', 'Telegram.exe', 'Discord.exe',
+    ],
+    'video': [
+        'youtube.com', 'youtu.be', 'netflix.com', 'twitch.tv', 'vimeo.com', 'dailymotion.com',
+        'primevideo.com', 'disneyplus.com', 'hulu.com', 'max.com', 'crunchyroll.com',
+        'vlc.exe', 'wmplayer.exe', 'Video.UI.exe', 'mpc-hc64.exe', 'PotPlayerMini64.exe',
+    ],
+}
+
+
+def registrable_domain(host):
+    """Public suffix plus one label: mail.google.com -> google.com; IPs and short names unchanged"""
+    if not host:
+        return host
+    labels = host.split('.')
+    if len(labels) <= 2 or labels[-1].isdigit():
+        return host
+    suffix = 2 if f'{labels[-2]}.{labels[-1]}' in MULTI_LABEL_SUFFIXES else 1
+    return '.'.join(labels[-suffix - 1:])
+
+
+def process_key(name):
+    name = name.strip().lower()
+    return name[:-4] if name.endswith('.exe') else name
+
+
+def is_process_pattern(pattern):
+    pattern = pattern.strip().lower()
+    return pattern.endswith('.exe') or '.' not in pattern
+
+
+class CategoryMatcher:
+    """Domain and process name rules compiled for per-event lookups
+
+    trie maps domain labels from the right (com -> google -> docs); the
+    None key of a node holds the category of the domain ending there.
+    """
+
+    def __init__(self, rules=None):
+        self.trie = {}
+        self.processes = {}
+        if rules:
+            self.update(rules)
+
+    def update(self, rules):
+        """Add {category: [pattern, ...]}; a pattern seen before moves to the new category"""
+        for category, patterns in rules.items():
+            for pattern in patterns:
+                self.add(pattern, category)
+
+    def add(self, pattern, category):
+        if not pattern or not pattern.strip():
+            return
+        if is_process_pattern(pattern):
+            self.processes[process_key(pattern)] = category
+            if pattern.strip().lower().endswith('.exe'):
+                return
+        node = self.trie
+        for label in reversed(normalize_domain(pattern).split('.')):
+            node = node.setdefault(label, {})
+        node[None] = category
+
+    def domain_category(self, host):
+        """Category of the longest rule the host is (a subdomain of); None if no rule matches"""
+        if not host:
+            return None
+        node = self.trie
+        found = None
+        for label in reversed(host.split('.')):
+            node = node.get(label)
+            if node is None:
+                break
+            found = node.get(None, found)
+        return found
+
+    def process_category(self, name):
+        return self.processes.get(process_key(name)) if name else None
+
+    def categorize(self, process_name=None, url=None):
+        return self.domain_category(url_domain(url)) or self.process_category(process_name)
+
+
+def load_matcher(path=None):
+    """DEFAULT_RULES plus the rules file at path (default: $SPIEGO_CATEGORIES)"""
+    matcher = CategoryMatcher(DEFAULT_RULES)
+    path = path or os.environ.get(CATEGORIES_ENV)
+    if path:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                matcher.update(json.load(f))
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            print(f"Could not load categories from {path}: {e}")
+    return matcher
+
+
+MATCHER = load_matcher()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def categorize(process_name=None, url=None):
+    """Category of a focused app and URL ('work', 'social', 'video', ...); None if uncategorized"""
+    return MATCHER.categorize(process_name, url)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def name_category(name):
+    """Category of an app or domain name as stored in sessions and daily_usage"""
+    if not name:
+        return None
+    if name.lower().endswith('.exe'):
+        return MATCHER.process_category(name)
+    if '.' not in name:
+        # An app without .exe or a dotless host (localhost, intranet)
+        return MATCHER.process_category(name) or MATCHER.domain_category(name.lower())
+    return MATCHER.domain_category(name)
+
+
+def session_category(app, domain):
+    """Category of a focus session: its domain's, else its app's"""
+    return name_category(domain) or name_category(app)
@@ -0,0 +1,740 @@
+"""
+event_store.py
+
+Shared SQLite storage layer for the activity logger servers.
+Holds the schema, the string interning tables and the event row encoding
+used by both server.py and server_tray.py.
+
+High-repetition strings (hostname, process name, process path, window
+title and URL) are stored once in small dictionary tables and referenced
+from the events table by integer id.
+
+The stored payload leaves out everything that already lives in a column
+(type, timestamp and the interned strings), packs keystroke lists into
+delta-encoded arrays and zlib-compresses anything above COMPRESS_THRESHOLD.
+decode_event() reverses all of this, and still reads rows written in the
+older plain-JSON form.
+"""
+import hashlib
+import json
+import sqlite3
+import zlib
+from datetime import datetime, timedelta, timezone
+
+import daily_summary
+import device_state
+import domains
+import sessionizer
+import text_search
+
+# event field -> (dictionary table, events column)
+INTERNED_FIELDS = {
+    'hostname': ('hosts', 'host_id'),
+    'process_name': ('process_names', 'process_name_id'),
+    'process_path': ('process_paths', 'process_path_id'),
+    'title': ('titles', 'title_id'),
+    'url': ('urls', 'url_id'),
+}
+# Every dictionary table: the interned fields plus the category ingest derives for
+# CATEGORIZED_TYPES (domains.py), which is a column but not part of the payload
+DICTIONARY_TABLES = dict(INTERNED_FIELDS, category=('categories', 'category_id'))
+CATEGORIZED_TYPES = ('foreground_change', 'screen_time')
+
+# Cap on cached strings per field; titles are effectively unbounded
+INTERN_CACHE_LIMIT = 50000
+
+MIGRATE_BATCH = 5000
+
+# Positions in split_event() strings
+PROCESS_NAME_INDEX = list(INTERNED_FIELDS).index('process_name')
+URL_INDEX = list(INTERNED_FIELDS).index('url')
+
+# Payloads longer than this (compact JSON, bytes) are stored zlib-compressed
+COMPRESS_THRESHOLD = 512
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+ZERO = timedelta(0)
+MICROSECOND = timedelta(microseconds=1)
+
+# Streaming NDJSON ingest: read size per step and the longest accepted line
+BULK_CHUNK = 64 * 1024
+MAX_NDJSON_LINE = 1024 * 1024
+
+ROLLUP_UPSERT_SQL = '''
+    INSERT INTO hourly_counts (hour, host_id, event_type, count) VALUES (?, ?, ?, ?)
+    ON CONFLICT (hour, host_id, event_type) DO UPDATE SET count = count + excluded.count
+'''
+
+# Secondary indexes on events; bulk_import.py drops and rebuilds these
+EVENT_INDEXES = {
+    'idx_events_timestamp': 'CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events(timestamp)',
+    'idx_events_type': 'CREATE INDEX IF NOT EXISTS idx_events_type ON events(event_type)',
+    'idx_events_host_id': 'CREATE INDEX IF NOT EXISTS idx_events_host_id ON events(host_id)',
+    'idx_events_process_name_id': 'CREATE INDEX IF NOT EXISTS idx_events_process_name_id ON events(process_name_id)',
+    # Map text_search hits on titles / URLs to events
+    'idx_events_title_id': 'CREATE INDEX IF NOT EXISTS idx_events_title_id ON events(title_id, timestamp)',
+    'idx_events_url_id': 'CREATE INDEX IF NOT EXISTS idx_events_url_id ON events(url_id, timestamp)',
+    # Category reports; partial, so uncategorized events cost nothing at ingest
+    'idx_events_category': 'CREATE INDEX IF NOT EXISTS idx_events_category ON events(category_id, timestamp) '
+                           'WHERE category_id IS NOT NULL',
+}
+
+# agent_health event field -> agent_health column (numeric samples, charted per host)
+AGENT_HEALTH_FIELDS = (
+    'cpu_percent', 'rss_bytes', 'threads', 'queue_depth', 'spool_bytes',
+    'batches_sent', 'batches_failed', 'events_sent', 'uia_share', 'input_rate',
+)
+
+INSERT_AGENT_HEALTH_SQL = '''
+    INSERT INTO agent_health (host_id, timestamp, agent_version, {})
+    VALUES (?, ?, ?, {})
+'''.format(', '.join(AGENT_HEALTH_FIELDS), ', '.join('?' for _ in AGENT_HEALTH_FIELDS))
+
+INSERT_EVENT_SQL = '''
+    INSERT INTO events (timestamp, event_type, data, {})
+    VALUES (?, ?, ?, {})
+'''.format(
+    ', '.join(column for _, column in DICTIONARY_TABLES.values()),
+    ', '.join('?' for _ in DICTIONARY_TABLES)
+)
+
+
+def init_db(path):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+
+    # Events table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            hostname TEXT,
+            data TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Devices table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS devices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hostname TEXT UNIQUE NOT NULL,
+            platform TEXT,
+            python_version TEXT,
+            cpu_count INTEGER,
+            memory_total INTEGER,
+            last_seen DATETIME,
+            mac_addresses TEXT
+        )
+    ''')
+
+    # Dictionary tables and their foreign key columns on events
+    existing = {row[1] for row in cursor.execute('PRAGMA table_info(events)')}
+    new_categories = 'category_id' not in existing
+    for table, column in DICTIONARY_TABLES.values():
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                id INTEGER PRIMARY KEY,
+                value TEXT UNIQUE NOT NULL
+            )
+        ''')
+        if column not in existing:
+            cursor.execute(f'ALTER TABLE events ADD COLUMN {column} INTEGER REFERENCES {table}(id)')
+
+    # Read view with the interned strings joined back in
+    joins = []
+    columns = []
+    for field, (table, column) in DICTIONARY_TABLES.items():
+        joins.append(f'LEFT JOIN {table} ON {table}.id = e.{column}')
+        columns.append(f'{table}.value AS {field}')
+    cursor.execute('DROP VIEW IF EXISTS events_view')
+    cursor.execute(f'''
+        CREATE VIEW events_view AS
+        SELECT e.id, e.timestamp, e.event_type, e.host_id, e.data, e.created_at,
+               {', '.join(columns)}
+        FROM events e
+        {' '.join(joins)}
+    ''')
+
+    # Hourly event counts per host and type, kept current at ingest
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS hourly_counts (
+            hour TEXT NOT NULL,
+            host_id INTEGER NOT NULL,
+            event_type TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (hour, host_id, event_type)
+        ) WITHOUT ROWID
+    ''')
+    # Per-host ranges (device_state.py's 24h counts)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_hourly_counts_host ON hourly_counts(host_id, hour)')
+
+    # Agent self-telemetry samples, one row per agent_health event
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS agent_health (
+            id INTEGER PRIMARY KEY,
+            host_id INTEGER NOT NULL,
+            timestamp TEXT NOT NULL,
+            agent_version TEXT,
+            cpu_percent REAL,
+            rss_bytes INTEGER,
+            threads INTEGER,
+            queue_depth INTEGER,
+            spool_bytes INTEGER,
+            batches_sent INTEGER,
+            batches_failed INTEGER,
+            events_sent INTEGER,
+            uia_share REAL,
+            input_rate REAL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_agent_health_host_time ON agent_health(host_id, timestamp)')
+
+    # Per-host domain block lists served to agents (same layout as the Spiego web app)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS blocked_sites (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hostname TEXT NOT NULL,
+            domain TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (hostname, domain)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_blocked_sites_hostname ON blocked_sites(hostname)')
+
+    # Focus sessions, per-day summaries and live device state, maintained at ingest by
+    # sessionizer.py / daily_summary.py / device_state.py
+    sessionizer.create_tables(cursor)
+    daily_summary.create_tables(cursor)
+    device_state.create_tables(cursor)
+    # Full-text index over the title / URL / process name dictionaries (text_search.py)
+    text_search.create_index(cursor)
+
+    # Create indexes
+    for sql in EVENT_INDEXES.values():
+        cursor.execute(sql)
+    cursor.execute('DROP INDEX IF EXISTS idx_events_hostname')
+
+    conn.commit()
+
+    migrate_legacy_rows(conn, StringInterner())
+    if conn.execute('SELECT 1 FROM hourly_counts LIMIT 1').fetchone() is None:
+        backfill_rollups(conn)
+        conn.commit()
+    if new_categories:
+        backfill_categories(conn, StringInterner())
+        conn.commit()
+    if new_categories or conn.execute('SELECT 1 FROM daily_summaries LIMIT 1').fetchone() is None:
+        # Sessions and summaries are built in one pass, so start both from scratch
+        # (also when categories are new: sessions then get normalized domains and
+        # daily_usage its per-category seconds)
+        for table in ('sessions', 'open_sessions', 'daily_summaries', 'daily_usage'):
+            conn.execute(f'DELETE FROM {table}')
+        backfill_sessions(conn)
+        conn.commit()
+    if conn.execute('SELECT 1 FROM device_state LIMIT 1').fetchone() is None:
+        device_state.backfill_state(conn)
+        conn.commit()
+    conn.close()
+
+
+def migrate_legacy_rows(conn, interner):
+    """Move rows written before interning (host_id IS NULL) onto the dictionary tables"""
+    cursor = conn.cursor()
+    migrated = 0
+    last_id = 0
+    while True:
+        # By id, so each row is visited once even if it would come out with host_id NULL again
+        rows = cursor.execute(
+            'SELECT id, hostname, data FROM events WHERE host_id IS NULL AND id > ? ORDER BY id LIMIT ?',
+            (last_id, MIGRATE_BATCH)
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        updates = []
+        for event_id, hostname, data in rows:
+            try:
+                # Legacy rows hold plain JSON; rows stored without a host id an encoded payload
+                event = decode_payload(data)
+            except (TypeError, ValueError, AttributeError, zlib.error):
+                event = {}
+            if hostname:
+                event['hostname'] = hostname
+            event['hostname'] = event_hostname(event)
+            ids, payload = encode_event(cursor, event, interner)
+            updates.append((payload, *ids, event_id))
+        assignments = ', '.join(f'{column} = ?' for _, column in INTERNED_FIELDS.values())
+        cursor.executemany(
+            f'UPDATE events SET hostname = NULL, data = ?, {assignments} WHERE id = ?',
+            updates
+        )
+        conn.commit()
+        interner.commit(conn)
+        migrated += len(rows)
+    return migrated
+
+
+class StringInterner:
+    """In-memory cache of string -> id for the dictionary tables.
+
+    Lookups that hit the cache never touch SQLite. Misses insert the string
+    (if new) inside the caller's transaction. Ids inserted that way are kept
+    for that connection only, and commit(conn) moves them into the shared
+    cache once the transaction has committed, so other threads never use
+    an id a rollback can take back. After a rollback call rollback(conn).
+
+    lookups/misses are plain counters for metrics (approximate across threads).
+    """
+
+    def __init__(self, limit=INTERN_CACHE_LIMIT):
+        self.limit = limit
+        self.cache = {field: {} for field in DICTIONARY_TABLES}
+        # connection -> {field: {string: id}} inserted in its open transaction
+        self.pending = {}
+        self.lookups = 0
+        self.misses = 0
+
+    def intern(self, cursor, field, value):
+        self.lookups += 1
+        string_id = self.cache[field].get(value)
+        if string_id is not None:
+            return string_id
+        conn = cursor.connection
+        pending = self.pending.get(conn)
+        if pending is None:
+            pending = self.pending[conn] = {name: {} for name in DICTIONARY_TABLES}
+        fresh = pending[field]
+        string_id = fresh.get(value)
+        if string_id is not None:
+            return string_id
+        self.misses += 1
+        table = DICTIONARY_TABLES[field][0]
+        cursor.execute(f'INSERT OR IGNORE INTO {table} (value) VALUES (?)', (value,))
+        string_id = cursor.execute(f'SELECT id FROM {table} WHERE value = ?', (value,)).fetchone()[0]
+        if len(fresh) >= self.limit:
+            fresh.clear()
+        fresh[value] = string_id
+        return string_id
+
+    def commit(self, conn):
+        """Share the ids conn's transaction inserted; call after it committed"""
+        pending = self.pending.pop(conn, None)
+        if pending is None:
+            return
+        for field, fresh in pending.items():
+            cache = self.cache[field]
+            if len(cache) + len(fresh) > self.limit:
+                cache.clear()
+            cache.update(fresh)
+
+    def rollback(self, conn):
+        """Forget the ids conn's rolled back transaction (or savepoint) inserted"""
+        self.pending.pop(conn, None)
+
+    def lookup(self, cursor, field, value):
+        """Resolve a string to its id without inserting; None if never seen"""
+        string_id = self.cache[field].get(value)
+        if string_id is not None:
+            return string_id
+        table = DICTIONARY_TABLES[field][0]
+        row = cursor.execute(f'SELECT id FROM {table} WHERE value = ?', (value,)).fetchone()
+        return row[0] if row else None
+
+    def clear(self):
+        for cache in self.cache.values():
+            cache.clear()
+        self.pending.clear()
+
+
+def pack_keystrokes(keystrokes):
+    """[{'key', 'timestamp'}, ...] -> {'k': keys, 't0': first microsecond, 'dt': deltas}
+
+    Returns None unless every timestamp is a UTC ISO string that round-trips
+    exactly, so unpack_keystrokes() always gives back the original list.
+    """
+    keys = []
+    times = []
+    for item in keystrokes:
+        if not isinstance(item, dict) or len(item) != 2 or 'key' not in item:
+            return None
+        ts = item.get('timestamp')
+        try:
+            parsed = datetime.fromisoformat(ts)
+        except (TypeError, ValueError):
+            return None
+        if parsed.utcoffset() != ZERO or parsed.isoformat() != ts:
+            return None
+        keys.append(item['key'])
+        times.append((parsed - EPOCH) // MICROSECOND)
+    return {
+        'k': keys,
+        't0': times[0] if times else 0,
+        'dt': [b - a for a, b in zip(times, times[1:])],
+    }
+
+
+def unpack_keystrokes(packed):
+    keystrokes = []
+    micros = packed['t0']
+    deltas = packed['dt']
+    last_second = None
+    prefix = None
+    for i, key in enumerate(packed['k']):
+        if i:
+            micros += deltas[i - 1]
+        second, fraction = divmod(micros, 1000000)
+        # Keys arrive several per second, so reuse the formatted date/time part
+        if second != last_second:
+            prefix = (EPOCH + timedelta(seconds=second)).isoformat()[:19]
+            last_second = second
+        if fraction:
+            timestamp = f'{prefix}.{fraction:06d}+00:00'
+        else:
+            timestamp = prefix + '+00:00'
+        keystrokes.append({'key': key, 'timestamp': timestamp})
+    return keystrokes
+
+
+def encode_payload(payload):
+    """Compact JSON text, or zlib-compressed bytes (stored as a BLOB) above the threshold"""
+    keystrokes = payload.get('keystrokes')
+    if isinstance(keystrokes, list) and keystrokes:
+        packed = pack_keystrokes(keystrokes)
+        if packed is not None:
+            payload = dict(payload)
+            del payload['keystrokes']
+            payload['_keystrokes'] = packed
+    text = json.dumps(payload, separators=(',', ':'), ensure_ascii=False)
+    if len(text) > COMPRESS_THRESHOLD:
+        return zlib.compress(text.encode('utf-8'))
+    return text
+
+
+def decode_payload(data):
+    if isinstance(data, bytes):
+        data = zlib.decompress(data)
+    payload = json.loads(data)
+    packed = payload.pop('_keystrokes', None)
+    if packed is not None:
+        payload['keystrokes'] = unpack_keystrokes(packed)
+    return payload
+
+
+def split_event(event):
+    """Separate the interned strings (in INTERNED_FIELDS order) from the stored payload
+
+    type and timestamp are dropped from the payload since they are columns.
+    Needs no database, so bulk_import.py runs it in worker processes.
+    """
+    payload = dict(event)
+    payload.pop('type', None)
+    payload.pop('timestamp', None)
+    strings = []
+    for field in INTERNED_FIELDS:
+        value = payload.get(field)
+        if isinstance(value, str) and value:
+            strings.append(value)
+            del payload[field]
+        else:
+            strings.append(None)
+    return strings, encode_payload(payload)
+
+
+def encode_event(cursor, event, interner):
+    """Split an event into interned ids (in INTERNED_FIELDS order) and the stored payload"""
+    strings, payload = split_event(event)
+    return intern_strings(cursor, strings, interner), payload
+
+
+def intern_strings(cursor, strings, interner):
+    return [
+        interner.intern(cursor, field, value) if value is not None else None
+        for field, value in zip(INTERNED_FIELDS, strings)
+    ]
+
+
+def event_ids(cursor, event_type, strings, interner):
+    """Dictionary ids (in DICTIONARY_TABLES order) for an event's split_event() strings"""
+    ids = intern_strings(cursor, strings, interner)
+    category = event_category(event_type, strings)
+    ids.append(interner.intern(cursor, 'category', category) if category else None)
+    return ids
+
+
+def event_category(event_type, strings):
+    """domains.categorize() for foreground_change / screen_time events, else None"""
+    if event_type not in CATEGORIZED_TYPES:
+        return None
+    return domains.categorize(strings[PROCESS_NAME_INDEX], strings[URL_INDEX])
+
+
+def event_hostname(event):
+    """The event's hostname, or 'unknown' when it is missing or not a non-empty string"""
+    hostname = event.get('hostname')
+    return hostname if isinstance(hostname, str) and hostname else 'unknown'
+
+
+def normalize_event(event):
+    """Column values for an event: (event_type, timestamp, hostname)"""
+    return (
+        event.get('type', 'unknown'),
+        event.get('timestamp', datetime.utcnow().isoformat()),
+        event_hostname(event),
+    )
+
+
+def event_row(cursor, event, interner):
+    """Encode one event into (insert parameters, (event_type, timestamp, hostname))"""
+    event_type, timestamp, hostname = normalize_event(event)
+    strings, payload = split_event(dict(event, hostname=hostname))
+    ids = event_ids(cursor, event_type, strings, interner)
+    return (timestamp, event_type, payload, *ids), (event_type, timestamp, hostname)
+
+
+def store_event(cursor, event, interner):
+    """Insert one event; returns (event_type, timestamp, hostname)"""
+    return store_events(cursor, [event], interner)[0]
+
+
+def store_events(cursor, events, interner):
+    """Insert a batch of events with one executemany; returns [(event_type, timestamp, hostname), ...]"""
+    rows = []
+    stored = []
+    for event in events:
+        params, info = event_row(cursor, event, interner)
+        rows.append(params)
+        stored.append(info)
+    cursor.executemany(INSERT_EVENT_SQL, rows)
+    update_rollups(cursor, [(row[3], row[0], row[1]) for row in rows])
+    health = []
+    for row, event in zip(rows, events):
+        if row[1] == 'agent_health':
+            health.append((row[3], row[0], event))
+        elif row[1] == sessionizer.MINUTE_TYPE:
+            sample = sessionizer.record_health(row[0], event)
+            if sample:
+                health.append((row[3], *sample))
+    store_agent_health(cursor, health)
+    session_rows = [(row[3], row[0], row[1], event) for row, event in zip(rows, events)]
+    hosts = sessionizer.update_sessions(cursor, session_rows)
+    daily_summary.update_summaries(cursor, session_rows, hosts)
+    device_state.update_state(cursor, session_rows, hosts)
+    return stored
+
+
+def store_agent_health(cursor, samples):
+    """Copy agent_health events [(host_id, timestamp, event), ...] into the agent_health table"""
+    if not samples:
+        return
+    cursor.executemany(INSERT_AGENT_HEALTH_SQL, [
+        (host_id, timestamp, event.get('agent_version'), *(event.get(field) for field in AGENT_HEALTH_FIELDS))
+        for host_id, timestamp, event in samples
+    ])
+
+
+def blocked_sites(cursor, hostname=None):
+    """{hostname: [domain, ...]} for one host or all of them"""
+    if hostname is None:
+        rows = cursor.execute('SELECT hostname, domain FROM blocked_sites ORDER BY hostname, domain')
+    else:
+        rows = cursor.execute('SELECT hostname, domain FROM blocked_sites WHERE hostname = ? ORDER BY domain',
+                              (hostname,))
+    lists = {}
+    for host, domain in rows:
+        lists.setdefault(host, []).append(domain)
+    return lists
+
+
+def blocked_version(domains):
+    """Short fingerprint of a block list, echoed back by long-polling agents as ?since="""
+    return hashlib.sha1('\n'.join(domains).encode('utf-8')).hexdigest()[:12]
+
+
+def hour_bucket(timestamp):
+    """'%Y-%m-%d %H:00:00' in UTC, matching SQLite strftime() on the same ISO string"""
+    try:
+        parsed = datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime('%Y-%m-%d %H:00:00')
+
+
+def update_rollups(cursor, rows):
+    """Add (host_id, timestamp, event_type) rows to hourly_counts"""
+    counts = {}
+    for host_id, timestamp, event_type in rows:
+        hour = hour_bucket(timestamp)
+        if hour is None:
+            continue
+        key = (hour, host_id, event_type)
+        counts[key] = counts.get(key, 0) + 1
+    cursor.executemany(ROLLUP_UPSERT_SQL, [(*key, count) for key, count in counts.items()])
+
+
+def backfill_rollups(conn, after_id=0):
+    """Rebuild hourly_counts from events with id > after_id (all events by default)"""
+    conn.execute('''
+        INSERT INTO hourly_counts (hour, host_id, event_type, count)
+        SELECT strftime('%Y-%m-%d %H:00:00', timestamp) AS hour, host_id, event_type, COUNT(*)
+        FROM events
+        WHERE id > ? AND host_id IS NOT NULL AND hour IS NOT NULL
+        GROUP BY hour, host_id, event_type
+        ON CONFLICT (hour, host_id, event_type) DO UPDATE SET count = count + excluded.count
+    ''', (after_id,))
+
+
+def backfill_categories(conn, interner):
+    """Set category_id on stored foreground_change / screen_time events (databases from before categories)
+
+    Categories depend only on the (process name, URL) pair, so each distinct
+    pair is categorized once and applied with one UPDATE through a temp table.
+    """
+    cursor = conn.cursor()
+    marks = ', '.join('?' * len(CATEGORIZED_TYPES))
+    pairs = cursor.execute(f'''
+        SELECT p.process_name_id, p.url_id, n.value, u.value
+        FROM (SELECT DISTINCT process_name_id, url_id FROM events WHERE event_type IN ({marks})) p
+        LEFT JOIN process_names n ON n.id = p.process_name_id
+        LEFT JOIN urls u ON u.id = p.url_id
+    ''', CATEGORIZED_TYPES).fetchall()
+    categorized = []
+    for process_name_id, url_id, process_name, url in pairs:
+        category = domains.categorize(process_name, url)
+        if category:
+            categorized.append((process_name_id or 0, url_id or 0, interner.intern(cursor, 'category', category)))
+    if not categorized:
+        return 0
+    cursor.execute('CREATE TEMP TABLE category_pairs (process_name_id INTEGER, url_id INTEGER, category_id INTEGER, '
+                   'PRIMARY KEY (process_name_id, url_id))')
+    cursor.executemany('INSERT INTO category_pairs VALUES (?, ?, ?)', categorized)
+    cursor.execute(f'''
+        UPDATE events SET category_id = (
+            SELECT c.category_id FROM category_pairs c
+            WHERE c.process_name_id = COALESCE(events.process_name_id, 0) AND c.url_id = COALESCE(events.url_id, 0)
+        )
+        WHERE event_type IN ({marks})
+    ''', CATEGORIZED_TYPES)
+    updated = cursor.rowcount
+    cursor.execute('DROP TABLE category_pairs')
+    return updated
+
+
+def backfill_sessions(conn, batch=5000):
+    """Rebuild sessions and daily summaries from events in timestamp order (databases from before them)"""
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    # Only the event types the sessionizer and summaries read need their payload decoded
+    needs_payload = set(sessionizer.FOCUS_TYPES + sessionizer.AFK_START_TYPES + sessionizer.AFK_END_TYPES
+                        + tuple(daily_summary.KEY_FIELDS))
+    last = ('', 0)
+    while True:
+        rows = cursor.execute('''
+            SELECT id, timestamp, event_type, host_id, data, hostname, process_name, process_path, title, url
+            FROM events_view WHERE (timestamp, id) > (?, ?) ORDER BY timestamp, id LIMIT ?
+        ''', (*last, batch)).fetchall()
+        if not rows:
+            break
+        last = (rows[-1]['timestamp'], rows[-1]['id'])
+        session_rows = [
+            (row['host_id'], row['timestamp'], row['event_type'],
+             decode_event(row) if row['event_type'] in needs_payload else {})
+            for row in rows
+        ]
+        daily_summary.update_summaries(cursor, session_rows, sessionizer.update_sessions(cursor, session_rows))
+    conn.row_factory = None
+
+
+def upsert_device(cursor, event, hostname, timestamp):
+    """Record device metadata from a metadata event"""
+    cursor.execute('''
+        INSERT OR REPLACE INTO devices 
+        (hostname, platform, python_version, cpu_count, memory_total, last_seen, mac_addresses)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        hostname,
+        event.get('platform', 'unknown'),
+        event.get('python_version', 'unknown'),
+        event.get('cpu_count', 0),
+        event.get('memory_total', 0),
+        timestamp,
+        json.dumps(event.get('mac_addresses', []))
+    ))
+
+
+def gunzip_chunks(chunks, chunk_size=BULK_CHUNK):
+    """Incrementally gunzip an iterable of byte chunks (multi-member safe, bounded output per step)"""
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        while chunk:
+            out = decompressor.decompress(chunk, chunk_size)
+            if out:
+                yield out
+            if decompressor.eof:
+                chunk = decompressor.unused_data
+                decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            else:
+                chunk = decompressor.unconsumed_tail
+        # Drain output held back by the max_length limit
+        while not decompressor.eof:
+            out = decompressor.decompress(b'', chunk_size)
+            if not out:
+                break
+            yield out
+
+
+def read_chunks(stream, chunk_size=BULK_CHUNK):
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def iter_ndjson(chunks, max_line=MAX_NDJSON_LINE):
+    """Yield one event per NDJSON line from byte chunks; None for lines that are not a JSON object
+
+    Only one partial line is held in memory, so memory use is bounded by
+    the chunk size and max_line regardless of the input size.
+    """
+    pending = b''
+    for chunk in chunks:
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        if len(pending) > max_line:
+            raise ValueError(f'NDJSON line longer than {max_line} bytes')
+        for line in lines:
+            if line.strip():
+                yield _parse_ndjson_line(line)
+    if pending.strip():
+        yield _parse_ndjson_line(pending)
+
+
+def _parse_ndjson_line(line):
+    try:
+        event = json.loads(line)
+    except ValueError:
+        return None
+    return event if isinstance(event, dict) else None
+
+
+def decode_event(row):
+    """Rebuild the original event dict from an events_view row"""
+    event = decode_payload(row['data'])
+    event.setdefault('type', row['event_type'])
+    event.setdefault('timestamp', row['timestamp'])
+    for field in INTERNED_FIELDS:
+        value = row[field]
+        if value is not None:
+            event[field] = value
+    return event
+
+
+def host_id_for(cursor, interner, hostname):
+    """Host id for query filters; -1 (matches nothing) for unknown hosts"""
+    host_id = interner.lookup(cursor, 'hostname', hostname)
+    return host_id if host_id is not None else -1
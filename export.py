@@ -0,0 +1,332 @@
+"""
+export.py
+
+Columnar export of event history, for analysis outside the server.
+
+Writes one compressed NumPy archive (.npz) per day instead of paging through
+/api/dashboard/recent_events. Each file holds one array per column:
+
+    id              int64
+    timestamp       datetime64[us] (UTC; naive timestamps are taken as UTC)
+    event_type      int32 codes into event_type_values
+    hostname, process_name, process_path, title, url
+                    int32 codes into <column>_values, -1 where the event has none
+    data_bytes, data_offsets
+                    (with --with-data) the rest of each event as JSON, UTF-8,
+                    row i at data_bytes[data_offsets[i]:data_offsets[i + 1]]
+
+String columns are dictionary-encoded per file, which is close to how they are
+stored (interned ids), so a day is read with one indexed range scan and no
+payload decoding. Days are taken from the stored timestamps, read in chunks
+of FETCH_ROWS and written one at a time, so memory is bounded by one day.
+
+    python export.py --db activity_logs.db --out exports --from 2026-10-01 --to 2026-10-31
+
+The server offers the same files at /api/export/<day>. To read them:
+
+    import export
+    day = export.load('exports/events-2026-10-01.npz')
+    day['timestamp'], day['title']        # title decoded to an object array (None if missing)
+    week = export.load_dir('exports', '2026-10-01', '2026-10-07')
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import sqlite3
+import sys
+import time
+import warnings
+from datetime import date, timedelta
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import event_store
+import sessionizer
+import shards
+
+FORMAT_VERSION = 1
+FETCH_ROWS = 50000
+# Dictionary-encoded columns: field -> (table, events column)
+STRING_COLUMNS = event_store.INTERNED_FIELDS
+NAT = -2 ** 63
+
+
+def require_numpy():
+    if np is None:
+        raise RuntimeError('Missing dependency: numpy (install with: pip install numpy)')
+
+
+def parse_day(value):
+    """'YYYY-MM-DD' -> date; ValueError otherwise"""
+    return date.fromisoformat(value)
+
+
+def file_name(day):
+    return f'events-{day}.npz'
+
+
+def to_datetime(values):
+    """ISO timestamp strings -> datetime64[us]; per-value parsing only when some carry an offset"""
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            return np.array(values, dtype='datetime64[us]')
+    except (ValueError, Warning):
+        micros = []
+        for value in values:
+            seconds = sessionizer.epoch(value)
+            micros.append(NAT if seconds is None else round(seconds * 1e6))
+        return np.array(micros, dtype=np.int64).view('datetime64[us]')
+
+
+def host_filter(cursor, hostname):
+    """(' AND host_id = ?', [id]) for one host; None when this database has no such host"""
+    if not hostname:
+        return '', []
+    row = cursor.execute('SELECT id FROM hosts WHERE value = ?', (hostname,)).fetchone()
+    if row is None:
+        return None
+    return ' AND host_id = ?', [row[0]]
+
+
+def day_counts(conns, first, last, hostname=None):
+    """{day: events} for days in [first, last] with events, from the hourly rollups"""
+    counts = {}
+    end = (parse_day(last) + timedelta(days=1)).isoformat()
+    for conn in conns:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        where = host_filter(cursor, hostname)
+        if where is None:
+            continue
+        cursor.execute(f'''
+            SELECT substr(hour, 1, 10) AS day, SUM(count) FROM hourly_counts
+            WHERE hour >= ? AND hour < ?{where[0]} GROUP BY day
+        ''', [first, end] + where[1])
+        for day, count in cursor.fetchall():
+            counts[day] = counts.get(day, 0) + count
+    return dict(sorted(counts.items()))
+
+
+class Dictionary:
+    """Per-file string dictionary shared by all databases being merged"""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def array(self):
+        return np.array(self.values, dtype=str)
+
+
+def encode_ids(cursor, table, ids, dictionary):
+    """Interned ids of one database (0 = missing) -> file codes (-1 = missing)"""
+    unique, inverse = np.unique(ids, return_inverse=True)
+    mapping = np.full(len(unique), -1, dtype=np.int32)
+    positions = {int(string_id): i for i, string_id in enumerate(unique)}
+    wanted = [string_id for string_id in positions if string_id]
+    for i in range(0, len(wanted), 500):
+        chunk = wanted[i:i + 500]
+        for string_id, value in cursor.execute(
+                f'SELECT id, value FROM {table} WHERE id IN ({", ".join("?" * len(chunk))})', chunk):
+            mapping[positions[string_id]] = dictionary.code(value)
+    return mapping[inverse]
+
+
+def read_day(conns, day, hostname=None, with_data=False):
+    """{column: array} for one day's events across conns, ordered by timestamp"""
+    require_numpy()
+    end = (parse_day(day) + timedelta(days=1)).isoformat()
+    fields = list(STRING_COLUMNS)
+    columns = ', '.join(column for _, column in STRING_COLUMNS.values())
+    dictionaries = {field: Dictionary() for field in ['event_type'] + fields}
+    parts = {name: [] for name in ['id', 'timestamp', 'event_type'] + fields}
+    payloads = []
+
+    for conn in conns:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        where = host_filter(cursor, hostname)
+        if where is None:
+            continue
+        # UTC offsets are cut in SQL so numpy can parse the timestamps in bulk
+        cursor.execute(f'''
+            SELECT id,
+                   CASE WHEN timestamp LIKE '%+00:00' THEN substr(timestamp, 1, length(timestamp) - 6)
+                        ELSE timestamp END,
+                   event_type, {columns}{', data' if with_data else ''}
+            FROM events WHERE timestamp >= ? AND timestamp < ?{where[0]}
+        ''', [day, end] + where[1])
+        ids = {field: [] for field in fields}
+        while True:
+            rows = cursor.fetchmany(FETCH_ROWS)
+            if not rows:
+                break
+            values = list(zip(*rows))
+            parts['id'].append(np.array(values[0], dtype=np.int64))
+            parts['timestamp'].append(to_datetime(values[1]))
+            types, inverse = np.unique(np.array(values[2], dtype=str), return_inverse=True)
+            codes = np.array([dictionaries['event_type'].code(str(value)) for value in types], dtype=np.int32)
+            parts['event_type'].append(codes[inverse])
+            for i, field in enumerate(fields):
+                # NULL (no string) becomes 0, which no interned id uses
+                ids[field].append(np.array([value or 0 for value in values[3 + i]], dtype=np.int64))
+            if with_data:
+                for data in values[-1]:
+                    payloads.append(json.dumps(event_store.decode_payload(data), separators=(',', ':'),
+                                               ensure_ascii=False).encode('utf-8'))
+        # Interned ids are per database: map them through the shared per-file dictionaries
+        lookup = conn.cursor()
+        lookup.row_factory = None
+        for field in fields:
+            if ids[field]:
+                parts[field].append(encode_ids(lookup, STRING_COLUMNS[field][0], np.concatenate(ids[field]),
+                                               dictionaries[field]))
+
+    if not parts['id']:
+        return None
+    frame = {name: np.concatenate(arrays) for name, arrays in parts.items()}
+    order = np.lexsort((frame['id'], frame['timestamp'].view(np.int64)))
+    frame = {name: array[order] for name, array in frame.items()}
+    for name, dictionary in dictionaries.items():
+        frame[f'{name}_values'] = dictionary.array()
+    if with_data:
+        lengths = np.fromiter((len(payload) for payload in payloads), np.int64, len(payloads))[order]
+        frame['data_bytes'] = np.frombuffer(b''.join(payloads[i] for i in order), dtype=np.uint8)
+        frame['data_offsets'] = np.concatenate(([0], np.cumsum(lengths)))
+    frame['format_version'] = np.array(FORMAT_VERSION)
+    return frame
+
+
+def write_day(conns, day, target, hostname=None, with_data=False):
+    """Write one day as a compressed .npz to target (path or file object); returns the event count"""
+    frame = read_day(conns, day, hostname, with_data)
+    if frame is None:
+        return 0
+    np.savez_compressed(target, **frame)
+    return len(frame['id'])
+
+
+def day_bytes(conns, day, hostname=None, with_data=False):
+    """(npz bytes, events) for one day, for serving over HTTP"""
+    buffer = io.BytesIO()
+    count = write_day(conns, day, buffer, hostname, with_data)
+    return buffer.getvalue(), count
+
+
+def export_range(db_paths, out_dir, first, last, hostname=None, with_data=False):
+    """Write one file per day with events in [first, last]; returns [(day, path, events), ...]"""
+    require_numpy()
+    os.makedirs(out_dir, exist_ok=True)
+    conns = [sqlite3.connect(path) for path in db_paths]
+    written = []
+    try:
+        for day in day_counts(conns, first, last, hostname):
+            path = os.path.join(out_dir, file_name(day))
+            count = write_day(conns, day, path, hostname, with_data)
+            if count:
+                written.append((day, path, count))
+                print(f"  {day}: {count:,} events -> {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+    finally:
+        for conn in conns:
+            conn.close()
+    return written
+
+
+def decode(values, codes):
+    """Dictionary codes -> object array of strings, None where the code is -1"""
+    table = np.empty(len(values) + 1, dtype=object)
+    table[:-1] = values
+    table[-1] = None
+    return table[codes]
+
+
+def load(path, decode_strings=True):
+    """{column: array} from one exported day
+
+    With decode_strings the dictionary columns come back as object arrays of
+    strings and 'data' (if exported) as an object array of JSON texts; without
+    it the raw codes, <column>_values and data_bytes/data_offsets are returned.
+    """
+    require_numpy()
+    with np.load(path) as archive:
+        frame = {name: archive[name] for name in archive.files}
+    if not decode_strings:
+        return frame
+    for name in ['event_type'] + list(STRING_COLUMNS):
+        frame[name] = decode(frame.pop(f'{name}_values'), frame[name])
+    if 'data_bytes' in frame:
+        blob = frame.pop('data_bytes').tobytes()
+        offsets = frame.pop('data_offsets')
+        frame['data'] = np.array([blob[offsets[i]:offsets[i + 1]].decode('utf-8')
+                                  for i in range(len(offsets) - 1)], dtype=object)
+    frame.pop('format_version', None)
+    return frame
+
+
+def load_dir(directory, first=None, last=None):
+    """Decoded columns of every exported day in directory (optionally within [first, last]), concatenated"""
+    frames = []
+    for path in sorted(glob.glob(os.path.join(directory, file_name('*')))):
+        day = os.path.basename(path)[len('events-'):-len('.npz')]
+        if (first and day < first) or (last and day > last):
+            continue
+        frames.append(load(path))
+    if not frames:
+        return {}
+    columns = set.intersection(*(set(frame) for frame in frames))
+    return {name: np.concatenate([frame[name] for frame in frames]) for name in columns}
+
+
+def main(argv=None):
+    today = date.today()
+    parser = argparse.ArgumentParser(description='Export event history as one compressed columnar file per day')
+    parser.add_argument('--db', default='activity_logs.db', help='SQLite database path')
+    parser.add_argument('--shards', type=int, default=1, help='Shard count the server runs with (see shards.py)')
+    parser.add_argument('--out', default='exports', help='Output directory')
+    parser.add_argument('--from', dest='first', default=(today - timedelta(days=6)).isoformat(),
+                        help='First day, YYYY-MM-DD (default: 6 days ago)')
+    parser.add_argument('--to', dest='last', default=today.isoformat(), help='Last day, YYYY-MM-DD (default: today)')
+    parser.add_argument('--hostname', help='Only this host')
+    parser.add_argument('--with-data', action='store_true', help='Include the rest of each event as JSON')
+    args = parser.parse_args(argv)
+
+    if np is None:
+        print("Missing dependency: numpy")
+        print("Install with: pip install numpy")
+        return 1
+    try:
+        parse_day(args.first)
+        parse_day(args.last)
+    except ValueError:
+        parser.error('--from and --to must be YYYY-MM-DD')
+    paths = shards.shard_paths(args.db, args.shards)
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"Database not found: {path}")
+            return 1
+
+    start = time.perf_counter()
+    written = export_range(paths, args.out, args.first, args.last, args.hostname, args.with_data)
+    elapsed = time.perf_counter() - start
+    events = sum(count for _, _, count in written)
+    size = sum(os.path.getsize(path) for _, path, _ in written)
+    print(f"Exported {events:,} events in {len(written)} file(s), {size / 1e6:.1f} MB, "
+          f"in {elapsed:.1f}s ({events / max(elapsed, 1e-9):,.0f} events/s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""
+metrics.py
+
+Minimal Prometheus-style metrics (text exposition format 0.0.4) for the server,
+without depending on prometheus_client.
+
+Updates are cheap: each labelled series is created once and then updated under
+its own short lock (no I/O, no allocation), so threads only contend when they
+touch the same series at the same instant. Values that already live elsewhere
+(cache counters, queue sizes) are read by callbacks at scrape time instead of
+being updated on the hot path.
+
+Usage:
+    REQUESTS = metrics.counter('http_requests_total', 'Requests served', ['route'])
+    REQUESTS.labels('/api/events').inc()
+    text = metrics.render()
+"""
+import math
+import threading
+from bisect import bisect_left
+
+# Seconds; tuned for sub-millisecond SQLite calls up to multi-second bulk requests
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = []
+# Labels added to every series not marked shared, e.g. {'worker': pid} in each
+# gunicorn worker, where every process keeps its own values (production.py)
+PROCESS_LABELS = {}
+
+
+class _Value:
+    __slots__ = ('lock', 'value')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class _HistogramValue:
+    __slots__ = ('lock', 'bounds', 'counts', 'sum')
+
+    def __init__(self, bounds):
+        self.lock = threading.Lock()
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+        self.function = None
+        self.shared = False
+
+    def new_child(self):
+        return _Value()
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self.new_child())
+        return child
+
+    def set_function(self, function, shared=False):
+        """Read the value from function() at scrape time (unlabelled metrics only)
+
+        shared: the value is the same whichever process reads it (it comes
+        from another process), so it gets no PROCESS_LABELS.
+        """
+        self.function = function
+        self.shared = shared
+
+    def samples(self):
+        if self.function is not None:
+            yield self.name, {}, self.function()
+            return
+        for key, child in list(self.children.items()):
+            yield self.name, dict(zip(self.labelnames, key)), child.value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.bounds = tuple(sorted(buckets))
+
+    def new_child(self):
+        return _HistogramValue(self.bounds)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def samples(self):
+        for key, child in list(self.children.items()):
+            labels = dict(zip(self.labelnames, key))
+            with child.lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for bound, count in zip(self.bounds + (math.inf,), counts):
+                cumulative += count
+                yield self.name + '_bucket', dict(labels, le=format_value(bound)), cumulative
+            yield self.name + '_sum', labels, total
+            yield self.name + '_count', labels, cumulative
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+def counter(name, documentation, labelnames=()):
+    return register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    return register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return register(Histogram(name, documentation, labelnames, buckets))
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def render(registry=None):
+    """All registered metrics in Prometheus text format"""
+    lines = []
+    for metric in registry if registry is not None else REGISTRY:
+        lines.append(f'# HELP {metric.name} {escape(metric.documentation)}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, value in metric.samples():
+            if PROCESS_LABELS and not metric.shared:
+                labels = dict(labels, **PROCESS_LABELS)
+            if labels:
+                label_text = ','.join(f'{k}="{escape(str(v))}"' for k, v in labels.items())
+                lines.append(f'{name}{{{label_text}}} {format_value(value)}')
+            else:
+                lines.append(f'{name} {format_value(value)}')
+    return '\n'.join(lines) + '\n'
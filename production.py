@@ -0,0 +1,89 @@
+"""
+production.py
+
+Multi-process server mode: gunicorn worker processes (each with a thread
+pool) serve the dashboard and parse ingest requests, while every write goes
+through one write_coordinator process. Readers use WAL snapshots, so neither
+side waits on the other.
+
+Started by `python server_tray.py --production --workers 4`. gunicorn runs on
+Linux/macOS only; on Windows keep using the tray server.
+"""
+import multiprocessing
+import os
+import sys
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = None
+
+import metrics
+import write_coordinator
+
+
+if BaseApplication is not None:
+    class ProductionApplication(BaseApplication):
+        def __init__(self, app, options):
+            self.application = app
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+
+def label_worker(arbiter, worker):
+    """gunicorn post_fork hook: this worker's /metrics series carry worker="<pid>"
+
+    Each worker counts only the requests it served, and a scrape is answered
+    by whichever worker accepts it, so without the label a counter would seem
+    to jump back and forth between workers' values.
+    """
+    metrics.PROCESS_LABELS['worker'] = str(os.getpid())
+
+
+def run(server, host='0.0.0.0', port=5000, workers=None, threads=8, alert_options=None):
+    """Serve server.app (the imported server_tray module) until interrupted"""
+    if BaseApplication is None:
+        print("Missing dependency: gunicorn")
+        print("Install with: pip install gunicorn (Linux/macOS only)")
+        sys.exit(1)
+
+    workers = workers or min(multiprocessing.cpu_count() + 1, 8)
+    server.init_db()
+
+    address = write_coordinator.default_address()
+    authkey = os.urandom(16)
+    writer = multiprocessing.Process(target=write_coordinator.run_writer, name='spiego-writer',
+                                     args=(server.app.config['DATABASE'], address, authkey, alert_options),
+                                     daemon=True)
+    writer.start()
+    # Workers are forked from this process after the app is loaded, so they inherit the client
+    server.writer_client = write_coordinator.WriterClient(address, authkey)
+
+    master_pid = os.getpid()
+    print(f"Production server on http://{host}:{port} "
+          f"({workers} workers x {threads} threads, writer pid {writer.pid})")
+    try:
+        ProductionApplication(server.app, {
+            'bind': f'{host}:{port}',
+            'workers': workers,
+            'threads': threads,
+            'worker_class': 'gthread',
+            'preload_app': True,
+            'post_fork': label_worker,
+            'timeout': 120,
+            'accesslog': None,
+        }).run()
+    finally:
+        # Forked workers unwind through here too; only the master owns the writer
+        if os.getpid() == master_pid:
+            writer.terminate()
+            writer.join(5)
+            if address.endswith('.sock') and os.path.exists(address):
+                os.remove(address)
@@ -0,0 +1,229 @@
+"""
+query_profiler.py
+
+Opt-in SQLite statement profiler for the server.
+
+Connections created by QueryProfiler.connect() time every execute/executemany
+plus the fetches that follow it, and aggregate by normalized SQL (literals
+replaced with ?, whitespace collapsed) together with the parameter shapes seen.
+Statements slower than the threshold are appended to a JSONL slow-query log
+with their EXPLAIN QUERY PLAN.
+
+Only used when profiling is switched on, so the normal get_db() path is
+untouched.
+"""
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+WHITESPACE = re.compile(r'\s+')
+MAX_SHAPES = 5
+RECENT_SLOW = 100
+
+
+def normalize_sql(sql):
+    sql = STRING_LITERAL.sub('?', sql)
+    sql = NUMBER_LITERAL.sub('?', sql)
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+def param_shape(params):
+    if params is None:
+        return '()'
+    if isinstance(params, dict):
+        return '{' + ', '.join(f'{k}: {type(v).__name__}' for k, v in params.items()) + '}'
+    return '(' + ', '.join(type(v).__name__ for v in params) + ')'
+
+
+class QueryProfiler:
+    def __init__(self, slow_ms=100.0, log_path=None):
+        self.slow_ms = slow_ms
+        self.log_path = log_path
+        self.lock = threading.Lock()
+        self.statements = {}
+        self.slow = deque(maxlen=RECENT_SLOW)
+        self.started = datetime.now()
+
+    def connect(self, database, **kwargs):
+        conn = sqlite3.connect(database, factory=ProfiledConnection, **kwargs)
+        conn.profiler = self
+        conn.database = database
+        return conn
+
+    def record(self, sql, shape, elapsed, rows=0, new_call=False):
+        key = normalize_sql(sql)
+        with self.lock:
+            entry = self.statements.get(key)
+            if entry is None:
+                entry = self.statements[key] = {
+                    'sql': key, 'calls': 0, 'total_s': 0.0, 'max_s': 0.0, 'rows': 0, 'shapes': [],
+                }
+            if new_call:
+                entry['calls'] += 1
+            entry['total_s'] += elapsed
+            entry['rows'] += rows
+            if shape not in entry['shapes'] and len(entry['shapes']) < MAX_SHAPES:
+                entry['shapes'].append(shape)
+        return entry
+
+    def finish(self, database, sql, params, shape, elapsed):
+        """Called once per execution with its total (execute + fetch) time"""
+        key = normalize_sql(sql)
+        with self.lock:
+            entry = self.statements.get(key)
+            if entry is not None and elapsed > entry['max_s']:
+                entry['max_s'] = elapsed
+        if elapsed * 1000 >= self.slow_ms:
+            self.log_slow(database, sql, params, shape, elapsed)
+
+    def log_slow(self, database, sql, params, shape, elapsed):
+        record = {
+            'time': datetime.now().isoformat(),
+            'ms': round(elapsed * 1000, 2),
+            'sql': WHITESPACE.sub(' ', sql).strip(),
+            'shape': shape,
+            'plan': explain(database, sql, params),
+        }
+        self.slow.append(record)
+        if self.log_path:
+            try:
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            except OSError:
+                pass
+
+    def top(self, limit=20, order='total_s'):
+        with self.lock:
+            entries = [dict(e, shapes=list(e['shapes'])) for e in self.statements.values()]
+        for e in entries:
+            e['avg_ms'] = e['total_s'] * 1000 / e['calls'] if e['calls'] else 0.0
+        entries.sort(key=lambda e: e.get(order, 0), reverse=True)
+        return entries[:limit]
+
+    def reset(self):
+        with self.lock:
+            self.statements.clear()
+            self.slow.clear()
+            self.started = datetime.now()
+
+
+def explain(database, sql, params):
+    """EXPLAIN QUERY PLAN on a separate connection so the caller's cursor is untouched"""
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return []
+    try:
+        conn = sqlite3.connect(database)
+        try:
+            rows = conn.execute('EXPLAIN QUERY PLAN ' + sql, params if params is not None else ()).fetchall()
+        finally:
+            conn.close()
+        return [row[-1] for row in rows]
+    except sqlite3.Error as e:
+        return [f'error: {e}']
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that charges execute and fetch time to the statement that produced the rows"""
+
+    current = None
+
+    def _start(self, sql, params, shape, run):
+        self._finish()
+        profiler = self.connection.profiler
+        start = time.perf_counter()
+        try:
+            return run()
+        finally:
+            elapsed = time.perf_counter() - start
+            profiler.record(sql, shape, elapsed, new_call=True)
+            self.current = [sql, params, shape, elapsed]
+
+    def _charge(self, elapsed, rows):
+        if self.current is not None:
+            self.current[3] += elapsed
+            self.connection.profiler.record(self.current[0], self.current[2], elapsed, rows=rows)
+
+    def _finish(self):
+        if self.current is not None:
+            sql, params, shape, elapsed = self.current
+            self.current = None
+            self.connection.profiler.finish(self.connection.database, sql, params, shape, elapsed)
+
+    def execute(self, sql, parameters=()):
+        return self._start(sql, parameters, param_shape(parameters),
+                           lambda: super(ProfiledCursor, self).execute(sql, parameters))
+
+    def executemany(self, sql, seq_of_parameters):
+        seq_of_parameters = list(seq_of_parameters)
+        shape = f'many[{len(seq_of_parameters)}] ' + (param_shape(seq_of_parameters[0]) if seq_of_parameters else '()')
+        return self._start(sql, None, shape,
+                           lambda: super(ProfiledCursor, self).executemany(sql, seq_of_parameters))
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._charge(time.perf_counter() - start, 0 if row is None else 1)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._charge(time.perf_counter() - start, len(rows))
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._charge(time.perf_counter() - start, len(rows))
+        self._finish()
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+class ProfiledConnection(sqlite3.Connection):
+    profiler = None
+    database = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursors = []
+
+    def cursor(self, factory=ProfiledCursor):
+        cursor = super().cursor(factory)
+        self.cursors.append(cursor)
+        return cursor
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        # Statements whose rows were never fully fetched still count once
+        for cursor in self.cursors:
+            cursor._finish()
+        self.cursors = []
+        super().close()
@@ -11,47 +11,18 @@ from datetime import datetime, timedelta
 import os
 from functools import wraps
 
+import domains
+import event_store
+
 app = Flask(__name__)
 app.config['DATABASE'] = 'activity_logs.db'
 app.config['AUTH_KEY'] = os.environ.get('AUTH_KEY', 'your-secret-auth-key-change-me')
 
+# Intern cache for hostnames, process names, paths, titles and URLs
+interner = event_store.StringInterner()
+
 def init_db():
-    conn = sqlite3.connect(app.config['DATABASE'])
-    cursor = conn.cursor()
-    
-    # Events table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS events (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
-            event_type TEXT NOT NULL,
-            hostname TEXT,
-            data TEXT NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Devices table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS devices (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            hostname TEXT UNIQUE NOT NULL,
-            platform TEXT,
-            python_version TEXT,
-            cpu_count INTEGER,
-            memory_total INTEGER,
-            last_seen DATETIME,
-            mac_addresses TEXT
-        )
-    ''')
-    
-    # Create indexes
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events(timestamp)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_type ON events(event_type)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_hostname ON events(hostname)')
-    
-    conn.commit()
-    conn.close()
+    event_store.init_db(app.config['DATABASE'])
 
 def get_db():
     conn = sqlite3.connect(app.config['DATABASE'])
@@ -85,15 +56,8 @@ def receive_events():
         cursor = conn.cursor()
         
         for event in events:
-            event_type = event.get('type', 'unknown')
-            timestamp = event.get('timestamp', datetime.utcnow().isoformat())
-            hostname = event.get('hostname', 'unknown')
-            
             # Store event
-            cursor.execute('''
-                INSERT INTO events (timestamp, event_type, hostname, data)
-                VALUES (?, ?, ?, ?)
-            ''', (timestamp, event_type, hostname, json.dumps(event)))
+            event_type, timestamp, hostname = event_store.store_event(cursor, event, interner)
             
             # Update device metadata if this is a metadata event
             if event_type == 'metadata':
@@ -112,10 +76,13 @@ def receive_events():
                 ))
         
         conn.commit()
+        interner.commit(conn)
         conn.close()
         
         return jsonify({'status': 'success', 'received': len(events)}), 200
     except Exception as e:
+        # Strings interned in a rolled back transaction must not stay cached
+        interner.clear()
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/dashboard/stats')
@@ -138,7 +105,7 @@ def dashboard_stats():
     
     # Get active devices (last 24h)
     cursor.execute('''
-        SELECT COUNT(DISTINCT hostname) as count 
+        SELECT COUNT(DISTINCT host_id) as count 
         FROM events 
         WHERE timestamp > ?
     ''', (yesterday,))
@@ -189,7 +156,7 @@ def dashboard_recent_events():
     conn = get_db()
     cursor = conn.cursor()
     
-    query = 'SELECT * FROM events WHERE 1=1'
+    query = 'SELECT * FROM events_view WHERE 1=1'
     params = []
     
     if event_type:
@@ -197,8 +164,8 @@ def dashboard_recent_events():
         params.append(event_type)
     
     if hostname:
-        query += ' AND hostname = ?'
-        params.append(hostname)
+        query += ' AND host_id = ?'
+        params.append(event_store.host_id_for(cursor, interner, hostname))
     
     query += ' ORDER BY timestamp DESC LIMIT ?'
     params.append(limit)
@@ -212,7 +179,7 @@ def dashboard_recent_events():
             'timestamp': row['timestamp'],
             'event_type': row['event_type'],
             'hostname': row['hostname'],
-            'data': json.loads(row['data'])
+            'data': event_store.decode_event(row)
         })
     
     conn.close()
@@ -239,8 +206,8 @@ def dashboard_activity_timeline():
     params = [start_time]
     
     if hostname:
-        query += ' AND hostname = ?'
-        params.append(hostname)
+        query += ' AND host_id = ?'
+        params.append(event_store.host_id_for(cursor, interner, hostname))
     
     query += ' GROUP BY hour, event_type ORDER BY hour'
     
@@ -268,44 +235,36 @@ def dashboard_top_domains():
     start_time = (datetime.utcnow() - timedelta(hours=hours)).isoformat()
     
     query = '''
-        SELECT data
-        FROM events
+        SELECT title, url, COUNT(*) as count
+        FROM events_view
         WHERE event_type = 'foreground_change'
         AND timestamp > ?
     '''
     params = [start_time]
     
     if hostname:
-        query += ' AND hostname = ?'
-        params.append(hostname)
+        query += ' AND host_id = ?'
+        params.append(event_store.host_id_for(cursor, interner, hostname))
     
+    # Count per interned title/URL pair, then fold into domains
+    query += ' GROUP BY title, url'
     cursor.execute(query, params)
     
     domain_counts = {}
     for row in cursor.fetchall():
-        try:
-            event_data = json.loads(row['data'])
-            title = event_data.get('title', '')
-            url = event_data.get('url')
-            
-            # Extract domain from URL or title
-            domain = None
-            if url:
-                # Simple domain extraction
-                try:
-                    from urllib.parse import urlparse
-                    parsed = urlparse(url if url.startswith('http') else f'http://{url}')
-                    domain = parsed.netloc or parsed.path.split('/')[0]
-                except:
-                    domain = url[:50]
-            elif title:
-                # Use title if no URL
-                domain = title[:80]
-            
-            if domain:
-                domain_counts[domain] = domain_counts.get(domain, 0) + 1
-        except:
-            pass
+        title = row['title'] or ''
+        url = row['url']
+        
+        # Extract domain from URL or title
+        domain = None
+        if url:
+            domain = domains.normalize_domain(url) or url[:50]
+        elif title:
+            # Use title if no URL
+            domain = title[:80]
+        
+        if domain:
+            domain_counts[domain] = domain_counts.get(domain, 0) + row['count']
     
     # Sort by count
     top_domains = sorted(domain_counts.items(), key=lambda x: x[1], reverse=True)[:limit]
@@ -13,12 +13,27 @@ import json
 import threading
 import webbrowser
 import socket
+import time
+import uuid
 from datetime import datetime, timedelta
 
 # Flask imports
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Response, g, request, jsonify, render_template, send_from_directory
 import sqlite3
 from functools import wraps
+from urllib.parse import quote
+
+import alerts
+import daily_summary
+import device_state
+import domains
+import event_store
+import export
+import metrics
+import query_profiler
+import sessionizer
+import tail_buffer
+import text_search
 
 # System tray imports
 try:
@@ -42,6 +57,8 @@ app.config['AUTH_KEY'] = os.environ.get('AUTH_KEY', 'your-secret-auth-key-change
 VALID_LICENSE = 'spiegoishugo'
 app.config['LICENSE_KEY'] = os.environ.get('LICENSE_KEY', '')
 app.config['SESSION_START'] = datetime.now()
+# Opt-in SQLite statement profiling (see /debug/queries)
+app.config['PROFILE_QUERIES'] = os.environ.get('PROFILE_QUERIES', '') not in ('', '0')
 
 # Global stats
 stats = {
@@ -51,49 +68,169 @@ stats = {
     'last_event': None
 }
 
+# Intern cache for hostnames, process names, paths, titles and URLs
+interner = event_store.StringInterner()
+
+# Set in production mode: writes go to the write_coordinator process instead of get_db()
+writer_client = None
+# Set by --shards N: data is split across N databases by hostname (shards.py)
+shard_set = None
+# Set by --alert-sink: offline/idle/AFK alerts from ingested events (alerts.py); in production
+# mode the engine runs in the writer process instead
+alert_engine = None
+# Set by --tail-events (tray and async modes): recent events per host in memory for the live
+# device view (tail_buffer.py); not in production mode, where each worker sees only its own requests
+tail = None
+
+# Bulk NDJSON ingest: events per transaction, jobs kept for status
+BULK_BATCH = 5000
+BULK_JOBS_KEPT = 100
+bulk_jobs = {}
+
+# Comment line sent to idle /api/stream clients so proxies keep the connection
+SSE_KEEPALIVE = 15.0
+
+# Metrics served at /metrics
+REQUEST_LATENCY = metrics.histogram('http_request_duration_seconds', 'Request latency by route',
+                                    ['route', 'method'])
+REQUESTS = metrics.counter('http_requests_total', 'Requests served', ['route', 'method', 'status'])
+EVENTS_INGESTED = metrics.counter('ingest_events_total', 'Events stored', ['endpoint'])
+INGEST_BATCH = metrics.histogram('ingest_batch_events', 'Events per ingest batch', ['endpoint'],
+                                 buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000))
+SQLITE_COMMIT = metrics.histogram('sqlite_commit_seconds', 'Time spent in COMMIT for writes')
+SQLITE_LOCK_WAIT = metrics.histogram('sqlite_lock_wait_seconds', 'Time waiting for the SQLite write lock')
+WRITE_QUEUE = metrics.gauge('sqlite_write_queue_depth', 'Writers waiting for the SQLite write lock')
+STREAM_CLIENTS = metrics.gauge('stream_clients', 'Connected SSE / long-poll clients')
+STREAM_CLIENTS.set(0)
+metrics.counter('intern_cache_lookups_total', 'String intern cache lookups').set_function(lambda: interner.lookups)
+metrics.counter('intern_cache_misses_total', 'String intern cache misses').set_function(lambda: interner.misses)
+metrics.gauge('intern_cache_hit_ratio', 'String intern cache hit ratio since start').set_function(
+    lambda: 1 - interner.misses / interner.lookups if interner.lookups else 0.0)
+metrics.gauge('bulk_jobs_running', 'Bulk ingest jobs in progress').set_function(
+    lambda: sum(1 for job in list(bulk_jobs.values()) if job['status'] == 'running'))
+metrics.gauge('process_start_time_seconds', 'Server start time (unix)').set(time.time())
+metrics.counter('alerts_fired_total', 'Offline/idle/AFK alerts fired by the alert engine').set_function(
+    lambda: sum(alert_engine.fired.values()) if alert_engine is not None else 0)
+metrics.counter('alert_delivery_failures_total', 'Alert sink deliveries that raised').set_function(
+    lambda: alert_engine.failed if alert_engine is not None else 0)
+
+def writer_stat(key):
+    if writer_client is None:
+        return 0
+    try:
+        return writer_client.stats()[key]
+    except Exception:
+        return 0
+
+metrics.gauge('writer_queue_depth', 'Batches waiting for the writer process').set_function(
+    lambda: writer_stat('queue_depth'), shared=True)
+metrics.counter('writer_commits_total', 'Group commits by the writer process').set_function(
+    lambda: writer_stat('commits'), shared=True)
+metrics.counter('writer_events_total', 'Events committed by the writer process').set_function(
+    lambda: writer_stat('events'), shared=True)
+
 def init_db():
-    conn = sqlite3.connect(app.config['DATABASE'])
-    cursor = conn.cursor()
-    
-    # Events table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS events (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
-            event_type TEXT NOT NULL,
-            hostname TEXT,
-            data TEXT NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Devices table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS devices (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            hostname TEXT UNIQUE NOT NULL,
-            platform TEXT,
-            python_version TEXT,
-            cpu_count INTEGER,
-            memory_total INTEGER,
-            last_seen DATETIME,
-            mac_addresses TEXT
-        )
-    ''')
-    
-    # Create indexes
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events(timestamp)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_type ON events(event_type)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_hostname ON events(hostname)')
-    
-    conn.commit()
-    conn.close()
+    if shard_set is not None:
+        shard_set.init_db()
+    else:
+        event_store.init_db(app.config['DATABASE'])
+
+def start_alerts(options):
+    """Run the alert engine in this process, seeded with each host's last stored event"""
+    global alert_engine
+    init_db()
+    engine = alerts.AlertEngine.from_options(options)
+    hosts = 0
+    for conn, _ in shard_dbs():
+        hosts += engine.seed(conn.cursor())
+        conn.close()
+    engine.start()
+    alert_engine = engine
+    print(f"Alert engine started ({hosts} known hosts, sinks: {', '.join(options['sinks'])})")
 
-def get_db():
-    conn = sqlite3.connect(app.config['DATABASE'])
+# Statement timings and slow-query log, used by get_db() when PROFILE_QUERIES is on
+profiler = query_profiler.QueryProfiler(
+    slow_ms=float(os.environ.get('SLOW_QUERY_MS', 100)),
+    log_path=os.environ.get('SLOW_QUERY_LOG', 'slow_queries.log'),
+)
+
+def get_db(path=None):
+    path = path or app.config['DATABASE']
+    if app.config['PROFILE_QUERIES']:
+        conn = profiler.connect(path)
+    else:
+        conn = sqlite3.connect(path)
     conn.row_factory = sqlite3.Row
     return conn
 
+def shard_dbs(hostname=None):
+    """[(connection, interner)] holding hostname's data, or every database for fleet-wide queries"""
+    if shard_set is None:
+        return [(get_db(), interner)]
+    indexes = [shard_set.shard_for(hostname)] if hostname else range(shard_set.count)
+    return [(get_db(shard_set.paths[i]), shard_set.interners[i]) for i in indexes]
+
+def begin_write(conn):
+    """Take the write lock up front (BEGIN IMMEDIATE), timing the wait"""
+    WRITE_QUEUE.inc()
+    start = time.perf_counter()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+    finally:
+        WRITE_QUEUE.dec()
+        SQLITE_LOCK_WAIT.observe(time.perf_counter() - start)
+
+def commit(conn):
+    start = time.perf_counter()
+    conn.commit()
+    SQLITE_COMMIT.observe(time.perf_counter() - start)
+
+def write_events(events):
+    """Store a batch and its device metadata; returns [(event_type, timestamp, hostname), ...]"""
+    if writer_client is not None:
+        return writer_client.store_events(events)
+    conn = get_db()
+    try:
+        cursor = conn.cursor()
+        begin_write(conn)
+        stored = event_store.store_events(cursor, events, interner)
+        for event, (event_type, timestamp, hostname) in zip(events, stored):
+            # Update device metadata if this is a metadata event
+            if event_type == 'metadata':
+                event_store.upsert_device(cursor, event, hostname, timestamp)
+        commit(conn)
+        interner.commit(conn)
+    except Exception:
+        conn.rollback()
+        # Strings interned in a rolled back transaction must not be cached
+        interner.rollback(conn)
+        raise
+    finally:
+        conn.close()
+    return stored
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.get('request_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_LATENCY.labels(route, request.method).observe(time.perf_counter() - start)
+        REQUESTS.labels(route, request.method, response.status_code).inc()
+    return response
+
+
+def license_valid(provided):
+    if provided == VALID_LICENSE:
+        return True
+
+    # If license invalid, allow only within 10 minutes of session start
+    start = app.config.get('SESSION_START') or datetime.now()
+    return datetime.now() - start <= timedelta(minutes=10)
 
 @app.before_request
 def enforce_license():
@@ -104,12 +241,7 @@ def enforce_license():
 
     # Check license
     provided = app.config.get('LICENSE_KEY') or request.args.get('license') or request.headers.get('X-License-Key')
-    if provided == VALID_LICENSE:
-        return None
-
-    # If license invalid, allow only within 10 minutes of session start
-    start = app.config.get('SESSION_START') or datetime.now()
-    if datetime.now() - start <= timedelta(minutes=10):
+    if license_valid(provided):
         return None
 
     # Otherwise, reject with trial expired page or JSON error
@@ -118,15 +250,21 @@ def enforce_license():
     else:
         return render_template('trial_expired.html'), 403
 
+def check_auth(auth_header):
+    """None if the bearer token is valid, else (error, status)"""
+    if not auth_header.startswith('Bearer '):
+        return 'Missing authorization', 401
+    token = auth_header.replace('Bearer ', '')
+    if token != app.config['AUTH_KEY']:
+        return 'Invalid authorization', 403
+    return None
+
 def require_auth(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        auth_header = request.headers.get('Authorization', '')
-        if not auth_header.startswith('Bearer '):
-            return jsonify({'error': 'Missing authorization'}), 401
-        token = auth_header.replace('Bearer ', '')
-        if token != app.config['AUTH_KEY']:
-            return jsonify({'error': 'Invalid authorization'}), 403
+        failure = check_auth(request.headers.get('Authorization', ''))
+        if failure:
+            return jsonify({'error': failure[0]}), failure[1]
         return f(*args, **kwargs)
     return decorated
 
@@ -141,42 +279,20 @@ def receive_events():
         data = request.get_json()
         events = data.get('events', [])
         
-        conn = get_db()
-        cursor = conn.cursor()
+        # Store events
+        write_events(events)
+        if alert_engine is not None:
+            alert_engine.observe(events)
+        if tail is not None:
+            tail.add(events)
         
-        for event in events:
-            event_type = event.get('type', 'unknown')
-            timestamp = event.get('timestamp', datetime.utcnow().isoformat())
-            hostname = event.get('hostname', 'unknown')
-            
-            # Update stats
-            stats['total_events'] += 1
+        # Update stats
+        stats['total_events'] += len(events)
+        if events:
             stats['last_event'] = datetime.now()
-            
-            # Store event
-            cursor.execute('''
-                INSERT INTO events (timestamp, event_type, hostname, data)
-                VALUES (?, ?, ?, ?)
-            ''', (timestamp, event_type, hostname, json.dumps(event)))
-            
-            # Update device metadata if this is a metadata event
-            if event_type == 'metadata':
-                cursor.execute('''
-                    INSERT OR REPLACE INTO devices 
-                    (hostname, platform, python_version, cpu_count, memory_total, last_seen, mac_addresses)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    hostname,
-                    event.get('platform', 'unknown'),
-                    event.get('python_version', 'unknown'),
-                    event.get('cpu_count', 0),
-                    event.get('memory_total', 0),
-                    timestamp,
-                    json.dumps(event.get('mac_addresses', []))
-                ))
-        
-        conn.commit()
-        conn.close()
+        
+        EVENTS_INGESTED.labels('events').inc(len(events))
+        INGEST_BATCH.labels('events').observe(len(events))
         
         # Update active devices count
         update_device_count()
@@ -185,32 +301,229 @@ def receive_events():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/stats', methods=['GET'])
-def get_stats():
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Total events
-    cursor.execute('SELECT COUNT(*) as count FROM events')
-    total_events = cursor.fetchone()['count']
-    
-    # Active devices (seen in last 5 minutes)
-    cursor.execute('''
-        SELECT COUNT(DISTINCT hostname) as count 
-        FROM events 
-        WHERE datetime(timestamp) > datetime('now', '-5 minutes')
-    ''')
-    active_devices = cursor.fetchone()['count']
-    
-    # Events by type
-    cursor.execute('''
-        SELECT event_type, COUNT(*) as count 
-        FROM events 
-        GROUP BY event_type
-    ''')
-    events_by_type = {row['event_type']: row['count'] for row in cursor.fetchall()}
+@app.route('/api/events/bulk', methods=['POST'])
+@require_auth
+def receive_events_bulk():
+    """Streaming NDJSON ingest for backfills (one event per line, optionally gzip)
+
+    The body is parsed incrementally and written BULK_BATCH events per
+    transaction, so memory stays bounded regardless of upload size. The
+    write lock is only taken once a batch is parsed, never while waiting on
+    the upload, so live agents keep posting during a slow backfill. Progress is readable
+    while the upload runs via GET /api/events/bulk/<job>.
+    """
+    job_id = request.args.get('job') or uuid.uuid4().hex
+    default_hostname = request.args.get('hostname')
+    job = {
+        'job': job_id,
+        'status': 'running',
+        'started': datetime.now().isoformat(),
+        'bytes': 0,
+        'received': 0,
+        'stored': 0,
+        'invalid': 0,
+    }
+    bulk_jobs[job_id] = job
+    while len(bulk_jobs) > BULK_JOBS_KEPT:
+        bulk_jobs.pop(next(iter(bulk_jobs)))
+    
+    def counted(chunks):
+        for chunk in chunks:
+            job['bytes'] += len(chunk)
+            yield chunk
+    
+    chunks = counted(event_store.read_chunks(request.stream))
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        chunks = event_store.gunzip_chunks(chunks)
+    
+    # With a writer process every batch is its own (group) commit there
+    conn = get_db() if writer_client is None else None
+    if conn is not None:
+        cursor = conn.cursor()
+    batch = []
+    
+    def flush():
+        if conn is None:
+            writer_client.store_events(batch)
+        else:
+            begin_write(conn)
+            stored = event_store.store_events(cursor, batch, interner)
+            for event, (event_type, timestamp, hostname) in zip(batch, stored):
+                if event_type == 'metadata':
+                    event_store.upsert_device(cursor, event, hostname, timestamp)
+            commit(conn)
+            interner.commit(conn)
+        if tail is not None:
+            tail.add(batch)
+        job['stored'] += len(batch)
+        stats['total_events'] += len(batch)
+        EVENTS_INGESTED.labels('bulk').inc(len(batch))
+        INGEST_BATCH.labels('bulk').observe(len(batch))
+        stats['last_event'] = datetime.now()
+        batch.clear()
     
+    try:
+        for event in event_store.iter_ndjson(chunks):
+            job['received'] += 1
+            if event is None:
+                job['invalid'] += 1
+                continue
+            if default_hostname and not event.get('hostname'):
+                event['hostname'] = default_hostname
+            batch.append(event)
+            if len(batch) >= BULK_BATCH:
+                flush()
+        if batch:
+            flush()
+    except Exception as e:
+        if conn is not None and conn.in_transaction:
+            conn.rollback()
+            # Strings interned in a rolled back transaction must not be cached
+            interner.rollback(conn)
+        job['status'] = 'failed'
+        job['error'] = str(e)
+        return jsonify(job), 500
+    finally:
+        if conn is not None:
+            conn.close()
+    
+    update_device_count()
+    job['status'] = 'done'
+    job['finished'] = datetime.now().isoformat()
+    return jsonify(job), 200
+
+@app.route('/api/events/bulk/<job_id>', methods=['GET'])
+@require_auth
+def get_bulk_job(job_id):
+    job = bulk_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job)
+
+@app.route('/api/blocked_sites', methods=['GET'])
+@require_auth
+def get_blocked_sites():
+    """Domains blocked for one agent (polled by activity_logger_tray.BlockedSitesPoller)"""
+    hostname = request.args.get('hostname')
+    if not hostname:
+        return jsonify({'error': 'hostname parameter required'}), 400
+    conn, _ = shard_dbs(hostname)[0]
+    blocked = event_store.blocked_sites(conn.cursor(), hostname).get(hostname, [])
     conn.close()
+    return jsonify({'blocked': blocked, 'version': event_store.blocked_version(blocked)})
+
+@app.route('/api/export', methods=['GET'])
+@require_auth
+def get_export_days():
+    """Days with events in [from, to] and the URL of each day's columnar file (export.py)"""
+    today = datetime.utcnow().date()
+    first = request.args.get('from', (today - timedelta(days=6)).isoformat())
+    last = request.args.get('to', today.isoformat())
+    hostname = request.args.get('hostname')
+    try:
+        export.parse_day(first)
+        export.parse_day(last)
+    except ValueError:
+        return jsonify({'error': 'from and to must be YYYY-MM-DD'}), 400
+    dbs = shard_dbs(hostname)
+    counts = export.day_counts([conn for conn, _ in dbs], first, last, hostname)
+    for conn, _ in dbs:
+        conn.close()
+    query = f'?hostname={quote(hostname)}' if hostname else ''
+    return jsonify({'days': [{'day': day, 'events': count, 'url': f'/api/export/{day}{query}'}
+                             for day, count in counts.items()]})
+
+@app.route('/api/export/<day>', methods=['GET'])
+@require_auth
+def get_export_day(day):
+    """One day of events as a compressed .npz (load with export.load); ?data=1 adds the payloads"""
+    if export.np is None:
+        return jsonify({'error': 'numpy is not installed on the server'}), 501
+    try:
+        export.parse_day(day)
+    except ValueError:
+        return jsonify({'error': 'day must be YYYY-MM-DD'}), 400
+    hostname = request.args.get('hostname')
+    with_data = request.args.get('data') in ('1', 'true')
+    dbs = shard_dbs(hostname)
+    try:
+        body, count = export.day_bytes([conn for conn, _ in dbs], day, hostname, with_data)
+    finally:
+        for conn, _ in dbs:
+            conn.close()
+    if not count:
+        return jsonify({'error': 'No events on this day'}), 404
+    return Response(body, mimetype='application/octet-stream', headers={
+        'Content-Disposition': f'attachment; filename={export.file_name(day)}',
+        'X-Event-Count': str(count),
+    })
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus text format metrics (scrape with ?license=<key> once the trial has expired)"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def local_request():
+    """Whether the client is on this machine (and not forwarded by a local proxy)"""
+    return request.remote_addr in ('127.0.0.1', '::1') and 'X-Forwarded-For' not in request.headers
+
+@app.route('/debug/queries', methods=['GET', 'POST'])
+def debug_queries():
+    """Top statements by total time (?order=calls|total_s|avg_ms|max_s|rows, ?limit=, ?format=json)
+
+    POST resets the statistics; only with profiling on and from the server machine itself.
+    """
+    if request.method == 'POST':
+        if not app.config['PROFILE_QUERIES'] or not local_request():
+            return jsonify({'error': 'Profiler reset is only allowed locally with profiling on'}), 403
+        profiler.reset()
+    order = request.args.get('order', 'total_s')
+    if order not in ('calls', 'total_s', 'avg_ms', 'max_s', 'rows'):
+        order = 'total_s'
+    statements = profiler.top(int(request.args.get('limit', 20)), order)
+    slow = list(reversed(profiler.slow))
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'enabled': app.config['PROFILE_QUERIES'],
+            'since': profiler.started.isoformat(),
+            'slow_ms': profiler.slow_ms,
+            'statements': statements,
+            'slow': slow,
+        })
+    return render_template('debug_queries.html', enabled=app.config['PROFILE_QUERIES'], can_reset=local_request(),
+                           started=profiler.started, order=order, statements=statements, slow=slow,
+                           slow_ms=profiler.slow_ms, log_path=profiler.log_path)
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    total_events = 0
+    active_devices = 0
+    events_by_type = {}
+    for conn, _ in shard_dbs():
+        cursor = conn.cursor()
+        
+        # Total events
+        cursor.execute('SELECT COUNT(*) as count FROM events')
+        total_events += cursor.fetchone()['count']
+        
+        # Active devices (seen in last 5 minutes)
+        cursor.execute('''
+            SELECT COUNT(DISTINCT host_id) as count 
+            FROM events 
+            WHERE datetime(timestamp) > datetime('now', '-5 minutes')
+        ''')
+        active_devices += cursor.fetchone()['count']
+        
+        # Events by type
+        cursor.execute('''
+            SELECT event_type, COUNT(*) as count 
+            FROM events 
+            GROUP BY event_type
+        ''')
+        for row in cursor.fetchall():
+            events_by_type[row['event_type']] = events_by_type.get(row['event_type'], 0) + row['count']
+        
+        conn.close()
     
     return jsonify({
         'total_events': total_events,
@@ -220,26 +533,27 @@ def get_stats():
 
 @app.route('/api/devices', methods=['GET'])
 def get_devices():
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT hostname, platform, python_version, cpu_count, 
-               memory_total, last_seen, mac_addresses 
-        FROM devices 
-        ORDER BY last_seen DESC
-    ''')
     devices = []
-    for row in cursor.fetchall():
-        devices.append({
-            'hostname': row['hostname'],
-            'platform': row['platform'],
-            'python_version': row['python_version'],
-            'cpu_count': row['cpu_count'],
-            'memory_total': row['memory_total'],
-            'last_seen': row['last_seen'],
-            'mac_addresses': json.loads(row['mac_addresses']) if row['mac_addresses'] else []
-        })
-    conn.close()
+    for conn, _ in shard_dbs():
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT hostname, platform, python_version, cpu_count, 
+                   memory_total, last_seen, mac_addresses 
+            FROM devices 
+            ORDER BY last_seen DESC
+        ''')
+        for row in cursor.fetchall():
+            devices.append({
+                'hostname': row['hostname'],
+                'platform': row['platform'],
+                'python_version': row['python_version'],
+                'cpu_count': row['cpu_count'],
+                'memory_total': row['memory_total'],
+                'last_seen': row['last_seen'],
+                'mac_addresses': json.loads(row['mac_addresses']) if row['mac_addresses'] else []
+            })
+        conn.close()
+    devices.sort(key=lambda d: d['last_seen'] or '', reverse=True)
     return jsonify(devices)
 
 @app.route('/api/recent-events', methods=['GET'])
@@ -248,70 +562,77 @@ def get_recent_events():
     event_type = request.args.get('type')
     hours = int(request.args.get('hours', 24))
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    query = '''
-        SELECT timestamp, event_type, hostname, data 
-        FROM events 
-        WHERE datetime(timestamp) > datetime('now', '-{} hours')
-    '''.format(hours)
-    
-    params = []
-    if hostname:
-        query += ' AND hostname = ?'
-        params.append(hostname)
-    if event_type:
-        query += ' AND event_type = ?'
-        params.append(event_type)
-    
-    query += ' ORDER BY timestamp DESC LIMIT 100'
-    
-    cursor.execute(query, params)
     events = []
-    for row in cursor.fetchall():
-        event_data = json.loads(row['data'])
-        events.append({
-            'timestamp': row['timestamp'],
-            'event_type': row['event_type'],
-            'hostname': row['hostname'],
-            'data': event_data
-        })
-    conn.close()
-    return jsonify(events)
+    for conn, shard_interner in shard_dbs(hostname):
+        cursor = conn.cursor()
+        
+        query = '''
+            SELECT timestamp, event_type, hostname, data, process_name, process_path, title, url 
+            FROM events_view 
+            WHERE datetime(timestamp) > datetime('now', '-{} hours')
+        '''.format(hours)
+        
+        params = []
+        if hostname:
+            query += ' AND host_id = ?'
+            params.append(event_store.host_id_for(cursor, shard_interner, hostname))
+        if event_type:
+            query += ' AND event_type = ?'
+            params.append(event_type)
+        
+        query += ' ORDER BY timestamp DESC LIMIT 100'
+        
+        cursor.execute(query, params)
+        for row in cursor.fetchall():
+            event_data = event_store.decode_event(row)
+            events.append({
+                'timestamp': row['timestamp'],
+                'event_type': row['event_type'],
+                'hostname': row['hostname'],
+                'data': event_data
+            })
+        conn.close()
+    events.sort(key=lambda e: e['timestamp'], reverse=True)
+    return jsonify(events[:100])
 
 @app.route('/api/activity-timeline', methods=['GET'])
 def get_activity_timeline():
     hostname = request.args.get('hostname')
     hours = int(request.args.get('hours', 24))
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    query = '''
-        SELECT strftime('%Y-%m-%d %H:00:00', timestamp) as hour,
-               event_type,
-               COUNT(*) as count
-        FROM events
-        WHERE datetime(timestamp) > datetime('now', '-{} hours')
-    '''.format(hours)
-    
-    params = []
-    if hostname:
-        query += ' AND hostname = ?'
-        params.append(hostname)
-    
-    query += ' GROUP BY hour, event_type ORDER BY hour'
+    counts = {}
+    for conn, shard_interner in shard_dbs(hostname):
+        cursor = conn.cursor()
+        
+        # Read the hourly rollup instead of counting raw events
+        query = '''
+            SELECT hour,
+                   event_type,
+                   SUM(count) as count
+            FROM hourly_counts
+            WHERE hour >= strftime('%Y-%m-%d %H:00:00', 'now', '-{} hours')
+        '''.format(hours)
+        
+        params = []
+        if hostname:
+            query += ' AND host_id = ?'
+            params.append(event_store.host_id_for(cursor, shard_interner, hostname))
+        
+        query += ' GROUP BY hour, event_type ORDER BY hour'
+        
+        cursor.execute(query, params)
+        for row in cursor.fetchall():
+            key = (row['hour'], row['event_type'])
+            counts[key] = counts.get(key, 0) + row['count']
+        conn.close()
     
-    cursor.execute(query, params)
     timeline = []
-    for row in cursor.fetchall():
+    for (hour, event_type), count in sorted(counts.items()):
         timeline.append({
-            'hour': row['hour'],
-            'event_type': row['event_type'],
-            'count': row['count']
+            'hour': hour,
+            'event_type': event_type,
+            'count': count
         })
-    conn.close()
     return jsonify(timeline)
 
 @app.route('/api/top-domains', methods=['GET'])
@@ -319,83 +640,82 @@ def get_top_domains():
     hostname = request.args.get('hostname')
     hours = int(request.args.get('hours', 24))
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    query = '''
-        SELECT data
-        FROM events
-        WHERE event_type = 'foreground_change'
-        AND datetime(timestamp) > datetime('now', '-{} hours')
-    '''.format(hours)
-    
-    params = []
-    if hostname:
-        query += ' AND hostname = ?'
-        params.append(hostname)
-    
-    cursor.execute(query, params)
-    
     domain_counts = {}
-    for row in cursor.fetchall():
-        try:
-            event_data = json.loads(row['data'])
-            url = event_data.get('url', '')
-            if url and url.startswith('http'):
-                # Extract domain
-                domain = url.split('/')[2] if len(url.split('/')) > 2 else url
-                domain_counts[domain] = domain_counts.get(domain, 0) + 1
-        except:
-            pass
-    
-    conn.close()
+    for conn, shard_interner in shard_dbs(hostname):
+        cursor = conn.cursor()
+        
+        query = '''
+            SELECT url, COUNT(*) as count
+            FROM events_view
+            WHERE event_type = 'foreground_change'
+            AND datetime(timestamp) > datetime('now', '-{} hours')
+        '''.format(hours)
+        
+        params = []
+        if hostname:
+            query += ' AND host_id = ?'
+            params.append(event_store.host_id_for(cursor, shard_interner, hostname))
+        
+        # Count per interned URL in SQL, then fold URLs into domains
+        query += ' GROUP BY url'
+        cursor.execute(query, params)
+        
+        for row in cursor.fetchall():
+            domain = domains.url_domain(row['url'])
+            if domain:
+                domain_counts[domain] = domain_counts.get(domain, 0) + row['count']
+        
+        conn.close()
     
     # Sort by count and return top 10
     top_domains = sorted(domain_counts.items(), key=lambda x: x[1], reverse=True)[:10]
     return jsonify([{'domain': d, 'count': c} for d, c in top_domains])
 
 def update_device_count():
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT COUNT(DISTINCT hostname) as count 
-        FROM events 
-        WHERE datetime(timestamp) > datetime('now', '-5 minutes')
-    ''')
-    stats['active_devices'] = cursor.fetchone()['count']
-    conn.close()
+    active_devices = 0
+    for conn, _ in shard_dbs():
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT COUNT(DISTINCT host_id) as count 
+            FROM events 
+            WHERE datetime(timestamp) > datetime('now', '-5 minutes')
+        ''')
+        active_devices += cursor.fetchone()['count']
+        conn.close()
+    stats['active_devices'] = active_devices
 
 # Dashboard API routes (expected by dashboard.html)
 @app.route('/api/dashboard/stats', methods=['GET'])
 def get_dashboard_stats():
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Total devices
-    cursor.execute('SELECT COUNT(DISTINCT hostname) as count FROM devices')
-    device_count = cursor.fetchone()['count']
-    
-    # Active devices (seen in last 5 minutes)
-    cursor.execute('''
-        SELECT COUNT(DISTINCT hostname) as count 
-        FROM events 
-        WHERE datetime(timestamp) > datetime('now', '-5 minutes')
-    ''')
-    active_devices = cursor.fetchone()['count']
-    
-    # Events in last 24 hours
-    cursor.execute('''
-        SELECT COUNT(*) as count 
-        FROM events 
-        WHERE datetime(timestamp) > datetime('now', '-24 hours')
-    ''')
-    event_count_24h = cursor.fetchone()['count']
-    
-    # Total events
-    cursor.execute('SELECT COUNT(*) as count FROM events')
-    total_events = cursor.fetchone()['count']
-    
-    conn.close()
+    device_count = 0
+    active_devices = 0
+    event_count_24h = 0
+    total_events = 0
+    for conn, _ in shard_dbs():
+        cursor = conn.cursor()
+        
+        # Total devices
+        cursor.execute('SELECT COUNT(DISTINCT hostname) as count FROM devices')
+        device_count += cursor.fetchone()['count']
+        
+        # Active devices (seen in last 5 minutes), from the per-device live state
+        cursor.execute('''
+            SELECT COUNT(*) as count 
+            FROM device_state 
+            WHERE last_seen > datetime('now', '-5 minutes')
+        ''')
+        active_devices += cursor.fetchone()['count']
+        
+        # Events in the last 24 hours, from the hourly rollups
+        cursor.execute('SELECT SUM(count) as count FROM hourly_counts WHERE hour >= ?',
+                       (device_state.count_cutoff(),))
+        event_count_24h += cursor.fetchone()['count'] or 0
+        
+        # Total events
+        cursor.execute('SELECT COUNT(*) as count FROM events')
+        total_events += cursor.fetchone()['count']
+        
+        conn.close()
     
     return jsonify({
         'device_count': device_count,
@@ -406,72 +726,66 @@ def get_dashboard_stats():
 
 @app.route('/api/dashboard/devices', methods=['GET'])
 def get_dashboard_devices():
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT d.hostname, d.platform, d.python_version, d.cpu_count, 
-               d.memory_total, d.last_seen, d.mac_addresses,
-               COUNT(e.id) as event_count
-        FROM devices d
-        LEFT JOIN events e ON d.hostname = e.hostname 
-            AND datetime(e.timestamp) > datetime('now', '-24 hours')
-        GROUP BY d.hostname
-        ORDER BY d.last_seen DESC
-    ''')
+    """Fleet overview: one device_state row per device (kept current at ingest), sorted and paged"""
+    sort = request.args.get('sort', 'last_seen')
+    if sort not in device_state.SORT_KEYS:
+        return jsonify({'error': f"sort must be one of: {', '.join(device_state.SORT_KEYS)}"}), 400
+    descending = request.args.get('order', 'asc' if sort == 'hostname' else 'desc') != 'asc'
+    limit = request.args.get('limit', type=int)
+    offset = max(0, request.args.get('offset', 0, type=int))
     
     devices = []
-    for row in cursor.fetchall():
-        devices.append({
-            'hostname': row['hostname'],
-            'platform': row['platform'],
-            'python_version': row['python_version'],
-            'cpu_count': row['cpu_count'],
-            'memory_total': row['memory_total'],
-            'last_seen': row['last_seen'],
-            'event_count': row['event_count']
-        })
-    
-    conn.close()
-    return jsonify({'devices': devices})
+    total = 0
+    for conn, _ in shard_dbs():
+        cursor = conn.cursor()
+        total += cursor.execute('SELECT COUNT(*) FROM device_state').fetchone()[0]
+        # Each shard returns its first offset + limit devices and the merge cuts the page
+        devices.extend(device_state.overview(cursor, sort, descending,
+                                             offset + limit if limit is not None else None))
+        conn.close()
+    device_state.sort_devices(devices, sort, descending)
+    page = devices[offset:offset + limit] if limit is not None else devices[offset:]
+    return jsonify({'devices': page, 'total': total, 'offset': offset, 'limit': limit,
+                    'sort': sort, 'order': 'desc' if descending else 'asc'})
 
 @app.route('/api/dashboard/activity_timeline', methods=['GET'])
 def get_dashboard_timeline():
     hours = int(request.args.get('hours', 24))
     hostname = request.args.get('hostname')
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    query = '''
-        SELECT strftime('%Y-%m-%d %H:00:00', timestamp) as hour,
-               event_type,
-               COUNT(*) as count
-        FROM events
-        WHERE datetime(timestamp) > datetime('now', '-{} hours')
-    '''.format(hours)
-    
-    params = []
-    if hostname:
-        query += ' AND hostname = ?'
-        params.append(hostname)
-    
-    query += ' GROUP BY hour, event_type ORDER BY hour'
-    
-    cursor.execute(query, params)
-    
     # Organize by hour and event type
     timeline = {}
-    for row in cursor.fetchall():
-        hour = row['hour']
-        event_type = row['event_type']
-        count = row['count']
+    for conn, shard_interner in shard_dbs(hostname):
+        cursor = conn.cursor()
         
-        if hour not in timeline:
-            timeline[hour] = {}
-        timeline[hour][event_type] = count
-    
-    conn.close()
+        # Read the hourly rollup instead of counting raw events
+        query = '''
+            SELECT hour,
+                   event_type,
+                   SUM(count) as count
+            FROM hourly_counts
+            WHERE hour >= strftime('%Y-%m-%d %H:00:00', 'now', '-{} hours')
+        '''.format(hours)
+        
+        params = []
+        if hostname:
+            query += ' AND host_id = ?'
+            params.append(event_store.host_id_for(cursor, shard_interner, hostname))
+        
+        query += ' GROUP BY hour, event_type ORDER BY hour'
+        
+        cursor.execute(query, params)
+        
+        for row in cursor.fetchall():
+            hour = row['hour']
+            event_type = row['event_type']
+            count = row['count']
+            
+            if hour not in timeline:
+                timeline[hour] = {}
+            timeline[hour][event_type] = timeline[hour].get(event_type, 0) + count
+        
+        conn.close()
     return jsonify({'timeline': timeline})
 
 @app.route('/api/dashboard/top_domains', methods=['GET'])
@@ -480,45 +794,37 @@ def get_dashboard_top_domains():
     hostname = request.args.get('hostname')
     limit = int(request.args.get('limit', 20))
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    query = '''
-        SELECT data
-        FROM events
-        WHERE event_type = 'foreground_change'
-        AND datetime(timestamp) > datetime('now', '-{} hours')
-    '''.format(hours)
-    
-    params = []
-    if hostname:
-        query += ' AND hostname = ?'
-        params.append(hostname)
-    
-    cursor.execute(query, params)
-    
     app_counts = {}
     domain_counts = {}
-    
-    for row in cursor.fetchall():
-        try:
-            event_data = json.loads(row['data'])
-            
-            # Count applications by process name
-            process_name = event_data.get('process_name', 'Unknown')
+    for conn, shard_interner in shard_dbs(hostname):
+        cursor = conn.cursor()
+        
+        where = '''
+            FROM events_view
+            WHERE event_type = 'foreground_change'
+            AND datetime(timestamp) > datetime('now', '-{} hours')
+        '''.format(hours)
+        
+        params = []
+        if hostname:
+            where += ' AND host_id = ?'
+            params.append(event_store.host_id_for(cursor, shard_interner, hostname))
+        
+        # Count applications by process name
+        cursor.execute(f'SELECT process_name, COUNT(*) as count {where} GROUP BY process_name', params)
+        for row in cursor.fetchall():
+            process_name = row['process_name']
             if process_name and process_name != 'Unknown':
-                app_counts[process_name] = app_counts.get(process_name, 0) + 1
-            
-            # Also count domains from URLs
-            url = event_data.get('url', '')
-            if url and url.startswith('http'):
-                # Extract domain
-                domain = url.split('/')[2] if len(url.split('/')) > 2 else url
-                domain_counts[domain] = domain_counts.get(domain, 0) + 1
-        except:
-            pass
-    
-    conn.close()
+                app_counts[process_name] = app_counts.get(process_name, 0) + row['count']
+        
+        # Also count domains from URLs
+        cursor.execute(f'SELECT url, COUNT(*) as count {where} GROUP BY url', params)
+        for row in cursor.fetchall():
+            domain = domains.url_domain(row['url'])
+            if domain:
+                domain_counts[domain] = domain_counts.get(domain, 0) + row['count']
+        
+        conn.close()
     
     # Combine apps and domains, prioritize apps
     combined = []
@@ -535,6 +841,130 @@ def get_dashboard_top_domains():
     
     return jsonify({'domains': combined})
 
+@app.route('/api/dashboard/app_time', methods=['GET'])
+def get_dashboard_app_time():
+    """Active (non-AFK) seconds per app and per domain from focus sessions started in the range"""
+    hours = int(request.args.get('hours', 24))
+    hostname = request.args.get('hostname')
+    limit = int(request.args.get('limit', 20))
+    cutoff = (datetime.utcnow() - timedelta(hours=hours)).strftime('%Y-%m-%d %H:%M:%S')
+    
+    apps = {}
+    domain_totals = {}
+    def add(totals, key, seconds, count):
+        entry = totals.setdefault(key, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += count
+    
+    for conn, shard_interner in shard_dbs(hostname):
+        cursor = conn.cursor()
+        
+        where = ' WHERE start >= ?'
+        params = [cutoff]
+        host_id = None
+        if hostname:
+            host_id = event_store.host_id_for(cursor, shard_interner, hostname)
+            where += ' AND host_id = ?'
+            params.append(host_id)
+        
+        # Range sums over the (start, app, active_seconds) covering indexes
+        cursor.execute('SELECT app, SUM(active_seconds) AS seconds, COUNT(*) AS sessions FROM sessions'
+                       + where + ' AND app IS NOT NULL GROUP BY app', params)
+        for row in cursor.fetchall():
+            add(apps, row['app'], row['seconds'], row['sessions'])
+        cursor.execute('SELECT domain, SUM(active_seconds) AS seconds, COUNT(*) AS sessions FROM sessions'
+                       + where + ' AND domain IS NOT NULL GROUP BY domain', params)
+        for row in cursor.fetchall():
+            add(domain_totals, row['domain'], row['seconds'], row['sessions'])
+        
+        # Sessions still open count up to each host's last event
+        for _, app_name, domain, start, _, seconds in sessionizer.open_session_rows(cursor, host_id):
+            if start >= cutoff:
+                if app_name:
+                    add(apps, app_name, seconds, 1)
+                if domain:
+                    add(domain_totals, domain, seconds, 1)
+        
+        conn.close()
+    
+    def top(totals, key):
+        ranked = sorted(totals.items(), key=lambda x: x[1][0], reverse=True)[:limit]
+        return [{key: name, 'active_seconds': round(seconds, 1), 'sessions': count}
+                for name, (seconds, count) in ranked]
+    
+    return jsonify({
+        'apps': top(apps, 'app'),
+        'domains': top(domain_totals, 'domain'),
+        'total_seconds': round(sum(seconds for seconds, _ in apps.values()), 1),
+    })
+
+@app.route('/api/dashboard/categories', methods=['GET'])
+def get_dashboard_categories():
+    """Active seconds, event counts and top sites per category (domains.py) over the last `days` UTC days"""
+    days = int(request.args.get('days', 7))
+    hostname = request.args.get('hostname')
+    first_day, last_day = daily_summary.day_range(days)
+    
+    seconds = {}
+    events = {}
+    sites = {}
+    total_seconds = 0.0
+    for conn, shard_interner in shard_dbs(hostname):
+        cursor = conn.cursor()
+        host_id = event_store.host_id_for(cursor, shard_interner, hostname) if hostname else None
+        
+        # Per-day rows written at ingest: daily_usage primary key ranges, no event scan; open
+        # days are completed with each host's open session, as in the device view
+        live, live_usage = daily_summary.open_sessions(cursor, host_id)
+        for name, value in daily_summary.usage_totals(cursor, host_id, first_day, last_day, 'category',
+                                                      live_usage).items():
+            seconds[name] = seconds.get(name, 0.0) + value
+        for name, value in daily_summary.usage_totals(cursor, host_id, first_day, last_day, 'domain',
+                                                      live_usage).items():
+            category = domains.name_category(name)
+            if category:
+                site = sites.setdefault(category, {})
+                key = domains.registrable_domain(name)
+                site[key] = site.get(key, 0.0) + value
+        query = 'SELECT SUM(active_seconds) FROM daily_summaries WHERE day BETWEEN ? AND ?'
+        params = [first_day, last_day]
+        if host_id is not None:
+            query += ' AND host_id = ?'
+            params.append(host_id)
+        total_seconds += cursor.execute(query, params).fetchone()[0] or 0.0
+        total_seconds += sum(active for active, _, _ in
+                             daily_summary.open_day_totals(cursor, host_id, first_day, last_day, live).values())
+        
+        # Categorized events, one range of the partial (category_id, timestamp) index per category
+        query = 'SELECT COUNT(*) FROM events WHERE category_id = ? AND timestamp >= ?'
+        if host_id is not None:
+            query += ' AND host_id = ?'
+        for category_id, category in cursor.execute('SELECT id, value FROM categories').fetchall():
+            params = [category_id, first_day] + ([host_id] if host_id is not None else [])
+            count = cursor.execute(query, params).fetchone()[0]
+            if count:
+                events[category] = events.get(category, 0) + count
+        
+        conn.close()
+    
+    categories = []
+    for name in sorted(set(seconds) | set(events), key=lambda n: seconds.get(n, 0.0), reverse=True):
+        ranked = sorted(sites.get(name, {}).items(), key=lambda x: x[1], reverse=True)[:5]
+        categories.append({
+            'category': name,
+            'active_seconds': round(seconds.get(name, 0.0), 1),
+            'share': round(seconds.get(name, 0.0) / total_seconds, 4) if total_seconds else 0.0,
+            'events': events.get(name, 0),
+            'top_sites': [[site, round(value, 1)] for site, value in ranked],
+        })
+    return jsonify({
+        'first_day': first_day,
+        'last_day': last_day,
+        'categories': categories,
+        'active_seconds': round(total_seconds, 1),
+        'uncategorized_seconds': round(max(0.0, total_seconds - sum(seconds.values())), 1),
+    })
+
 @app.route('/api/dashboard/recent_events', methods=['GET'])
 def get_dashboard_recent_events():
     limit = int(request.args.get('limit', 50))
@@ -544,56 +974,63 @@ def get_dashboard_recent_events():
     hours = int(request.args.get('hours', 24))
     app_filter = request.args.get('app')  # Filter for app/domain
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Build base query
-    query = '''
-        SELECT timestamp, event_type, hostname, data 
-        FROM events 
-        WHERE datetime(timestamp) > datetime('now', '-{} hours')
-    '''.format(hours)
-    
-    params = []
-    if hostname:
-        query += ' AND hostname = ?'
-        params.append(hostname)
-    if event_type:
-        query += ' AND event_type = ?'
-        params.append(event_type)
-    
-    # If filtering by app, add JSON filter
-    if app_filter:
-        query += ''' AND (
-            json_extract(data, '$.process_name') = ? 
-            OR json_extract(data, '$.url') LIKE ?
-        )'''
-        params.append(app_filter)
-        params.append(f'%{app_filter}%')
-    
-    # Get total count
-    count_query = f"SELECT COUNT(*) as total FROM ({query})"
-    cursor.execute(count_query, params)
-    total_count = cursor.fetchone()['total']
-    
-    # Add pagination
+    dbs = shard_dbs(hostname)
     offset = (page - 1) * limit
-    query += ' ORDER BY timestamp DESC LIMIT ? OFFSET ?'
-    params.extend([limit, offset])
-    
-    cursor.execute(query, params)
-    
+    # Across shards each one returns its first offset + limit rows and the merge cuts the page
+    fetch_limit, fetch_offset = (limit, offset) if len(dbs) == 1 else (offset + limit, 0)
+    total_count = 0
     events = []
-    for row in cursor.fetchall():
-        event_data = json.loads(row['data'])
-        events.append({
-            'timestamp': row['timestamp'],
-            'event_type': row['event_type'],
-            'hostname': row['hostname'],
-            'data': event_data
-        })
+    for conn, shard_interner in dbs:
+        cursor = conn.cursor()
+        
+        # Build base query
+        query = '''
+            SELECT timestamp, event_type, hostname, data, process_name, process_path, title, url 
+            FROM events_view 
+            WHERE datetime(timestamp) > datetime('now', '-{} hours')
+        '''.format(hours)
+        
+        params = []
+        if hostname:
+            query += ' AND host_id = ?'
+            params.append(event_store.host_id_for(cursor, shard_interner, hostname))
+        if event_type:
+            query += ' AND event_type = ?'
+            params.append(event_type)
+        
+        # If filtering by app, match the interned process name or URL
+        if app_filter:
+            query += ''' AND (
+                process_name = ? 
+                OR url LIKE ?
+            )'''
+            params.append(app_filter)
+            params.append(f'%{app_filter}%')
+        
+        # Get total count
+        count_query = f"SELECT COUNT(*) as total FROM ({query})"
+        cursor.execute(count_query, params)
+        total_count += cursor.fetchone()['total']
+        
+        # Add pagination
+        query += ' ORDER BY timestamp DESC LIMIT ? OFFSET ?'
+        params.extend([fetch_limit, fetch_offset])
+        
+        cursor.execute(query, params)
+        
+        for row in cursor.fetchall():
+            event_data = event_store.decode_event(row)
+            events.append({
+                'timestamp': row['timestamp'],
+                'event_type': row['event_type'],
+                'hostname': row['hostname'],
+                'data': event_data
+            })
+        
+        conn.close()
     
-    conn.close()
+    events.sort(key=lambda e: e['timestamp'], reverse=True)
+    events = events[offset - fetch_offset:offset - fetch_offset + limit]
     
     total_pages = (total_count + limit - 1) // limit  # Ceiling division
     return jsonify({
@@ -604,6 +1041,120 @@ def get_dashboard_recent_events():
         'total_pages': total_pages
     })
 
+@app.route('/api/dashboard/search', methods=['GET'])
+def get_dashboard_search():
+    """Substring search over window titles, URLs and process names (text_search.py)
+    
+    Returns the matching strings ranked by relevance, with event counts and hosts
+    within the time range, and the most recent matching events.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'q parameter required'}), 400
+    hours = int(request.args.get('hours', 24 * 7))
+    hostname = request.args.get('hostname')
+    limit = int(request.args.get('limit', 50))
+    hit_limit = int(request.args.get('hits', 20))
+    start_time = (datetime.utcnow() - timedelta(hours=hours)).isoformat()
+    started = time.perf_counter()
+    
+    hits = {}
+    events = []
+    truncated = False
+    for conn, shard_interner in shard_dbs(hostname):
+        cursor = conn.cursor()
+        matches = text_search.search_strings(cursor, query)
+        truncated = truncated or len(matches) >= text_search.MAX_STRINGS
+        if not matches:
+            conn.close()
+            continue
+        
+        where = ' AND timestamp >= ?'
+        params = [start_time]
+        if hostname:
+            where += ' AND host_id = ?'
+            params.append(event_store.host_id_for(cursor, shard_interner, hostname))
+        
+        ids = {}
+        found = {}
+        for field, string_id, value, snippet, score in matches:
+            ids.setdefault(field, []).append(string_id)
+            found[(field, string_id)] = (value, snippet, score)
+        hosts = dict(cursor.execute('SELECT id, value FROM hosts').fetchall())
+        
+        # Per string and host counts over the (title_id, timestamp) / (url_id, timestamp) indexes
+        conditions = []
+        id_params = []
+        for field, string_ids in ids.items():
+            column = event_store.INTERNED_FIELDS[field][1]
+            marks = ', '.join('?' * len(string_ids))
+            conditions.append(f'{column} IN ({marks})')
+            id_params.extend(string_ids)
+            cursor.execute(f'''
+                SELECT {column} AS string_id, host_id, COUNT(*) AS events,
+                       MIN(timestamp) AS first_seen, MAX(timestamp) AS last_seen
+                FROM events WHERE {column} IN ({marks}){where}
+                GROUP BY {column}, host_id
+            ''', string_ids + params)
+            for row in cursor.fetchall():
+                value, snippet, score = found[(field, row['string_id'])]
+                hit = hits.setdefault((field, value), {
+                    'field': field, 'value': value, 'snippet': snippet, 'score': score,
+                    'events': 0, 'hosts': {}, 'first_seen': row['first_seen'], 'last_seen': row['last_seen'],
+                })
+                hit['score'] = max(hit['score'], score)
+                hit['events'] += row['events']
+                host = hosts.get(row['host_id'], 'unknown')
+                hit['hosts'][host] = hit['hosts'].get(host, 0) + row['events']
+                hit['first_seen'] = min(hit['first_seen'], row['first_seen'])
+                hit['last_seen'] = max(hit['last_seen'], row['last_seen'])
+        
+        # Most recent matching events
+        cursor.execute(f'''
+            SELECT id FROM events WHERE ({' OR '.join(conditions)}){where}
+            ORDER BY timestamp DESC LIMIT ?
+        ''', id_params + params + [limit])
+        event_ids = [row['id'] for row in cursor.fetchall()]
+        if event_ids:
+            cursor.execute(f'''
+                SELECT e.timestamp, e.event_type, e.process_name_id, e.title_id, e.url_id,
+                       v.hostname, v.process_name, v.title, v.url
+                FROM events e JOIN events_view v ON v.id = e.id
+                WHERE e.id IN ({', '.join('?' * len(event_ids))})
+            ''', event_ids)
+            for row in cursor.fetchall():
+                matched = [(field, found[(field, row[column])][1]) for field, column
+                           in (('title', 'title_id'), ('url', 'url_id'), ('process_name', 'process_name_id'))
+                           if (field, row[column]) in found]
+                events.append({
+                    'timestamp': row['timestamp'],
+                    'event_type': row['event_type'],
+                    'hostname': row['hostname'],
+                    'process_name': row['process_name'],
+                    'title': row['title'],
+                    'url': row['url'],
+                    'matched': [field for field, _ in matched],
+                    'snippet': matched[0][1] if matched else None,
+                })
+        
+        conn.close()
+    
+    ranked = sorted(hits.values(), key=lambda hit: (hit['score'], hit['events']), reverse=True)[:hit_limit]
+    for hit in ranked:
+        hit['hosts'] = [{'hostname': host, 'events': count} for host, count
+                        in sorted(hit['hosts'].items(), key=lambda x: x[1], reverse=True)]
+    events.sort(key=lambda e: e['timestamp'], reverse=True)
+    
+    return jsonify({
+        'query': query,
+        'hits': ranked,
+        'total_hits': len(hits),
+        # Only the best MAX_STRINGS matching strings per database were mapped to events
+        'truncated': truncated,
+        'events': events[:limit],
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    })
+
 @app.route('/api/dashboard/device_activity', methods=['GET'])
 def get_device_activity():
     """Get detailed activity for a specific device"""
@@ -612,8 +1163,9 @@ def get_device_activity():
         return jsonify({'error': 'hostname parameter required'}), 400
     
     hours = int(request.args.get('hours', 24))
+    days = int(request.args.get('days', 7))
     
-    conn = get_db()
+    conn, shard_interner = shard_dbs(hostname)[0]
     cursor = conn.cursor()
     
     # Get device info
@@ -624,61 +1176,267 @@ def get_device_activity():
         conn.close()
         return jsonify({'error': 'Device not found'}), 404
     
-    # Get mouse activity statistics
-    cursor.execute('''
-        SELECT 
-            SUM(CASE WHEN event_type = 'mouse_active' THEN 1 ELSE 0 END) as active_count,
-            SUM(CASE WHEN event_type = 'mouse_idle' THEN 1 ELSE 0 END) as idle_count,
-            MAX(CASE WHEN event_type = 'mouse_active' THEN timestamp END) as last_active
-        FROM events
-        WHERE hostname = ? 
-        AND event_type IN ('mouse_active', 'mouse_idle')
-        AND datetime(timestamp) > datetime('now', '-{} hours')
-    '''.format(hours), (hostname,))
-    
-    mouse_stats = cursor.fetchone()
-    
-    # Get recent activity events
-    cursor.execute('''
-        SELECT timestamp, event_type, data
-        FROM events
-        WHERE hostname = ?
-        AND datetime(timestamp) > datetime('now', '-{} hours')
-        ORDER BY timestamp DESC
-        LIMIT 50
-    '''.format(hours), (hostname,))
+    host_id = event_store.host_id_for(cursor, shard_interner, hostname)
     
+    # The tail buffer holds everything after `covered` (epoch second); disk only serves the older part
+    window = int(time.time()) - hours * 3600
+    covered = None
     recent_activity = []
-    for row in cursor.fetchall():
-        event_data = json.loads(row['data'])
-        activity_item = {
-            'timestamp': row['timestamp'],
-            'type': row['event_type']
-        }
-        
-        # Add relevant data based on event type
-        if row['event_type'] == 'domain_visit':
-            activity_item['url'] = event_data.get('url', 'Unknown')
-            activity_item['process_name'] = event_data.get('process_name', '')
-        elif row['event_type'] == 'key_count':
-            # Include keystroke info if available
-            activity_item['keystrokes'] = event_data.get('keystrokes', [])
-        
-        # Always include process_name if available
-        if 'process_name' in event_data:
-            activity_item['process_name'] = event_data['process_name']
+    active_count = idle_count = 0
+    last_active = None
+    if tail is not None:
+        covered, active_count, idle_count, last_active = tail.mouse_counts(hostname, window)
+        _, recent_activity = tail.recent(hostname, window)
+    
+    if covered is None or covered > window:
+        # Without a buffer the bound is a no-op comparison of the timestamp with itself
+        older = sessionizer.sql_time(covered) if covered is not None else None
+        
+        # Get mouse activity statistics
+        cursor.execute('''
+            SELECT 
+                SUM(CASE WHEN event_type = 'mouse_active' THEN 1 ELSE 0 END) as active_count,
+                SUM(CASE WHEN event_type = 'mouse_idle' THEN 1 ELSE 0 END) as idle_count,
+                MAX(CASE WHEN event_type = 'mouse_active' THEN timestamp END) as last_active
+            FROM events
+            WHERE host_id = ? 
+            AND event_type IN ('mouse_active', 'mouse_idle')
+            AND datetime(timestamp) > datetime('now', '-{} hours')
+            AND datetime(timestamp) <= COALESCE(?, datetime(timestamp))
+        '''.format(hours), (host_id, older))
+        
+        mouse_stats = cursor.fetchone()
+        active_count += mouse_stats['active_count'] or 0
+        idle_count += mouse_stats['idle_count'] or 0
+        if last_active is None:
+            last_active = mouse_stats['last_active']
+        
+        # Get recent activity events
+        if len(recent_activity) < 50:
+            cursor.execute('''
+                SELECT timestamp, event_type, hostname, data, process_name, process_path, title, url
+                FROM events_view
+                WHERE host_id = ?
+                AND datetime(timestamp) > datetime('now', '-{} hours')
+                AND datetime(timestamp) <= COALESCE(?, datetime(timestamp))
+                ORDER BY timestamp DESC
+                LIMIT ?
+            '''.format(hours), (host_id, older, 50 - len(recent_activity)))
             
-        recent_activity.append(activity_item)
+            for row in cursor.fetchall():
+                recent_activity.append(
+                    tail_buffer.entry(row['event_type'], row['timestamp'], event_store.decode_event(row)))
+    
+    # Per-day totals from the materialized summaries
+    daily = daily_summary.day_summaries(cursor, host_id, *daily_summary.day_range(days))
     
     conn.close()
     
     return jsonify({
         'hostname': device['hostname'],
         'platform': device['platform'],
-        'last_active': mouse_stats['last_active'],
-        'mouse_active_count': mouse_stats['active_count'] or 0,
-        'mouse_idle_count': mouse_stats['idle_count'] or 0,
-        'recent_activity': recent_activity
+        'last_active': last_active,
+        'mouse_active_count': active_count,
+        'mouse_idle_count': idle_count,
+        'recent_activity': recent_activity,
+        'daily': daily
+    })
+
+@app.route('/api/stream', methods=['GET'])
+def stream_events():
+    """text/event-stream of new tail buffer entries: 'event: events' with a JSON list (?hostname= filter)
+
+    Served from memory only. async_server.py answers this route itself
+    (with raw events) before it reaches the Flask app.
+    """
+    if tail is None:
+        return jsonify({'error': 'Live stream disabled (start with --tail-events > 0)'}), 503
+    hostname = request.args.get('hostname')
+    buffer = tail
+    
+    def generate():
+        seq = buffer.seq
+        written = time.monotonic()
+        STREAM_CLIENTS.inc()
+        try:
+            while True:
+                # Wakes on every batch; batches of other hosts only count towards the keepalive
+                seq, items = buffer.wait(seq, hostname, SSE_KEEPALIVE)
+                if items:
+                    yield f'event: events\ndata: {json.dumps(items)}\n\n'
+                elif time.monotonic() - written >= SSE_KEEPALIVE:
+                    yield ': keepalive\n\n'
+                else:
+                    continue
+                written = time.monotonic()
+        finally:
+            STREAM_CLIENTS.dec()
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+@app.route('/api/dashboard/report', methods=['GET'])
+def get_dashboard_report():
+    """Per-device totals over the last `days` UTC days, read from daily_summaries"""
+    days = int(request.args.get('days', 30))
+    hostname = request.args.get('hostname')
+    first_day, last_day = daily_summary.day_range(days)
+    
+    devices = []
+    usage = {'app': {}, 'domain': {}, 'category': {}}
+    for conn, shard_interner in shard_dbs(hostname):
+        cursor = conn.cursor()
+        
+        where = ' WHERE s.day BETWEEN ? AND ?'
+        params = [first_day, last_day]
+        host_id = None
+        if hostname:
+            host_id = event_store.host_id_for(cursor, shard_interner, hostname)
+            where += ' AND s.host_id = ?'
+            params.append(host_id)
+        
+        # Open days are completed with each host's open session, as in the device view
+        live, live_usage = daily_summary.open_sessions(cursor, host_id)
+        open_days = daily_summary.open_day_totals(cursor, host_id, first_day, last_day, live)
+        
+        # Days not finalized yet get their idle time from first/last activity
+        cursor.execute('''
+            SELECT s.host_id, h.value AS hostname,
+                   COUNT(*) AS days_active,
+                   MIN(s.first_activity) AS first_activity,
+                   MAX(s.last_activity) AS last_activity,
+                   SUM(s.active_seconds) AS active_seconds,
+                   SUM(s.afk_seconds) AS afk_seconds,
+                   SUM(COALESCE(s.idle_seconds, MAX(0, strftime('%s', s.last_activity)
+                       - strftime('%s', s.first_activity) - s.active_seconds - s.afk_seconds))) AS idle_seconds,
+                   SUM(s.key_count) AS key_count,
+                   SUM(s.event_count) AS event_count,
+                   SUM(s.sessions) AS sessions
+            FROM daily_summaries s
+            JOIN hosts h ON h.id = s.host_id
+        ''' + where + ' GROUP BY s.host_id ORDER BY hostname', params)
+        for row in cursor.fetchall():
+            device = dict(row)
+            device_host = device.pop('host_id')
+            extra = open_days.get(device_host, (0.0, 0.0, 0.0))
+            for field, added in zip(('active_seconds', 'afk_seconds', 'idle_seconds'), extra):
+                device[field] = round((device[field] or 0) + added, 1)
+            device['top_apps'] = daily_summary.ranked(daily_summary.usage_totals(
+                cursor, device_host, first_day, last_day, 'app', live_usage), limit=5)
+            devices.append(device)
+        
+        # Fleet-wide (or the one host's) app, domain and category totals
+        for kind, totals in usage.items():
+            for name, seconds in daily_summary.usage_totals(
+                    cursor, host_id, first_day, last_day, kind, live_usage).items():
+                totals[name] = totals.get(name, 0) + seconds
+        
+        conn.close()
+    
+    devices.sort(key=lambda d: d['hostname'])
+    return jsonify({
+        'first_day': first_day,
+        'last_day': last_day,
+        'devices': devices,
+        'top_apps': daily_summary.ranked(usage['app']),
+        'top_domains': daily_summary.ranked(usage['domain']),
+        'top_categories': daily_summary.ranked(usage['category']),
+    })
+
+@app.route('/api/dashboard/agent_health', methods=['GET'])
+def get_agent_health():
+    """Agent self-telemetry per host: bucketed series, latest sample and per-version averages"""
+    hours = int(request.args.get('hours', 24))
+    hostname = request.args.get('hostname')
+    # Aim for ~120 points per host whatever the range
+    bucket_minutes = max(1, hours * 60 // 120)
+    start_time = (datetime.utcnow() - timedelta(hours=hours)).isoformat()
+    
+    series = {}
+    latest = []
+    # Sums and counts per agent build, averaged after the shards are merged
+    version_totals = {}
+    for conn, shard_interner in shard_dbs(hostname):
+        cursor = conn.cursor()
+        
+        where = ' WHERE a.timestamp > ?'
+        params = [start_time]
+        if hostname:
+            where += ' AND a.host_id = ?'
+            params.append(event_store.host_id_for(cursor, shard_interner, hostname))
+        
+        cursor.execute('''
+            SELECT h.value AS hostname,
+                   datetime(CAST(strftime('%s', a.timestamp) AS INTEGER) / ? * ?, 'unixepoch') AS bucket,
+                   AVG(a.cpu_percent) AS cpu_percent,
+                   MAX(a.rss_bytes) AS rss_bytes,
+                   MAX(a.queue_depth) AS queue_depth,
+                   MAX(a.spool_bytes) AS spool_bytes,
+                   SUM(a.batches_sent) AS batches_sent,
+                   SUM(a.batches_failed) AS batches_failed,
+                   AVG(a.uia_share) AS uia_share,
+                   AVG(a.input_rate) AS input_rate
+            FROM agent_health a
+            JOIN hosts h ON h.id = a.host_id
+        ''' + where + '''
+            GROUP BY a.host_id, bucket
+            ORDER BY hostname, bucket
+        ''', [bucket_minutes * 60, bucket_minutes * 60] + params)
+        for row in cursor.fetchall():
+            sample = dict(row)
+            series.setdefault(sample.pop('hostname'), []).append(sample)
+        
+        # Latest sample per host
+        cursor.execute('''
+            SELECT h.value AS hostname, a.*
+            FROM agent_health a
+            JOIN (SELECT host_id, MAX(timestamp) AS ts FROM agent_health a''' + where + ''' GROUP BY host_id) m
+                ON m.host_id = a.host_id AND m.ts = a.timestamp
+            JOIN hosts h ON h.id = a.host_id
+            ORDER BY hostname
+        ''', params)
+        for row in cursor.fetchall():
+            sample = dict(row)
+            sample.pop('id')
+            sample.pop('host_id')
+            latest.append(sample)
+        
+        # Averages per agent build, so a regressing version stands out across the fleet
+        cursor.execute('''
+            SELECT a.agent_version,
+                   COUNT(DISTINCT a.host_id) AS hosts,
+                   SUM(a.cpu_percent) AS cpu_percent, COUNT(a.cpu_percent) AS cpu_percent_n,
+                   SUM(a.rss_bytes) AS rss_bytes, COUNT(a.rss_bytes) AS rss_bytes_n,
+                   SUM(a.uia_share) AS uia_share, COUNT(a.uia_share) AS uia_share_n,
+                   SUM(a.batches_failed) AS batches_failed
+            FROM agent_health a
+        ''' + where + ' GROUP BY a.agent_version', params)
+        for row in cursor.fetchall():
+            totals = version_totals.setdefault(row['agent_version'], dict.fromkeys(row.keys()[1:]))
+            for key in row.keys()[1:]:
+                if row[key] is not None:
+                    totals[key] = (totals[key] or 0) + row[key]
+        
+        conn.close()
+    
+    latest.sort(key=lambda sample: sample['hostname'])
+    versions = []
+    for version in sorted(version_totals, key=lambda v: (v is not None, v)):
+        totals = version_totals[version]
+        entry = {'agent_version': version, 'hosts': totals['hosts']}
+        for key in ('cpu_percent', 'rss_bytes', 'uia_share'):
+            count = totals[key + '_n']
+            entry[key] = totals[key] / count if count else None
+        entry['batches_failed'] = totals['batches_failed']
+        versions.append(entry)
+    
+    return jsonify({
+        'bucket_minutes': bucket_minutes,
+        'series': series,
+        'latest': latest,
+        'versions': versions,
     })
 
 # System Tray functionality
@@ -779,21 +1537,75 @@ def create_tray_icon():
 
 if __name__ == '__main__':
     import argparse
-    
+    import multiprocessing
+
+    multiprocessing.freeze_support()
+
+    # Offline import: python server_tray.py import <files> [--db ...]
+    if len(sys.argv) > 1 and sys.argv[1] == 'import':
+        import bulk_import
+        sys.exit(bulk_import.main(sys.argv[2:]))
+
     parser = argparse.ArgumentParser(description='Activity Logger Server')
     parser.add_argument('--host', default='0.0.0.0', help='Host to bind to')
     parser.add_argument('--port', type=int, default=5000, help='Port to bind to')
     parser.add_argument('--auth-key', help='Authentication key')
     parser.add_argument('--license-key', help='License key')
+    parser.add_argument('--profile-queries', action='store_true',
+                        help='Time every SQLite statement (see /debug/queries)')
+    parser.add_argument('--slow-query-ms', type=float, default=None,
+                        help='Log statements slower than this with their query plan (default 100)')
+    parser.add_argument('--production', action='store_true',
+                        help='Headless multi-process mode: gunicorn workers plus one writer process (Linux)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes for --production (default CPUs + 1, max 8)')
+    parser.add_argument('--threads', type=int, default=8, help='Threads per worker for --production')
+    parser.add_argument('--shards', type=int, default=1,
+                        help='Split storage by hostname across N databases, one writer thread each')
+    alerts.add_arguments(parser)
+    tail_buffer.add_arguments(parser)
     
     args = parser.parse_args()
+    try:
+        alert_options = alerts.options_from_args(args)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    if args.production:
+        # Configure the importable module (not __main__) so forked workers share the same app
+        import production
+        import server_tray
+        server = server_tray
+    else:
+        server = sys.modules[__name__]
     
     if args.auth_key:
-        app.config['AUTH_KEY'] = args.auth_key
+        server.app.config['AUTH_KEY'] = args.auth_key
     if args.license_key:
-        app.config['LICENSE_KEY'] = args.license_key
+        server.app.config['LICENSE_KEY'] = args.license_key
         # Set session start when license provided
-        app.config['SESSION_START'] = datetime.now()
+        server.app.config['SESSION_START'] = datetime.now()
+    if args.profile_queries:
+        server.app.config['PROFILE_QUERIES'] = True
+    if args.slow_query_ms is not None:
+        server.profiler.slow_ms = args.slow_query_ms
+    if args.shards > 1:
+        if args.production:
+            print("--shards is not supported with --production (its writer process owns one database)")
+            sys.exit(1)
+        import shards
+        server.shard_set = shards.ShardSet(server.app.config['DATABASE'], args.shards)
+        server.shard_set.init_db()
+        server.shard_set.start()
+        server.writer_client = server.shard_set
+    
+    if args.production:
+        production.run(server, host=args.host, port=args.port, workers=args.workers, threads=args.threads,
+                       alert_options=alert_options)
+        sys.exit(0)
+    if alert_options:
+        server.start_alerts(alert_options)
+    server.tail = tail_buffer.from_args(args)
     
     # Run in system tray mode
     tray_app = ServerTrayApp(host=args.host, port=args.port)
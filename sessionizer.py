@@ -0,0 +1,251 @@
+"""
+sessionizer.py
+
+Focus sessions computed incrementally at ingest, for every agent type.
+
+Each host has at most one open session (the app/domain in the foreground
+since its last foreground_change), kept in open_sessions so that every
+writer (request threads, the writer process, shards, bulk_import.py) and
+restarts continue from the same state. A session is closed and written to
+`sessions` when:
+
+    - a foreground_change / domain_visit to another app or domain arrives
+      (ends at that event),
+    - the user was AFK longer than AFK_SPLIT (ends where AFK began; the same
+      app starts a new session when the user is back), or
+    - the host sent nothing for SESSION_TIMEOUT (ends at its last event).
+
+Shorter AFK periods (afk_start/afk_end from the tray agent, mouse_idle/
+mouse_active from the other agents) are subtracted from active_seconds.
+
+Tray agents in aggregate mode send one activity_minute record per minute
+instead (activity_logger_tray.ActivityAggregator). Its `transitions` are
+the focus and AFK events that can change a session, as
+[offset seconds, event_type, fields], and are replayed here in order, so
+the sessions match those of the raw events. The minute's agent_health
+sample, if any, rides along as `health` (record_health()).
+
+Session times are UTC 'YYYY-MM-DD HH:MM:SS', the format of SQLite's
+datetime(), so reports can compare them with datetime('now', ...) and stay
+on the (start, ...) covering indexes.
+
+Events older than the host's open session are not re-sessionized.
+"""
+from datetime import datetime, timezone
+
+import domains
+# Shared with the tray agent; re-exported for the rest of the server
+from activity_common import AFK_END_TYPES, AFK_START_TYPES, MINUTE_TYPE, SESSION_TIMEOUT, epoch  # noqa: F401
+
+# AFK periods longer than this split the session instead of being subtracted
+AFK_SPLIT = 5 * 60
+
+FOCUS_TYPES = ('foreground_change', 'domain_visit')
+
+STATE_COLUMNS = ('app', 'domain', 'start', 'last_seen', 'afk_since', 'afk_seconds')
+
+
+def create_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY,
+            host_id INTEGER NOT NULL,
+            app TEXT,
+            domain TEXT,
+            start TEXT NOT NULL,
+            end TEXT NOT NULL,
+            active_seconds REAL NOT NULL
+        )
+    ''')
+    # Covering indexes: per-app sums over a time range never touch the table
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_start ON sessions(start, app, active_seconds)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_host_start '
+                   'ON sessions(host_id, start, app, active_seconds)')
+    # Times are epoch seconds here; converted when a session is written
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS open_sessions (
+            host_id INTEGER PRIMARY KEY,
+            app TEXT,
+            domain TEXT,
+            start REAL,
+            last_seen REAL,
+            afk_since REAL,
+            afk_seconds REAL NOT NULL DEFAULT 0
+        )
+    ''')
+
+
+def sql_time(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def transitions(at, event):
+    """[(epoch, event_type, fields), ...] replayed from an activity_minute record at epoch `at`
+
+    Malformed entries are skipped: the record comes straight from the agent.
+    """
+    replayed = []
+    for transition in event.get('transitions') or ():
+        if not isinstance(transition, (list, tuple)) or len(transition) != 3:
+            continue
+        offset, event_type, fields = transition
+        if isinstance(offset, (int, float)) and isinstance(event_type, str) and isinstance(fields, dict):
+            replayed.append((at + offset, event_type, fields))
+    return replayed
+
+
+def record_health(timestamp, event):
+    """(timestamp, agent_health sample) folded into an activity_minute record; None if it has none"""
+    health = event.get('health') if event else None
+    if not isinstance(health, dict):
+        return None
+    return health.get('timestamp') or timestamp, health
+
+
+def record_end(at, event):
+    """Epoch of the last event folded into an activity_minute record (`at` for other events)"""
+    last = event.get('last_event') if event else None
+    return at + last if isinstance(last, (int, float)) and last > 0 else at
+
+
+class HostSessions:
+    """Open-session state machine for one host"""
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.app = state.get('app')
+        self.domain = state.get('domain')
+        self.start = state.get('start')
+        self.last_seen = state.get('last_seen')
+        self.afk_since = state.get('afk_since')
+        self.afk_seconds = state.get('afk_seconds') or 0.0
+        self.closed = []
+        # AFK periods that split a session: (start, end)
+        self.away = []
+        self.loaded_boundary = self.boundary()
+
+    def boundary(self):
+        """Start of the open session, or the last event if none is open"""
+        return self.start if self.start is not None else self.last_seen
+
+    def state(self):
+        return tuple(getattr(self, name) for name in STATE_COLUMNS)
+
+    def close(self, end):
+        if self.start is not None and (self.app or self.domain) and end > self.start:
+            afk = self.afk_seconds
+            if self.afk_since is not None and end > self.afk_since:
+                afk += end - max(self.afk_since, self.start)
+            active = max(0.0, end - self.start - afk)
+            self.closed.append((self.app, self.domain, self.start, end, active))
+        self.start = None
+        self.afk_seconds = 0.0
+
+    def open(self, at, app, domain):
+        self.app = app
+        self.domain = domain
+        self.start = at
+        self.afk_seconds = 0.0
+        if self.afk_since is not None:
+            # Still AFK (focus moved without input); the AFK counts from here
+            self.afk_since = at
+
+    def feed(self, at, event_type, event):
+        if event_type == MINUTE_TYPE:
+            for replayed in transitions(at, event):
+                self.feed(*replayed)
+            # Moves last_seen to the record's last event
+            self.feed(record_end(at, event), None, {})
+            return
+        if self.start is not None and at < self.start:
+            return
+        if self.last_seen is not None and at - self.last_seen > SESSION_TIMEOUT:
+            # Host went quiet: end at its last event, resume the same focus now
+            self.close(self.last_seen)
+            self.afk_since = None
+            if self.app or self.domain:
+                self.open(at, self.app, self.domain)
+        if self.last_seen is None or at > self.last_seen:
+            self.last_seen = at
+
+        if event_type in FOCUS_TYPES:
+            app, domain = event.get('process_name'), domains.url_domain(event.get('url'))
+            # A title change within the same app/domain continues the session
+            if self.start is None or (app, domain) != (self.app, self.domain):
+                self.close(at)
+                self.open(at, app, domain)
+        elif event_type in AFK_START_TYPES:
+            if self.afk_since is None:
+                idle = event.get('idle_seconds') or 0
+                began = at - idle if isinstance(idle, (int, float)) else at
+                self.afk_since = max(began, self.start) if self.start is not None else began
+        elif event_type in AFK_END_TYPES and self.afk_since is not None:
+            back = epoch(event.get('end_time')) or at
+            if self.start is not None and back - self.afk_since > AFK_SPLIT:
+                away = self.afk_since
+                self.afk_since = None
+                self.close(away)
+                self.away.append((away, back))
+                self.open(back, self.app, self.domain)
+            else:
+                if self.start is not None:
+                    self.afk_seconds += max(0.0, back - max(self.afk_since, self.start))
+                self.afk_since = None
+
+
+def update_sessions(cursor, rows):
+    """Advance per-host sessions with [(host_id, timestamp, event_type, event), ...] and write closed ones
+
+    Returns {host_id: HostSessions} for the hosts in rows, for daily_summary.py.
+    """
+    by_host = {}
+    for host_id, timestamp, event_type, event in rows:
+        at = epoch(timestamp)
+        if host_id is not None and at is not None:
+            by_host.setdefault(host_id, []).append((at, event_type, event))
+    if not by_host:
+        return {}
+
+    hosts = list(by_host)
+    states = {}
+    for i in range(0, len(hosts), 500):
+        chunk = hosts[i:i + 500]
+        marks = ', '.join('?' * len(chunk))
+        for row in cursor.execute(f'SELECT host_id, {", ".join(STATE_COLUMNS)} FROM open_sessions '
+                                  f'WHERE host_id IN ({marks})', chunk):
+            states[row[0]] = dict(zip(STATE_COLUMNS, row[1:]))
+
+    closed = []
+    updated = []
+    fed = {}
+    for host_id, events in by_host.items():
+        host = fed[host_id] = HostSessions(states.get(host_id))
+        events.sort(key=lambda item: item[0])
+        for at, event_type, event in events:
+            host.feed(at, event_type, event)
+        closed.extend((host_id, app, domain, sql_time(start), sql_time(end), active)
+                      for app, domain, start, end, active in host.closed)
+        updated.append((host_id, *host.state()))
+
+    if closed:
+        cursor.executemany('INSERT INTO sessions (host_id, app, domain, start, end, active_seconds) '
+                           'VALUES (?, ?, ?, ?, ?, ?)', closed)
+    cursor.executemany(f'INSERT OR REPLACE INTO open_sessions (host_id, {", ".join(STATE_COLUMNS)}) '
+                       f'VALUES (?, ?, ?, ?, ?, ?, ?)', updated)
+    return fed
+
+
+def open_session_rows(cursor, host_id=None):
+    """In-progress sessions as (host_id, app, domain, start, end, active_seconds), ending at the last event"""
+    query = f'SELECT host_id, {", ".join(STATE_COLUMNS)} FROM open_sessions WHERE start IS NOT NULL'
+    params = ()
+    if host_id is not None:
+        query += ' AND host_id = ?'
+        params = (host_id,)
+    rows = []
+    for row in cursor.execute(query, params):
+        host = HostSessions(dict(zip(STATE_COLUMNS, row[1:])))
+        host.close(host.last_seen)
+        for app, domain, start, end, active in host.closed:
+            rows.append((row[0], app, domain, sql_time(start), sql_time(end), active))
+    return rows
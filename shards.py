@@ -0,0 +1,249 @@
+"""
+shards.py
+
+Optional hostname-sharded storage for the server.
+
+With N shards, each host's events, device row, rollups, agent_health samples
+and block list live in one of N SQLite files, picked by a stable hash of the
+hostname. Each shard has its own writer thread (a write_coordinator group
+commit), so writes for different hosts commit in parallel instead of queueing
+behind one database lock and one fsync.
+
+Queries for one host open only that host's shard; fleet-wide queries run on
+every shard and server_tray merges the results.
+
+A batch that spans shards is committed per shard, so one failing shard does
+not roll back the others. Agents resend the whole batch on an error.
+
+Shard files sit next to the main database as <stem>.shard-<i>-of-<n>.db. To
+change N, copy into a fresh set and then restart with the new count:
+
+    python shards.py rebalance --db activity_logs.db --from 1 --to 4
+
+--to 1 merges the shards back into the main database file.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+
+import event_store
+import write_coordinator
+
+REBALANCE_BATCH = 5000
+# Non-event tables copied as-is on rebalance (events, rollups and agent_health are rebuilt by store_events)
+COPIED_TABLES = {
+    'devices': ('hostname', 'platform', 'python_version', 'cpu_count', 'memory_total', 'last_seen', 'mac_addresses'),
+    'blocked_sites': ('hostname', 'domain', 'created_at', 'updated_at'),
+}
+
+
+def shard_index(hostname, count):
+    """Stable across processes and restarts (unlike hash())"""
+    return zlib.crc32((hostname or 'unknown').encode('utf-8')) % count
+
+
+def shard_paths(db_path, count):
+    """Shard files for db_path; one shard means the plain database itself"""
+    if count <= 1:
+        return [db_path]
+    stem, ext = os.path.splitext(db_path)
+    return [f'{stem}.shard-{i}-of-{count}{ext or ".db"}' for i in range(count)]
+
+
+class ShardSet:
+    """N shard databases, each with its own writer thread
+
+    Has the write_coordinator.WriterClient interface (store_events, stats),
+    so it plugs in as server_tray.writer_client.
+    """
+
+    def __init__(self, db_path, count):
+        self.count = count
+        self.paths = shard_paths(db_path, count)
+        self.coordinators = [write_coordinator.WriteCoordinator(path, None, None) for path in self.paths]
+        # Read-side host id lookups, one cache per file since ids differ between shards
+        self.interners = [event_store.StringInterner() for _ in self.paths]
+        self.threads = []
+
+    def init_db(self):
+        for path in self.paths:
+            event_store.init_db(path)
+
+    def start(self):
+        for index, coordinator in enumerate(self.coordinators):
+            thread = threading.Thread(target=coordinator.write_loop, name=f'shard-writer-{index}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def shard_for(self, hostname):
+        return shard_index(hostname, self.count)
+
+    def store_events(self, events):
+        """Store a batch; returns [(event_type, timestamp, hostname), ...] in input order"""
+        groups = {}
+        for position, event in enumerate(events):
+            hostname = event_store.normalize_event(event)[2]
+            groups.setdefault(self.shard_for(hostname), []).append(position)
+        pending = []
+        for index, positions in groups.items():
+            item = {'events': [events[p] for p in positions], 'done': threading.Event(), 'result': None}
+            self.coordinators[index].pending.put(item)
+            pending.append((positions, item))
+        stored = [None] * len(events)
+        errors = []
+        for positions, item in pending:
+            item['done'].wait()
+            status, result = item['result']
+            if status != 'ok':
+                errors.append(result)
+                continue
+            for position, info in zip(positions, result):
+                stored[position] = info
+        if errors:
+            raise RuntimeError('; '.join(errors))
+        return stored
+
+    def stats(self):
+        totals = {'commits': 0, 'batches': 0, 'events': 0, 'errors': 0, 'commit_seconds': 0.0, 'queue_depth': 0}
+        for coordinator in self.coordinators:
+            for key, value in coordinator.stats.items():
+                totals[key] += value
+            totals['queue_depth'] += coordinator.pending.qsize()
+        return totals
+
+
+def copy_shard(source, targets, count, interners):
+    """Re-store one source database's rows into the target shard cursors"""
+    conn = sqlite3.connect(source)
+    conn.row_factory = sqlite3.Row
+    copied = 0
+    last_id = 0
+    while True:
+        rows = conn.execute('''
+            SELECT id, timestamp, event_type, data, hostname, process_name, process_path, title, url
+            FROM events_view WHERE id > ? ORDER BY id LIMIT ?
+        ''', (last_id, REBALANCE_BATCH)).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1]['id']
+        batches = {}
+        for row in rows:
+            event = event_store.decode_event(row)
+            batches.setdefault(shard_index(event.get('hostname'), count), []).append(event)
+        for index, batch in batches.items():
+            event_store.store_events(targets[index], batch, interners[index])
+        copied += len(rows)
+    for table, columns in COPIED_TABLES.items():
+        names = ', '.join(columns)
+        marks = ', '.join('?' * len(columns))
+        for row in conn.execute(f'SELECT {names} FROM {table}'):
+            targets[shard_index(row['hostname'], count)].execute(
+                f'INSERT OR REPLACE INTO {table} ({names}) VALUES ({marks})', tuple(row))
+    conn.close()
+    return copied
+
+
+def sqlite_files(path):
+    """The database file and the WAL/shared-memory files SQLite keeps beside it"""
+    return [path, path + '-wal', path + '-shm']
+
+
+def rebalance(db_path, old_count, new_count):
+    """Copy every shard of the old layout into a fresh new_count layout; the old files are left in place
+
+    Merging back to one database (new_count 1) builds <stem>.merging<ext>
+    and then moves it to db_path. A main database already there (what was
+    left of the unsharded data, not read while sharded) is kept as
+    <db_path>.before-merge.
+    """
+    if old_count == new_count:
+        raise ValueError(f"Already {new_count} shard(s); nothing to rebalance")
+    sources = shard_paths(db_path, old_count)
+    missing = [path for path in sources if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError(f"Missing shard files: {', '.join(missing)}")
+    final = shard_paths(db_path, new_count)
+    if new_count == 1:
+        stem, ext = os.path.splitext(db_path)
+        destinations = [f'{stem}.merging{ext or ".db"}']
+        kept = db_path + '.before-merge'
+        existing = [path for path in sqlite_files(kept) + sqlite_files(destinations[0]) if os.path.exists(path)]
+    else:
+        destinations = final
+        existing = [path for path in destinations if os.path.exists(path)]
+    if existing:
+        raise FileExistsError(f"Target files already exist: {', '.join(existing)}")
+
+    connections = []
+    for path in destinations:
+        event_store.init_db(path)
+        conn = sqlite3.connect(path)
+        conn.execute('PRAGMA synchronous = OFF')
+        connections.append(conn)
+    targets = [conn.cursor() for conn in connections]
+    interners = [event_store.StringInterner() for _ in destinations]
+    start = time.perf_counter()
+    total = 0
+    for source in sources:
+        # Brings older databases up to the current schema first
+        event_store.init_db(source)
+        copied = copy_shard(source, targets, new_count, interners)
+        total += copied
+        print(f"  {source}: {copied:,} events")
+    for conn in connections:
+        conn.commit()
+        conn.close()
+    if new_count == 1:
+        # The WAL and shared-memory files move with their database so neither is paired with the other file
+        for old, new in zip(sqlite_files(db_path), sqlite_files(kept)):
+            if os.path.exists(old):
+                os.replace(old, new)
+        if os.path.exists(kept):
+            print(f"  previous {db_path} kept as {kept}")
+        os.replace(destinations[0], db_path)
+    print(f"Copied {total:,} events into {new_count} shard(s) in {time.perf_counter() - start:.1f}s")
+    return final
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Hostname-sharded storage tools')
+    sub = parser.add_subparsers(dest='command', required=True)
+    move = sub.add_parser('rebalance', help='Copy data into a different number of shards')
+    move.add_argument('--db', default='activity_logs.db', help='Main database path (shards sit next to it)')
+    move.add_argument('--from', dest='old', type=int, required=True, help='Current shard count (1 = unsharded)')
+    move.add_argument('--to', dest='new', type=int, required=True, help='New shard count')
+    info = sub.add_parser('info', help='Events and hosts per shard')
+    info.add_argument('--db', default='activity_logs.db')
+    info.add_argument('--shards', type=int, required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == 'rebalance':
+        try:
+            paths = rebalance(args.db, args.old, args.new)
+        except (ValueError, FileNotFoundError, FileExistsError) as e:
+            print(e)
+            return 1
+        print("New shard files:")
+        for path in paths:
+            print(f"  {path}")
+        print(f"Restart the server with --shards {args.new}; the old files can be removed afterwards.")
+        return 0
+
+    for path in shard_paths(args.db, args.shards):
+        if not os.path.exists(path):
+            print(f"  {path}: missing")
+            continue
+        conn = sqlite3.connect(path)
+        events = conn.execute('SELECT COUNT(*) FROM events').fetchone()[0]
+        hosts = conn.execute('SELECT COUNT(*) FROM hosts').fetchone()[0]
+        conn.close()
+        print(f"  {path}: {events:,} events, {hosts:,} hosts, {os.path.getsize(path) / 1e6:.1f} MB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
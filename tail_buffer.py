@@ -0,0 +1,215 @@
+"""
+tail_buffer.py
+
+The latest events of each host, kept in memory by the ingesting server so
+the per-device live view (recent feed, mouse activity counters, SSE
+updates) does not query SQLite for what was just written.
+
+Each host has a bounded deque of trimmed entries (entry(): type,
+timestamp, process name, the URL of domain visits, keystrokes of key
+counts).
+Two limits apply: `per_host` entries per host, and `max_bytes` (estimated)
+for all hosts together; past the memory cap the oldest entries of the
+whole fleet go first.
+
+Coverage is tracked per host as a whole UTC second: every event of the
+host stored by this process with a later second is in the buffer. It
+starts at the time the buffer was created and moves up to the second of
+each evicted entry, so a reader takes the newer part of a time range from
+the buffer and only the older part, up to covered_until(), from disk.
+Events at or before that second are not kept at all, so a bulk backfill of
+history does not push the live entries out.
+
+Events stored by other processes (a separate writer, other gunicorn
+workers) never reach the buffer, so it is only enabled where the server
+sees every ingest request (server_tray.py, async_server.py).
+"""
+import threading
+import time
+from collections import deque
+
+import sessionizer
+
+DEFAULT_PER_HOST = 1000
+DEFAULT_MEMORY_MB = 64
+# Rough per-entry cost: the dict, its keys and the deque slot
+ENTRY_OVERHEAD = 400
+KEYSTROKE_SIZE = 100
+
+
+def entry(event_type, timestamp, event):
+    """Activity item for an event, as the device view lists it"""
+    item = {'timestamp': timestamp, 'type': event_type}
+    if event_type == 'domain_visit':
+        item['url'] = event.get('url', 'Unknown')
+        item['process_name'] = event.get('process_name', '')
+    elif event_type == 'key_count':
+        item['keystrokes'] = event.get('keystrokes', [])
+    if 'process_name' in event:
+        item['process_name'] = event['process_name']
+    return item
+
+
+def entry_size(item):
+    size = ENTRY_OVERHEAD + len(item['timestamp']) + len(item['type'])
+    for key in ('url', 'process_name'):
+        if isinstance(item.get(key), str):
+            size += len(item[key])
+    keystrokes = item.get('keystrokes')
+    if isinstance(keystrokes, (list, tuple)):
+        size += KEYSTROKE_SIZE * len(keystrokes)
+    return size
+
+
+class HostTail:
+    __slots__ = ('entries', 'covered')
+
+    def __init__(self, covered):
+        # (seq, epoch second, epoch, item, size)
+        self.entries = deque()
+        self.covered = covered
+
+
+class TailBuffer:
+    """Thread-safe per-host tails with a global sequence number for SSE readers"""
+
+    def __init__(self, per_host=DEFAULT_PER_HOST, max_bytes=DEFAULT_MEMORY_MB * 1024 * 1024):
+        self.per_host = per_host
+        self.max_bytes = max_bytes
+        self.started = int(time.time())
+        self.hosts = {}
+        # (seq, hostname) in arrival order, for evicting the fleet's oldest entries
+        self.order = deque()
+        self.bytes = 0
+        self.count = 0
+        self.seq = 0
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+
+    def __len__(self):
+        return self.count
+
+    def add(self, events):
+        """Append a stored batch of raw events"""
+        with self.lock:
+            for event in events:
+                if not isinstance(event, dict):
+                    continue
+                event_type, timestamp = event.get('type', 'unknown'), event.get('timestamp')
+                hostname = event.get('hostname')
+                if not isinstance(hostname, str) or not hostname:
+                    hostname = 'unknown'
+                at = sessionizer.epoch(timestamp)
+                if at is None:
+                    continue
+                host = self.hosts.get(hostname)
+                # Readers take these from disk anyway (bulk backfills are mostly this)
+                if int(at) <= (host.covered if host is not None else self.started):
+                    continue
+                if host is None:
+                    host = self.hosts[hostname] = HostTail(self.started)
+                item = entry(event_type, timestamp, event)
+                size = entry_size(item)
+                self.seq += 1
+                host.entries.append((self.seq, int(at), at, item, size))
+                self.order.append((self.seq, hostname))
+                self.bytes += size
+                self.count += 1
+                if len(host.entries) > self.per_host:
+                    self._evict(host)
+            while self.bytes > self.max_bytes and self.order:
+                seq, hostname = self.order.popleft()
+                host = self.hosts.get(hostname)
+                # Entries already dropped by the per-host limit leave stale order slots
+                if host is not None and host.entries and host.entries[0][0] == seq:
+                    self._evict(host)
+            if len(self.order) > 2 * max(self.count, 1):
+                self._compact_order()
+            self.changed.notify_all()
+
+    def _evict(self, host):
+        _, second, _, _, size = host.entries.popleft()
+        self.bytes -= size
+        self.count -= 1
+        host.covered = max(host.covered, second)
+
+    def _compact_order(self):
+        live = {seq for host in self.hosts.values() for seq, *_ in host.entries}
+        self.order = deque(slot for slot in self.order if slot[0] in live)
+
+    def covered_until(self, hostname):
+        """Epoch second after which every event of the host is in the buffer"""
+        with self.lock:
+            host = self.hosts.get(hostname)
+            return host.covered if host is not None else self.started
+
+    def recent(self, hostname, since=None, limit=50):
+        """(covered_until, items newer than both it and `since` (epoch), newest first, at most `limit`)"""
+        with self.lock:
+            host = self.hosts.get(hostname)
+            if host is None:
+                return self.started, []
+            floor = host.covered if since is None else max(host.covered, int(since))
+            matches = [(at, item) for _, second, at, item, _ in host.entries if second > floor]
+            matches.sort(key=lambda match: match[0], reverse=True)
+            return host.covered, [item for _, item in matches[:limit]]
+
+    def mouse_counts(self, hostname, since=None):
+        """(covered_until, mouse_active count, mouse_idle count, latest mouse_active timestamp) after it"""
+        active = idle = 0
+        last_active = None
+        last_at = None
+        with self.lock:
+            host = self.hosts.get(hostname)
+            if host is None:
+                return self.started, 0, 0, None
+            floor = host.covered if since is None else max(host.covered, int(since))
+            for _, second, at, item, _ in host.entries:
+                if second <= floor:
+                    continue
+                if item['type'] == 'mouse_active':
+                    active += 1
+                    if last_at is None or at > last_at:
+                        last_at, last_active = at, item['timestamp']
+                elif item['type'] == 'mouse_idle':
+                    idle += 1
+            return host.covered, active, idle, last_active
+
+    def wait(self, after, hostname=None, timeout=15.0):
+        """(seq, items added after `after` for the host or all hosts); blocks up to timeout for new ones"""
+        with self.lock:
+            if self.seq == after:
+                self.changed.wait(timeout)
+            if after > self.seq:
+                after = self.seq
+            if hostname is None:
+                hosts = self.hosts.items()
+            else:
+                hosts = [(hostname, self.hosts[hostname])] if hostname in self.hosts else []
+            items = []
+            for name, host in hosts:
+                for seq, _, _, item, _ in reversed(host.entries):
+                    if seq <= after:
+                        break
+                    items.append((seq, item if hostname else dict(item, hostname=name)))
+            items.sort(key=lambda pair: pair[0])
+            return self.seq, [item for _, item in items]
+
+    def stats(self):
+        with self.lock:
+            return {'hosts': len(self.hosts), 'entries': self.count,
+                    'bytes': self.bytes, 'per_host': self.per_host, 'max_bytes': self.max_bytes}
+
+
+def add_arguments(parser):
+    parser.add_argument('--tail-events', type=int, default=DEFAULT_PER_HOST,
+                        help='Recent events kept in memory per host for the live device view (0 disables)')
+    parser.add_argument('--tail-memory-mb', type=float, default=DEFAULT_MEMORY_MB,
+                        help='Memory cap for those events across all hosts, in MB')
+
+
+def from_args(args):
+    """TailBuffer for the parsed options; None when disabled"""
+    if args.tail_events <= 0 or args.tail_memory_mb <= 0:
+        return None
+    return TailBuffer(args.tail_events, int(args.tail_memory_mb * 1024 * 1024))
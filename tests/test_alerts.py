@@ -0,0 +1,123 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import alerts
+
+T0 = 1790841600.0  # 2026-10-01 08:00:00 UTC
+
+
+class Clock:
+    def __init__(self):
+        self.now = T0
+
+    def __call__(self):
+        return self.now
+
+
+class ListSink:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, alert):
+        self.sent.append(alert)
+
+
+class FailingSink:
+    def send(self, alert):
+        raise OSError('unreachable')
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(alerts.time, 'time', clock)
+    return clock
+
+
+def stamp(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat()
+
+
+def fire(engine):
+    with engine.condition:
+        due = engine.due()
+    for alert in due:
+        engine.deliver(alert)
+    return [(alert['kind'], alert['hostname']) for alert in due]
+
+
+def test_offline_fires_once_per_episode(clock):
+    engine = alerts.AlertEngine([ListSink()], offline_minutes=10)
+    engine.observe([{'type': 'key_count', 'hostname': 'h1', 'timestamp': stamp(T0)}])
+    clock.now = T0 + 9 * 60
+    assert fire(engine) == []
+    clock.now = T0 + 10 * 60
+    assert fire(engine) == [('offline', 'h1')]
+    clock.now = T0 + 30 * 60
+    assert fire(engine) == []
+    engine.observe([{'type': 'key_count', 'hostname': 'h1'}])
+    clock.now = T0 + 40 * 60
+    assert fire(engine) == [('offline', 'h1')]
+    assert engine.fired['offline'] == 2
+
+
+def test_new_events_move_the_offline_deadline(clock):
+    engine = alerts.AlertEngine([], offline_minutes=10)
+    engine.observe([{'type': 'key_count', 'hostname': 'h1'}])
+    clock.now = T0 + 8 * 60
+    engine.observe([{'type': 'key_count', 'hostname': 'h1'}])
+    clock.now = T0 + 12 * 60
+    assert fire(engine) == []
+    clock.now = T0 + 18 * 60
+    assert fire(engine) == [('offline', 'h1')]
+
+
+def test_idle_counts_from_idle_seconds_and_ends_on_activity(clock):
+    engine = alerts.AlertEngine([], offline_minutes=600, idle_minutes=5)
+    engine.observe([{'type': 'mouse_idle', 'hostname': 'h1', 'timestamp': stamp(T0), 'idle_seconds': 120}])
+    clock.now = T0 + 3 * 60
+    assert fire(engine) == [('idle', 'h1')]
+
+    engine.observe([{'type': 'mouse_idle', 'hostname': 'h2', 'timestamp': stamp(T0 + 3 * 60)}])
+    engine.observe([{'type': 'mouse_active', 'hostname': 'h2', 'timestamp': stamp(T0 + 4 * 60)}])
+    clock.now = T0 + 20 * 60
+    assert fire(engine) == []
+
+
+def test_afk_from_activity_minute_transitions(clock):
+    engine = alerts.AlertEngine([], offline_minutes=600, afk_minutes=5)
+    # The record is sent once its minute is over
+    clock.now = T0 + 60
+    engine.observe([{'type': 'activity_minute', 'hostname': 'h1', 'timestamp': stamp(T0),
+                     'transitions': [[30, 'afk_start', {}], 'malformed']}])
+    clock.now = T0 + 5 * 60 + 29
+    assert fire(engine) == []
+    clock.now = T0 + 5 * 60 + 30
+    assert fire(engine) == [('afk', 'h1')]
+
+
+def test_non_string_hostnames_are_unknown(clock):
+    engine = alerts.AlertEngine([], offline_minutes=1)
+    engine.observe([{'type': 'key_count', 'hostname': 5}])
+    clock.now = T0 + 60
+    assert fire(engine) == [('offline', 'unknown')]
+
+
+def test_delivery_failures_are_counted(clock):
+    sink = ListSink()
+    engine = alerts.AlertEngine([FailingSink(), sink], offline_minutes=1)
+    engine.observe([{'type': 'key_count', 'hostname': 'h1'}])
+    clock.now = T0 + 60
+    fire(engine)
+    assert engine.failed == 1
+    assert [alert['message'] for alert in sink.sent] == ['h1 has sent nothing for 1 minutes']
+
+
+def test_parse_sink():
+    assert isinstance(alerts.parse_sink('log:alerts.jsonl'), alerts.LogSink)
+    assert isinstance(alerts.parse_sink('webhook:http://localhost/alerts'), alerts.WebhookSink)
+    with pytest.raises(ValueError):
+        alerts.parse_sink('smtp:localhost:1025')
+    with pytest.raises(ValueError):
+        alerts.parse_sink('pager:123')
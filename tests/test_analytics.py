@@ -0,0 +1,62 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import analytics  # noqa: E402
+import domains  # noqa: E402
+import event_store  # noqa: E402
+
+
+def event(minute, event_type, hostname, **fields):
+    timestamp = f'2026-10-01T{8 + minute // 60:02d}:{minute % 60:02d}:00+00:00'
+    return dict(fields, type=event_type, hostname=hostname, timestamp=timestamp)
+
+
+EVENTS = [
+    event(0, 'foreground_change', 'h1', process_name='chrome.exe', url='https://github.com/org/repo'),
+    event(10, 'mouse_idle', 'h1', idle_seconds=0),
+    event(12, 'mouse_active', 'h1'),
+    event(20, 'foreground_change', 'h1', process_name='Code.exe'),
+    event(50, 'foreground_change', 'h1', process_name='chrome.exe', url='youtube.com/watch'),
+    event(60, 'key_count', 'h1'),
+    event(0, 'foreground_change', 'h2', process_name='slack.exe'),
+    event(15, 'key_count', 'h2'),
+]
+
+
+@pytest.fixture
+def metrics(conn):
+    event_store.store_events(conn.cursor(), [dict(e) for e in EVENTS], event_store.StringInterner())
+    conn.commit()
+    events = analytics.load_window([conn], '2026-10-01', '2026-10-02')
+    return {host['hostname']: host for host in analytics.host_metrics(events, categories=domains.name_category)}
+
+
+def test_host_metrics(metrics):
+    h1 = metrics['h1']
+    assert h1['events'] == 6
+    assert h1['present_seconds'] == 3600
+    assert h1['afk_seconds'] == 120
+    assert h1['active_seconds'] == 3480
+    assert h1['focus_switches'] == 2
+    assert h1['top_apps'] == [['Code.exe', 1800.0], ['chrome.exe', 1680.0]]
+    assert h1['top_domains'] == [['github.com', 1080.0], ['youtube.com', 600.0]]
+    assert h1['categories'] == {'work': round(2880 / 3480, 4), 'video': round(600 / 3480, 4)}
+    assert metrics['h2']['top_apps'] == [['slack.exe', 900.0]]
+
+
+def test_active_seconds_match_the_sessions_table(conn, metrics):
+    cursor = conn.cursor()
+    names = dict(cursor.execute('SELECT id, value FROM hosts').fetchall())
+    totals = {}
+    for host_id, seconds in cursor.execute('SELECT host_id, active_seconds FROM sessions').fetchall():
+        totals[names[host_id]] = totals.get(names[host_id], 0.0) + seconds
+    for row in analytics.sessionizer.open_session_rows(cursor):
+        totals[names[row[0]]] = totals.get(names[row[0]], 0.0) + row[5]
+    assert {hostname: host['active_seconds'] for hostname, host in metrics.items()} == pytest.approx(totals)
+
+
+def test_merge_intervals():
+    starts, ends = analytics.merge_intervals(np.array([5.0, 0.0, 2.0, 20.0]), np.array([8.0, 3.0, 6.0, 21.0]))
+    assert starts.tolist() == [0.0, 20.0]
+    assert ends.tolist() == [8.0, 21.0]
@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+import domains
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('https://user:pw@www.Example.com:8443/path?q=1#top', 'example.com'),
+    ('www.com', 'www.com'),
+    ('[::1]:5000', '::1'),
+    ('', None),
+    (None, None),
+])
+def test_normalize_domain(value, expected):
+    assert domains.normalize_domain(value) == expected
+
+
+def test_normalize_domain_can_keep_www():
+    assert domains.normalize_domain('www.example.com', strip_www=False) == 'www.example.com'
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('https://mail.google.com/mail/u/0', 'mail.google.com'),
+    ('facebook.com/reel/123', 'facebook.com'),
+    ('localhost:5000/dashboard', 'localhost'),
+    ('localhost', 'localhost'),
+    ('127.0.0.1:8000', '127.0.0.1'),
+    ('intranet:8080', 'intranet'),
+    ('about:blank', None),
+    ('chrome://settings', None),
+    ('file:///C:/Users/me/report.pdf', None),
+    ('C:\\Users\\me\\report.pdf', None),
+    ('mailto:someone@example.com', None),
+    ('/relative/path', None),
+    ('how to cook rice', None),
+    ('weather', None),
+])
+def test_url_domain(url, expected):
+    assert domains.url_domain(url) == expected
+
+
+def test_registrable_domain():
+    assert domains.registrable_domain('mail.google.com') == 'google.com'
+    assert domains.registrable_domain('news.bbc.co.uk') == 'bbc.co.uk'
+    assert domains.registrable_domain('me.github.io') == 'me.github.io'
+    assert domains.registrable_domain('10.0.0.12') == '10.0.0.12'
+
+
+def test_matcher_longest_domain_rule_wins():
+    matcher = domains.CategoryMatcher({'other': ['google.com'], 'work': ['docs.google.com']})
+    assert matcher.domain_category('docs.google.com') == 'work'
+    assert matcher.domain_category('a.docs.google.com') == 'work'
+    assert matcher.domain_category('maps.google.com') == 'other'
+    assert matcher.domain_category('notgoogle.com') is None
+
+
+def test_matcher_processes_and_dotless_patterns():
+    matcher = domains.CategoryMatcher({'work': ['Code.exe', 'slack', 'intranet']})
+    assert matcher.process_category('code.EXE') == 'work'
+    assert matcher.process_category('slack.exe') == 'work'
+    assert matcher.domain_category('intranet') == 'work'
+    assert matcher.domain_category('code.exe') is None
+
+
+def test_matcher_domain_wins_over_browser_app():
+    matcher = domains.CategoryMatcher({'work': ['chrome.exe'], 'video': ['youtube.com']})
+    assert matcher.categorize('chrome.exe', 'https://www.youtube.com/watch?v=1') == 'video'
+    assert matcher.categorize('chrome.exe', 'about:blank') == 'work'
+
+
+def test_later_rules_move_a_pattern():
+    matcher = domains.CategoryMatcher({'social': ['reddit.com']})
+    matcher.update({'work': ['reddit.com']})
+    assert matcher.domain_category('old.reddit.com') == 'work'
+
+
+def test_load_matcher_adds_rules_file(tmp_path):
+    path = tmp_path / 'categories.json'
+    path.write_text(json.dumps({'work': ['youtube.com'], 'games': ['steam.exe']}), encoding='utf-8')
+    matcher = domains.load_matcher(str(path))
+    assert matcher.domain_category('youtube.com') == 'work'
+    assert matcher.process_category('steam.exe') == 'games'
+    assert matcher.domain_category('github.com') == 'work'
+
+
+def test_name_category():
+    assert domains.name_category('Code.exe') == 'work'
+    assert domains.name_category('youtube.com') == 'video'
+    assert domains.session_category('chrome.exe', 'reddit.com') == 'social'
+    assert domains.name_category(None) is None
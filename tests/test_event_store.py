@@ -0,0 +1,83 @@
+import json
+import sqlite3
+import threading
+
+import event_store
+
+
+def stored_events(conn):
+    return [event_store.decode_event(row) for row in conn.execute('SELECT * FROM events_view ORDER BY id')]
+
+
+def test_payload_round_trip_packs_keystrokes_and_compresses():
+    keystrokes = [{'key': 'a', 'timestamp': f'2026-10-01T08:00:{i % 60:02d}.{i:06d}+00:00'} for i in range(400)]
+    payload = {'keystrokes': keystrokes, 'count': 400}
+    data = event_store.encode_payload(payload)
+    assert isinstance(data, bytes)
+    assert event_store.decode_payload(data) == payload
+
+
+def test_payload_keeps_keystrokes_that_do_not_round_trip():
+    payload = {'keystrokes': [{'key': 'a', 'timestamp': '2026-10-01 08:00:00'}]}
+    assert event_store.decode_payload(event_store.encode_payload(payload)) == payload
+
+
+def test_store_and_decode_events(conn):
+    events = [
+        {'type': 'foreground_change', 'timestamp': '2026-10-01T08:00:00+00:00', 'hostname': 'h1',
+         'process_name': 'chrome.exe', 'title': 'Inbox', 'url': 'mail.google.com/mail/u/0', 'pid': 42},
+        {'type': 'mouse_idle', 'timestamp': '2026-10-01T08:05:00+00:00', 'hostname': 'h1', 'idle_seconds': 60},
+    ]
+    stored = event_store.store_events(conn.cursor(), [dict(event) for event in events], event_store.StringInterner())
+    conn.commit()
+    assert stored == [(event['type'], event['timestamp'], 'h1') for event in events]
+    assert stored_events(conn) == events
+
+
+def test_non_string_hostname_is_stored_as_unknown(conn):
+    stored = event_store.store_events(conn.cursor(), [{'type': 'x', 'timestamp': '2026-10-01T08:00:00+00:00',
+                                                       'hostname': 5}], event_store.StringInterner())
+    conn.commit()
+    assert stored[0][2] == 'unknown'
+    assert conn.execute('SELECT COUNT(*) FROM events WHERE host_id IS NULL').fetchone()[0] == 0
+
+
+def test_migrate_legacy_rows(conn):
+    event = {'type': 'domain_visit', 'timestamp': '2026-10-01T08:00:00+00:00', 'url': 'github.com', 'extra': 1}
+    conn.execute('INSERT INTO events (timestamp, event_type, hostname, data) VALUES (?, ?, ?, ?)',
+                 (event['timestamp'], event['type'], 'h1', json.dumps(event)))
+    conn.commit()
+    assert event_store.migrate_legacy_rows(conn, event_store.StringInterner()) == 1
+    assert stored_events(conn) == [dict(event, hostname='h1')]
+
+
+def test_init_db_migrates_rows_without_a_hostname(db_path, conn):
+    # A payload that still names no usable hostname once re-encoded
+    _, payload = event_store.split_event({'type': 'x', 'hostname': 5})
+    conn.executemany('INSERT INTO events (timestamp, event_type, data) VALUES (?, ?, ?)',
+                     [('2026-10-01T08:00:00+00:00', 'x', payload), ('2026-10-01T08:00:01+00:00', 'x', 'null')])
+    conn.commit()
+    worker = threading.Thread(target=event_store.init_db, args=(db_path,), daemon=True)
+    worker.start()
+    worker.join(30)
+    assert not worker.is_alive(), 'init_db did not finish migrating'
+    assert [event['hostname'] for event in stored_events(conn)] == ['unknown', 'unknown']
+
+
+def test_interned_ids_are_shared_only_after_commit(db_path):
+    interner = event_store.StringInterner()
+    writer = sqlite3.connect(db_path)
+    string_id = interner.intern(writer.cursor(), 'title', 'draft')
+    assert interner.cache['title'] == {}
+    writer.rollback()
+    interner.rollback(writer)
+    assert interner.pending == {}
+
+    string_id = interner.intern(writer.cursor(), 'title', 'draft')
+    writer.commit()
+    interner.commit(writer)
+    assert interner.cache['title'] == {'draft': string_id}
+    reader = sqlite3.connect(db_path)
+    assert interner.lookup(reader.cursor(), 'title', 'draft') == string_id
+    reader.close()
+    writer.close()
@@ -0,0 +1,78 @@
+import sessionizer
+
+T0 = 1790841600.0  # 2026-10-01 08:00:00 UTC
+
+
+def focus(at, app, url=None):
+    return (T0 + at, 'foreground_change', {'process_name': app, 'url': url})
+
+
+def feed(events):
+    host = sessionizer.HostSessions()
+    for at, event_type, event in events:
+        host.feed(at, event_type, event)
+    return host
+
+
+def sessions(host):
+    return [(app, domain, start - T0, end - T0, active) for app, domain, start, end, active in host.closed]
+
+
+def test_switch_closes_session_and_short_afk_is_subtracted():
+    host = feed([
+        focus(0, 'chrome.exe', 'https://www.github.com/org/repo'),
+        (T0 + 60, 'afk_start', {}),
+        (T0 + 120, 'afk_end', {}),
+        focus(200, 'Code.exe'),
+    ])
+    assert sessions(host) == [('chrome.exe', 'github.com', 0, 200, 140)]
+    assert (host.app, host.start) == ('Code.exe', T0 + 200)
+
+
+def test_title_change_in_same_app_continues_session():
+    host = feed([focus(0, 'Code.exe'), focus(30, 'Code.exe'), focus(90, 'slack.exe')])
+    assert sessions(host) == [('Code.exe', None, 0, 90, 90)]
+
+
+def test_long_afk_splits_session():
+    host = feed([
+        focus(0, 'Code.exe'),
+        (T0 + 100, 'mouse_idle', {'idle_seconds': 40}),
+        (T0 + 60 + sessionizer.AFK_SPLIT + 100, 'mouse_active', {}),
+        focus(1000, 'slack.exe'),
+    ])
+    back = 60 + sessionizer.AFK_SPLIT + 100
+    assert sessions(host) == [('Code.exe', None, 0, 60, 60), ('Code.exe', None, back, 1000, 1000 - back)]
+
+
+def test_quiet_host_ends_session_at_last_event():
+    quiet = sessionizer.SESSION_TIMEOUT + 1
+    host = feed([focus(0, 'Code.exe'), (T0 + 50, 'key_count', {}), (T0 + 50 + quiet, 'key_count', {})])
+    assert sessions(host) == [('Code.exe', None, 0, 50, 50)]
+    assert host.start == T0 + 50 + quiet
+
+
+def test_activity_minute_replays_like_raw_events():
+    raw = [focus(0, 'chrome.exe', 'youtube.com/watch'), (T0 + 10, 'afk_start', {}),
+           (T0 + 25, 'afk_end', {}), focus(40, 'Code.exe'), focus(59, 'slack.exe')]
+    minute = {'transitions': [[at - T0, event_type, fields] for at, event_type, fields in raw], 'last_event': 59}
+    aggregated = feed([(T0, sessionizer.MINUTE_TYPE, minute)])
+    assert sessions(aggregated) == sessions(feed(raw))
+    assert aggregated.state() == feed(raw).state()
+
+
+def test_update_sessions_continues_across_batches(conn):
+    timestamps = ['2026-10-01T08:00:00+00:00', '2026-10-01T08:02:00+00:00', '2026-10-01T08:05:00+00:00']
+    rows = [(1, timestamp, 'foreground_change', {'process_name': app})
+            for timestamp, app in zip(timestamps, ('Code.exe', 'slack.exe', 'Code.exe'))]
+    cursor = conn.cursor()
+    sessionizer.update_sessions(cursor, rows[:2])
+    sessionizer.update_sessions(cursor, rows[2:])
+    assert [tuple(row) for row in cursor.execute('SELECT app, start, end, active_seconds FROM sessions')] == [
+        ('Code.exe', '2026-10-01 08:00:00', '2026-10-01 08:02:00', 120.0),
+        ('slack.exe', '2026-10-01 08:02:00', '2026-10-01 08:05:00', 180.0),
+    ]
+    assert sessionizer.open_session_rows(cursor) == []
+    sessionizer.update_sessions(cursor, [(1, '2026-10-01T08:06:00+00:00', 'key_count', {})])
+    assert sessionizer.open_session_rows(cursor) == [
+        (1, 'Code.exe', None, '2026-10-01 08:05:00', '2026-10-01 08:06:00', 60.0)]
@@ -0,0 +1,87 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import tail_buffer
+
+
+def stamp(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat()
+
+
+@pytest.fixture
+def tail():
+    buffer = tail_buffer.TailBuffer(per_host=3)
+    buffer.started = 1000
+    return buffer
+
+
+def test_keeps_events_after_the_covered_second(tail):
+    tail.add([{'type': 'mouse_active', 'hostname': 'h1', 'timestamp': stamp(1001 + i)} for i in range(2)])
+    tail.add([{'type': 'mouse_idle', 'hostname': 'h1', 'timestamp': stamp(1003)}])
+    covered, items = tail.recent('h1')
+    assert covered == 1000
+    assert [item['timestamp'] for item in items] == [stamp(1003), stamp(1002), stamp(1001)]
+    assert tail.mouse_counts('h1') == (1000, 2, 1, stamp(1002))
+
+
+def test_eviction_moves_coverage_up(tail):
+    tail.add([{'type': 'key_count', 'hostname': 'h1', 'timestamp': stamp(1001 + i)} for i in range(5)])
+    covered, items = tail.recent('h1')
+    assert covered == 1002
+    assert len(items) == 3
+    assert tail.recent('h1', since=1004) == (1002, [items[0]])
+
+
+def test_events_at_or_before_coverage_are_skipped(tail):
+    tail.add([{'type': 'key_count', 'hostname': 'h1', 'timestamp': stamp(900)},
+              {'type': 'key_count', 'hostname': 'h1', 'timestamp': stamp(1000)},
+              {'type': 'key_count', 'hostname': 'h1', 'timestamp': 'not a time'}])
+    assert len(tail) == 0
+    assert tail.covered_until('h1') == 1000
+
+
+def test_memory_cap_evicts_the_fleets_oldest_entries():
+    tail = tail_buffer.TailBuffer(per_host=100, max_bytes=3 * tail_buffer.ENTRY_OVERHEAD + 200)
+    tail.started = 1000
+    tail.add([{'type': 'key_count', 'hostname': f'h{i}', 'timestamp': stamp(1001 + i)} for i in range(5)])
+    assert len(tail) == 3
+    assert tail.covered_until('h0') == 1001
+    assert tail.recent('h0') == (1001, [])
+    assert len(tail.recent('h4')[1]) == 1
+
+
+def test_wait_returns_items_after_a_sequence(tail):
+    tail.add([{'type': 'key_count', 'hostname': 'h1', 'timestamp': stamp(1001)}])
+    seq, _ = tail.wait(0, timeout=0)
+    tail.add([{'type': 'key_count', 'hostname': 'h2', 'timestamp': stamp(1002)}])
+    later, items = tail.wait(seq, timeout=0)
+    assert later == seq + 1
+    assert items == [{'timestamp': stamp(1002), 'type': 'key_count', 'keystrokes': [], 'hostname': 'h2'}]
+    assert tail.wait(seq, hostname='h1', timeout=0) == (later, [])
+
+
+def test_device_view_includes_bulk_ingested_events(db_path, monkeypatch):
+    import server_tray
+    monkeypatch.setitem(server_tray.app.config, 'DATABASE', db_path)
+    monkeypatch.setitem(server_tray.app.config, 'LICENSE_KEY', 'spiegoishugo')
+    monkeypatch.setattr(server_tray, 'tail', tail_buffer.TailBuffer())
+    client = server_tray.app.test_client()
+    headers = {'Authorization': f"Bearer {server_tray.app.config['AUTH_KEY']}"}
+    now = datetime.now(timezone.utc)
+
+    def at(seconds):
+        return (now + timedelta(seconds=seconds)).isoformat()
+
+    metadata = {'type': 'metadata', 'hostname': 'h1', 'timestamp': at(0), 'platform': 'test'}
+    assert client.post('/api/events', json={'events': [metadata]}, headers=headers).status_code == 200
+    backfill = [{'type': 'mouse_active', 'hostname': 'h1', 'timestamp': at(-600 + i)} for i in range(3)]
+    backfill += [{'type': 'mouse_active', 'hostname': 'h1', 'timestamp': at(2 + i)} for i in range(2)]
+    body = '\n'.join(json.dumps(event) for event in backfill)
+    response = client.post('/api/events/bulk', data=body, headers=headers)
+    assert response.json['stored'] == 5
+
+    view = client.get('/api/dashboard/device_activity?hostname=h1&hours=1').json
+    assert view['mouse_active_count'] == 5
+    assert view['last_active'] == at(3)
@@ -0,0 +1,121 @@
+"""
+text_search.py
+
+Full-text search over window titles, URLs and process names.
+
+Events store these strings interned (titles, urls, process_names tables), so
+the index covers each distinct string once rather than every event: an FTS5
+table `string_search` with one row per distinct string, filled by triggers
+on the dictionary tables, so every writer (ingest, bulk_import.py, legacy
+migration, shard rebalance) keeps it current. Matching strings are then
+mapped to events through the (title_id, timestamp) / (url_id, timestamp) /
+process_name_id indexes.
+
+The trigram tokenizer (SQLite 3.34+) makes any substring of 3+ characters
+searchable, case-insensitively. Older SQLite builds get a word/prefix
+index instead, and builds without FTS5 fall back to LIKE over the
+dictionary tables.
+"""
+import html
+
+# field -> dictionary table (see event_store.INTERNED_FIELDS)
+SEARCH_FIELDS = {
+    'process_name': 'process_names',
+    'title': 'titles',
+    'url': 'urls',
+}
+# Matching strings mapped to events per query; ranked best first
+MAX_STRINGS = 1000
+TRIGRAM_MIN = 3
+SNIPPET_TOKENS = 64
+
+
+def create_index(cursor):
+    """Create the FTS table and triggers; fills it from the dictionary tables when new"""
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'string_search'").fetchone()
+    if not exists:
+        for tokenizer in ('trigram', 'unicode61'):
+            try:
+                cursor.execute(f'''
+                    CREATE VIRTUAL TABLE string_search USING fts5(
+                        value, field UNINDEXED, string_id UNINDEXED, tokenize='{tokenizer}'
+                    )
+                ''')
+                break
+            except Exception:
+                continue
+        else:
+            # No FTS5 in this SQLite build: search() uses LIKE over the dictionary tables
+            return
+    for field, table in SEARCH_FIELDS.items():
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS search_{table} AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO string_search (value, field, string_id) VALUES (new.value, '{field}', new.id);
+            END
+        ''')
+        if not exists:
+            cursor.execute(f'''
+                INSERT INTO string_search (value, field, string_id) SELECT value, '{field}', id FROM {table}
+            ''')
+
+
+def index_mode(cursor):
+    """'trigram', 'unicode61' or None (no index)"""
+    row = cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'string_search'").fetchone()
+    if row is None:
+        return None
+    return 'trigram' if 'trigram' in row[0] else 'unicode61'
+
+
+def quote(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def highlight(value, query):
+    """<mark> around the first case-insensitive occurrence (LIKE fallback snippets)"""
+    position = value.lower().find(query.lower())
+    if position < 0:
+        return value
+    end = position + len(query)
+    return f'{value[:position]}<mark>{value[position:end]}</mark>{value[end:]}'
+
+
+def search_strings(cursor, query, limit=MAX_STRINGS):
+    """Strings matching query, best first: [(field, string_id, value, snippet, score), ...]
+
+    Snippets mark matches with <mark></mark>; the rest of the text is not escaped.
+    """
+    query = query.strip()
+    if not query:
+        return []
+    mode = index_mode(cursor)
+    match = None
+    if mode == 'trigram' and len(query) >= TRIGRAM_MIN:
+        match = quote(query)
+    elif mode == 'unicode61':
+        match = ' '.join(quote(term) + '*' for term in query.split())
+    if match is not None:
+        # bm25() is lower for better matches; flip it so higher scores rank first
+        return [(field, string_id, value, snippet, round(-score, 3)) for field, string_id, value, snippet, score
+                in cursor.execute(f'''
+                    SELECT field, string_id, value,
+                           snippet(string_search, 0, '<mark>', '</mark>', '…', {SNIPPET_TOKENS}),
+                           bm25(string_search)
+                    FROM string_search WHERE string_search MATCH ?
+                    ORDER BY rank LIMIT ?
+                ''', (match, limit))]
+
+    # Too short for trigrams, or no FTS5: scan the (distinct) strings
+    pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    results = []
+    for field, table in SEARCH_FIELDS.items():
+        for string_id, value in cursor.execute(
+                f"SELECT id, value FROM {table} WHERE value LIKE ? ESCAPE '\\' LIMIT ?", (pattern, limit)):
+            results.append((field, string_id, value, highlight(value, query), 0.0))
+    return results[:limit]
+
+
+def escape_snippet(snippet):
+    """HTML-escape a snippet but keep its <mark> tags"""
+    return html.escape(snippet).replace('&lt;mark&gt;', '<mark>').replace('&lt;/mark&gt;', '</mark>')
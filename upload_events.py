@@ -0,0 +1,150 @@
+"""
+upload_events.py
+
+Uploads JSONL activity logs (activity_logger.py output, activity_log_fallback.jsonl,
+test_activity.jsonl) to the server's streaming /api/events/bulk endpoint.
+
+Files are streamed in chunks (chunked transfer encoding, optionally gzip),
+so memory use stays flat no matter how large the file is.
+
+Usage:
+    python upload_events.py activity_log_fallback.jsonl --config config.ini
+    python upload_events.py activity_log_1760000000.jsonl --hostname WitBlits --gzip
+"""
+import argparse
+import configparser
+import gzip
+import os
+import sys
+import time
+import uuid
+import zlib
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+CHUNK_SIZE = 256 * 1024
+
+
+def build_bulk_url(config):
+    host = config.get('Server', 'host', fallback='127.0.0.1')
+    port = config.getint('Server', 'port', fallback=5000)
+    use_ssl = config.getboolean('Server', 'use_ssl', fallback=False)
+    scheme = 'https' if use_ssl else 'http'
+    return f"{scheme}://{host}:{port}/api/events/bulk"
+
+
+def open_log(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+class UploadProgress:
+    def __init__(self, total_bytes):
+        self.total = total_bytes
+        self.read = 0
+        self.started = time.time()
+        self.last_print = 0
+
+    def update(self, n):
+        self.read += n
+        now = time.time()
+        if now - self.last_print >= 1.0:
+            self.last_print = now
+            self.print()
+
+    def print(self, end='\r'):
+        elapsed = max(time.time() - self.started, 1e-6)
+        # .gz inputs are counted after decompression, so cap at 100%
+        pct = min(100.0 * self.read / self.total, 100.0) if self.total else 100.0
+        rate = self.read / elapsed / 1e6
+        print(f"  {self.read / 1e6:,.1f} / {self.total / 1e6:,.1f} MB ({pct:.0f}%) {rate:.1f} MB/s", end=end, flush=True)
+
+
+def iter_body(paths, progress, compress):
+    """Yield the request body: all files concatenated as NDJSON, optionally gzip-compressed"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16) if compress else None
+    for path in paths:
+        with open_log(path) as f:
+            last = b'\n'
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                progress.update(len(chunk))
+                last = chunk[-1:]
+                yield compressor.compress(chunk) if compressor else chunk
+            # Make sure the next file starts on a new line
+            if last != b'\n':
+                yield compressor.compress(b'\n') if compressor else b'\n'
+    if compressor:
+        yield compressor.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload JSONL activity logs to the server (bulk ingest)")
+    parser.add_argument('files', nargs='+', help='JSONL files to upload (.gz accepted)')
+    parser.add_argument('--config', '-c', default='config.ini', help='Path to config file')
+    parser.add_argument('--url', help='Bulk endpoint URL (default: built from config.ini)')
+    parser.add_argument('--auth-key', help='Authentication key (default: from config.ini)')
+    parser.add_argument('--hostname', help='Hostname for events that carry none (activity_logger.py output)')
+    parser.add_argument('--gzip', action='store_true', help='Compress the upload')
+    parser.add_argument('--job', help='Job id for progress polling (default: random)')
+    args = parser.parse_args()
+
+    if requests is None:
+        print("Missing dependency: requests")
+        print("Install with: python -m pip install requests")
+        sys.exit(1)
+
+    config = configparser.ConfigParser()
+    if os.path.exists(args.config):
+        config.read(args.config)
+    url = args.url or build_bulk_url(config)
+    auth_key = args.auth_key or config.get('Security', 'auth_key', fallback='')
+    if not auth_key:
+        print("Error: no auth key (use --auth-key or set [Security] auth_key in config.ini)")
+        sys.exit(1)
+
+    for path in args.files:
+        if not os.path.exists(path):
+            print(f"File not found: {path}")
+            sys.exit(1)
+
+    job_id = args.job or uuid.uuid4().hex
+    params = {'job': job_id}
+    if args.hostname:
+        params['hostname'] = args.hostname
+    headers = {'Authorization': f'Bearer {auth_key}', 'Content-Type': 'application/x-ndjson'}
+    if args.gzip:
+        headers['Content-Encoding'] = 'gzip'
+
+    progress = UploadProgress(sum(os.path.getsize(p) for p in args.files))
+    print(f"Uploading {len(args.files)} file(s) to {url} (job {job_id})")
+    try:
+        resp = requests.post(url, params=params, headers=headers, data=iter_body(args.files, progress, args.gzip))
+    except Exception as e:
+        print()
+        print(f"Upload failed: {e}")
+        sys.exit(1)
+    progress.print(end='\n')
+
+    try:
+        result = resp.json()
+    except ValueError:
+        result = {'error': resp.text}
+    if resp.status_code != 200:
+        print(f"Server returned {resp.status_code}: {result.get('error', result)}")
+        sys.exit(1)
+
+    elapsed = max(time.time() - progress.started, 1e-6)
+    print(f"Stored {result.get('stored', 0):,} events "
+          f"({result.get('invalid', 0):,} invalid lines) in {elapsed:.1f}s "
+          f"- {result.get('stored', 0) / elapsed:,.0f} events/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""
+write_coordinator.py
+
+Single-writer process for multi-process server deployments.
+
+Web workers parse requests and hand event batches to one writer process over
+a local socket (multiprocessing.connection: Unix socket on Linux, named pipe
+on Windows). The writer owns the only SQLite write connection and commits
+whatever has queued up since the last commit as one transaction (group
+commit), so workers never contend for the write lock. Each batch runs in its
+own SAVEPOINT, so one bad batch fails alone without aborting the group.
+
+The database is switched to WAL so readers in the workers are not blocked by
+the writer.
+"""
+import os
+import queue
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+import alerts
+import event_store
+
+# Upper bound on events committed in one transaction
+GROUP_MAX_EVENTS = 20000
+# PRAGMA synchronous for the write connection; NORMAL in WAL mode only fsyncs at checkpoints
+SYNCHRONOUS = 'NORMAL'
+CONNECT_TIMEOUT = 30.0
+
+
+def default_address():
+    name = f'spiego-writer-{os.getpid()}'
+    if sys.platform == 'win32':
+        return rf'\\.\pipe\{name}'
+    return os.path.join(tempfile.gettempdir(), name + '.sock')
+
+
+class WriteCoordinator:
+    def __init__(self, db_path, address, authkey):
+        self.db_path = db_path
+        self.address = address
+        self.authkey = authkey
+        self.pending = queue.Queue()
+        self.interner = event_store.StringInterner()
+        self.cursor = None
+        self.stats = {'commits': 0, 'batches': 0, 'events': 0, 'errors': 0, 'commit_seconds': 0.0}
+        # Called with each committed batch's events after its caller is released (alert engine)
+        self.observer = None
+
+    def serve_forever(self):
+        event_store.init_db(self.db_path)
+        if self.address.endswith('.sock') and os.path.exists(self.address):
+            os.remove(self.address)
+        listener = Listener(self.address, authkey=self.authkey)
+        threading.Thread(target=self.write_loop, daemon=True).start()
+        try:
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+
+    def handle(self, conn):
+        """One worker connection: requests are answered in order"""
+        done = threading.Event()
+        try:
+            while True:
+                op, payload = conn.recv()
+                if op == 'stats':
+                    conn.send(('ok', dict(self.stats, queue_depth=self.pending.qsize())))
+                    continue
+                item = {'events': payload, 'done': done, 'result': None}
+                done.clear()
+                self.pending.put(item)
+                done.wait()
+                conn.send(item['result'])
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def open(self):
+        """Open the write connection; call from the thread that will run commit_group()"""
+        db = sqlite3.connect(self.db_path, isolation_level=None, timeout=60)
+        db.execute('PRAGMA journal_mode = WAL')
+        db.execute(f'PRAGMA synchronous = {SYNCHRONOUS}')
+        self.cursor = db.cursor()
+
+    def write_loop(self):
+        self.open()
+        while True:
+            group = [self.pending.get()]
+            size = len(group[0]['events'])
+            # Everything that queued up while the previous commit ran goes into this one
+            while size < GROUP_MAX_EVENTS:
+                try:
+                    item = self.pending.get_nowait()
+                except queue.Empty:
+                    break
+                group.append(item)
+                size += len(item['events'])
+            self.commit_group(group)
+            for item in group:
+                item['done'].set()
+            if self.observer is not None:
+                for item in group:
+                    if item['result'][0] == 'ok':
+                        self.observer(item['events'])
+
+    def commit_group(self, group):
+        """Commit [{'events': [...]}, ...] as one transaction, setting each item's 'result'"""
+        cursor = self.cursor
+        start = time.perf_counter()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            for item in group:
+                cursor.execute('SAVEPOINT batch')
+                try:
+                    stored = event_store.store_events(cursor, item['events'], self.interner)
+                    for event, (event_type, timestamp, hostname) in zip(item['events'], stored):
+                        if event_type == 'metadata':
+                            event_store.upsert_device(cursor, event, hostname, timestamp)
+                    cursor.execute('RELEASE batch')
+                    item['result'] = ('ok', stored)
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO batch')
+                    cursor.execute('RELEASE batch')
+                    # Strings interned in the rolled back savepoint must not be cached
+                    self.interner.rollback(cursor.connection)
+                    item['result'] = ('error', str(e))
+            cursor.execute('COMMIT')
+            self.interner.commit(cursor.connection)
+        except Exception as e:
+            if cursor.connection.in_transaction:
+                cursor.execute('ROLLBACK')
+            self.interner.rollback(cursor.connection)
+            for item in group:
+                item['result'] = ('error', str(e))
+        for item in group:
+            if item['result'][0] == 'ok':
+                self.stats['batches'] += 1
+                self.stats['events'] += len(item['events'])
+            else:
+                self.stats['errors'] += 1
+        self.stats['commits'] += 1
+        self.stats['commit_seconds'] += time.perf_counter() - start
+
+
+def run_writer(db_path, address, authkey, alert_options=None):
+    """multiprocessing.Process target"""
+    coordinator = WriteCoordinator(db_path, address, authkey)
+    if alert_options:
+        # Every worker's batches pass through here, so one engine sees the whole fleet
+        event_store.init_db(db_path)
+        engine = alerts.AlertEngine.from_options(alert_options)
+        conn = sqlite3.connect(db_path)
+        engine.seed(conn.cursor())
+        conn.close()
+        engine.start()
+        coordinator.observer = engine.observe
+    coordinator.serve_forever()
+
+
+class WriterClient:
+    """Used by web workers; one connection per thread, reconnecting on failure"""
+
+    def __init__(self, address, authkey):
+        self.address = address
+        self.authkey = authkey
+        self.local = threading.local()
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            deadline = time.time() + CONNECT_TIMEOUT
+            while True:
+                try:
+                    conn = Client(self.address, authkey=self.authkey)
+                    break
+                except (FileNotFoundError, ConnectionRefusedError):
+                    # Writer process still starting
+                    if time.time() > deadline:
+                        raise
+                    time.sleep(0.1)
+            self.local.conn = conn
+        return conn
+
+    def request(self, op, payload=None):
+        for attempt in range(2):
+            conn = self.connection()
+            try:
+                conn.send((op, payload))
+                status, result = conn.recv()
+                break
+            except (EOFError, OSError):
+                self.local.conn = None
+                if attempt:
+                    raise
+        if status != 'ok':
+            raise RuntimeError(result)
+        return result
+
+    def store_events(self, events):
+        """Store a batch through the writer; returns [(event_type, timestamp, hostname), ...]"""
+        return self.request('store', events)
+
+    def stats(self):
+        return self.request('stats')